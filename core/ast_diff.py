@@ -0,0 +1,293 @@
+"""
+同一个文件两个版本的标准化 AST（`CodeParser` 的输出）之间的结构 diff，给代码评审画图用
+
+`diff_ast(old, new)` 得到一棵合并的树，每个节点的 `diff` 字段是：
+    added / removed  新增、删掉的子树，整棵带上
+    changed          节点本身的源码变了（子节点都配得上、都没变）
+    context          自己没变，子树里有变化，留着当容器
+    unchanged        没变的子树：连续的几棵兄弟折成一个占位节点，不带子节点，
+                     `hidden` 是折掉的节点数
+交给 `DrawIOGenerator(diff=True)` 画，没变的部分不进布局，评审图的大小只跟改动有关
+
+近线性：
+    子树哈希  Merkle 式（kind、name、type、子节点的哈希），和位置无关，倒着扫一遍下标就是自底向上
+    匹配      从上往下，只在已经配上的一对父节点的子节点之间配，每组兄弟建一次字典：
+              1. 按 id：解析器的 id 是 (结构路径, 源码内容) 的哈希，路径没变时 id 一样就是原样没动
+                 （只在两边都是这种 id 时；`--format compact` 的 id 是下标，不能比）
+              2. 按子树哈希：挪了位置，或者前面插了同类同名的兄弟（序号变了，id 跟着变）
+              3. 按 (kind, name) 依次配：同一个声明改了内容，往下接着配
+              4. 按不含自己名字的子树哈希，只配两边夹在同一对已配上的兄弟之间的：
+                 改了名字的声明（`old_name` 是原来的名字）
+              剩下的就是删掉 / 新增
+    没变的子树整棵跳过，不往下走，也不复制
+路径变了、又只改了没有名字的部分（字面量、运算符……）时，子树哈希看不出来，算作没变；
+没有内容 id 的（`--format compact`）只改了没有名字的部分都算作没变
+"""
+
+# sys
+import hashlib
+
+# lib function
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from core.ast_model import NONE, NodeTable
+
+ADDED = "added"
+REMOVED = "removed"
+CHANGED = "changed"
+CONTEXT = "context"
+UNCHANGED = "unchanged"
+
+# 子树哈希只看这些字段（顺序和 `_Tree` 里拆开的一样）
+HASH_FIELDS = ("kind", "name", "type")
+
+
+class _Tree:
+    """一张 `NodeTable` 加上每个节点的子树哈希（含 / 不含自己的名字）、子树大小"""
+
+    def __init__(self, table: NodeTable):
+        self.table = table
+        n = len(table)
+        self.hashes: List[bytes] = [b""] * n
+        self.bodies: List[bytes] = [b""] * n
+        self.sizes: List[int] = [1] * n
+        # id 是内容哈希时才能拿来判断有没有变
+        self.content_ids = table.content_ids()
+        # 直接读字符串列，每个字符串只编码一次；放在 extras 里的（不是字符串的值）另算
+        encoded = [repr(value).encode("utf-8") for value in table.strings]
+        columns = [getattr(table, name) for name in HASH_FIELDS]
+        # 父节点的下标总比子节点小，倒着扫就是自底向上
+        for index in range(n - 1, -1, -1):
+            if index in table.extras:
+                kind, name, node_type = (
+                    repr(table.field(index, field)).encode("utf-8") for field in HASH_FIELDS
+                )
+            else:
+                kind, name, node_type = (
+                    b"None" if column[index] == NONE else encoded[column[index]]
+                    for column in columns
+                )
+            body = hashlib.blake2b(kind + b"\0" + node_type + b"\0", digest_size=16)
+            for child in table.children(index):
+                body.update(self.hashes[child])
+                self.sizes[index] += self.sizes[child]
+            self.bodies[index] = body.digest()
+            self.hashes[index] = hashlib.blake2b(
+                self.bodies[index] + name, digest_size=16
+            ).digest()
+
+    def children(self, index: int) -> List[int]:
+        return list(self.table.children(index) if index != NONE else self.table.roots)
+
+    def key(self, index: int) -> Tuple:
+        return self.table.field(index, "kind"), self.table.field(index, "name")
+
+    def fields(self, index: int) -> Dict:
+        table = self.table
+        return {key: table.field(index, key) for key in table.keys(index) if key != "children"}
+
+
+def _ordinals(tree: _Tree, children: List[int]) -> List[int]:
+    """每个子节点是同组兄弟里第几个同 (kind, name) 的，解析器的结构路径也这么数"""
+    seen: Dict[Tuple, int] = {}
+    ordinals = []
+    for child in children:
+        key = tree.key(child)
+        ordinals.append(seen.get(key, 0))
+        seen[key] = ordinals[-1] + 1
+    return ordinals
+
+
+def _match(
+    old: _Tree, new: _Tree, old_children: List[int], new_children: List[int], same_path: bool
+) -> List[Optional[Tuple[int, bool, bool]]]:
+    """
+    配一组兄弟
+    Args:
+        same_path (bool): 父节点两边的结构路径一样（两边都是内容 id 时，这时 id 可以直接比）
+
+    Returns:
+        List[Optional[Tuple[int, bool, bool]]]: 按新的兄弟排：
+            (配上的旧节点, 子树没变, 路径一样)，新增的是 None
+    """
+    matched: List[Optional[Tuple[int, bool, bool]]] = [None] * len(new_children)
+    by_content = old.content_ids and new.content_ids
+    free_old = set(range(len(old_children)))
+    old_ordinals = _ordinals(old, old_children)
+    new_ordinals = _ordinals(new, new_children)
+
+    def pair(i: int, j: int, unchanged: bool):
+        free_old.discard(i)
+        o, n = old_children[i], new_children[j]
+        path = (
+            same_path
+            and old_ordinals[i] == new_ordinals[j]
+            and old.key(o) == new.key(n)
+        )
+        matched[j] = (o, unchanged, path)
+
+    # 1. id 一样：路径和内容都一样
+    if same_path and by_content:
+        by_id: Dict[object, Deque[int]] = {}
+        for i, o in enumerate(old_children):
+            node_id = old.table.field(o, "id")
+            if node_id is not None:
+                by_id.setdefault(node_id, deque()).append(i)
+        for j, n in enumerate(new_children):
+            candidates = by_id.get(new.table.field(n, "id"))
+            if candidates:
+                pair(candidates.popleft(), j, True)
+
+    # 2. 子树哈希一样：内容一样，位置挪了
+    by_hash: Dict[bytes, Deque[int]] = {}
+    for i in sorted(free_old):
+        by_hash.setdefault(old.hashes[old_children[i]], deque()).append(i)
+    for j, n in enumerate(new_children):
+        if matched[j] is not None:
+            continue
+        candidates = by_hash.get(new.hashes[n])
+        if candidates:
+            i = candidates.popleft()
+            o = old_children[i]
+            path = same_path and old_ordinals[i] == new_ordinals[j]
+            old_id, new_id = old.table.field(o, "id"), new.table.field(n, "id")
+            # 路径一样 id 却不一样：没有名字的部分改了，往下找是哪里
+            pair(i, j, not (by_content and path and old_id != new_id))
+
+    # 3. 同类同名的按先后配
+    by_key: Dict[Tuple, Deque[int]] = {}
+    for i in sorted(free_old):
+        by_key.setdefault(old.key(old_children[i]), deque()).append(i)
+    for j, n in enumerate(new_children):
+        if matched[j] is not None:
+            continue
+        candidates = by_key.get(new.key(n))
+        if candidates:
+            pair(candidates.popleft(), j, False)
+
+    # 4. 除了名字都一样、还在原来的位置上（前一个配上的兄弟是同一个）：改名
+    by_body: Dict[Tuple, Deque[int]] = {}
+    anchor = NONE
+    for i, o in enumerate(old_children):
+        if i in free_old:
+            by_body.setdefault((anchor, old.bodies[o]), deque()).append(i)
+        else:
+            anchor = o
+    anchor = NONE
+    for j, n in enumerate(new_children):
+        if matched[j] is not None:
+            anchor = matched[j][0]
+            continue
+        candidates = by_body.get((anchor, new.bodies[n]))
+        if candidates:
+            pair(candidates.popleft(), j, False)
+    return matched
+
+
+def _merge_order(
+    old_children: List[int], new_children: List[int], matched: List[Optional[Tuple]]
+) -> List[Tuple]:
+    """
+    新旧兄弟合在一起的顺序：按新的排，删掉的插在它原来前面那个节点后面
+    Returns:
+        List[Tuple]: (状态, 旧节点, 新节点, 路径一样)，状态是 None 的要往下配
+    """
+    position = {o: i for i, o in enumerate(old_children)}
+    used = set(entry[0] for entry in matched if entry is not None)
+    removed = [o for o in old_children if o not in used]
+    merged = []
+    r = 0
+    for n, entry in zip(new_children, matched):
+        if entry is None:
+            merged.append((ADDED, NONE, n, False))
+            continue
+        o, unchanged, path = entry
+        while r < len(removed) and position[removed[r]] < position[o]:
+            merged.append((REMOVED, removed[r], NONE, False))
+            r += 1
+        merged.append((UNCHANGED if unchanged else None, o, n, path))
+    merged.extend((REMOVED, o, NONE, False) for o in removed[r:])
+    return merged
+
+
+def diff_ast(old: Dict, new: Dict) -> Dict:
+    """
+    Args:
+        old, new (Dict): 同一个文件两个版本的 `CodeParser.parsingFile` 结果
+
+    Returns:
+        Dict: 同 `parsingFile` 的结构，nodes 是合并的树（见模块说明），
+            metadata 取新版本的，imports / exports / relations 是空的；
+            多一个 `diff`：各状态的节点数（unchanged 是折掉的节点数）
+    """
+    old_tree, new_tree = _Tree(old["nodes"].table), _Tree(new["nodes"].table)
+    out = NodeTable()
+    counts = {ADDED: 0, REMOVED: 0, CHANGED: 0, CONTEXT: 0, UNCHANGED: 0}
+
+    def copy(tree: _Tree, root: int, parent: int, status: str):
+        stack = [(root, parent)]
+        while stack:
+            index, parent = stack.pop()
+            added = out.add(parent, {**tree.fields(index), "diff": status})
+            counts[status] += 1
+            stack.extend((child, added) for child in reversed(tree.children(index)))
+
+    def placeholder(run: List[int], parent: int):
+        hidden = sum(new_tree.sizes[n] for n in run)
+        counts[UNCHANGED] += hidden
+        if len(run) == 1:
+            fields = new_tree.fields(run[0])
+        else:
+            fields = {"name": f"{len(run)} unchanged"}
+        out.add(parent, {**fields, "diff": UNCHANGED, "hidden": hidden})
+
+    def open_pair(o: int, n: int, same_path: bool, parent: int) -> Tuple[int, List[Tuple]]:
+        """配上但有变化的一对：配好子节点，定下状态，放进合并树"""
+        old_children, new_children = old_tree.children(o), new_tree.children(n)
+        matched = _match(old_tree, new_tree, old_children, new_children, same_path)
+        merged = _merge_order(old_children, new_children, matched)
+        if n == NONE:
+            return NONE, merged
+        # 子节点都没变、也没有增删，变的就是它自己
+        status = CHANGED if all(entry[0] == UNCHANGED for entry in merged) else CONTEXT
+        counts[status] += 1
+        fields = {**new_tree.fields(n), "diff": status}
+        old_name = old_tree.table.field(o, "name")
+        if old_name != fields.get("name"):
+            fields["old_name"] = old_name
+        return out.add(parent, fields), merged
+
+    # 顶层当作一对虚拟的根；(合并树里的父节点, 它合并好的子节点)
+    stack = [open_pair(NONE, NONE, True, NONE)]
+    while stack:
+        parent, merged = stack.pop()
+        descend = []
+        run: List[int] = []
+        for status, child_old, child_new, path in merged:
+            if status == UNCHANGED:
+                run.append(child_new)
+                continue
+            if run:
+                placeholder(run, parent)
+                run = []
+            if status == ADDED:
+                copy(new_tree, child_new, parent, ADDED)
+            elif status == REMOVED:
+                copy(old_tree, child_old, parent, REMOVED)
+            else:
+                # 节点先按顺序放进去，它的子节点之后再追加
+                descend.append(open_pair(child_old, child_new, path, parent))
+        if run:
+            placeholder(run, parent)
+        stack.extend(reversed(descend))
+
+    return {
+        "nodes": out.nodes(),
+        "metadata": new.get("metadata", {}),
+        "compilerMetadata": new.get("compilerMetadata", {}),
+        "imports": [],
+        "exports": [],
+        "relations": [],
+        "diff": counts,
+    }
@@ -0,0 +1,418 @@
+"""
+标准化 AST 的紧凑内存表示
+
+节点不再是一个个嵌套的 dict，而是一张按列存的表（struct-of-arrays）：
+每一列是一个 `array`，第 i 个节点就是每列的第 i 项，
+树结构靠 parent / first_child / next_sibling 三列的下标串起来，
+name / kind / type 存的是字符串表里的下标，相同的字符串只存一份
+
+每个节点的固定开销（64 位 CPython）：
+    parent, first_child, last_child, next_sibling   4 x int32 = 16 B
+    name, kind, type                                3 x int32 = 12 B
+    id（UUID 或整数按 16 字节存，另有 1 字节标记）       17 B
+    合计                                                     45 B
+另外每个不同的字符串存一次；不常见的字段（value、returns……）放在稀疏的 extras 里。
+实测（`python -m core.ast_model`，类 + 3 个属性的典型形状，名字各不相同）：
+dict 约 350 B/节点，NodeTable 约 64 B/节点（列 45 B + 字符串表）
+
+空的 `children` 不占位置：视图里没有 `children` 这个键，`get("children")` 返回 None
+
+已有的调用方照旧用 `node.get("children")`、`node["name"]` 就行，
+`NodeView` 是只读的、和 dict 行为一致的视图，`NodeList` 是顶层节点的列表视图
+"""
+
+# sys
+from array import array
+import uuid
+
+# lib function
+from collections.abc import Mapping, Sequence
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+NONE = -1
+_MISSING = object()
+
+# id 的存法
+_ID_ABSENT = 0
+_ID_NULL = 1
+_ID_UUID = 2
+_ID_INT = 3
+_ID_OTHER = 4
+
+# 有专门列的字段，其余的都进 extras
+_STRING_FIELDS = ("name", "kind", "type")
+_COLUMN_FIELDS = ("id",) + _STRING_FIELDS + ("children",)
+
+
+class NodeTable:
+    """
+    按列存的节点表，见模块说明
+    节点只能追加，追加时给出父节点下标（顶层节点是 `NONE`），子节点按追加顺序排列
+    """
+
+    __slots__ = (
+        "parent",
+        "first_child",
+        "last_child",
+        "next_sibling",
+        "name",
+        "kind",
+        "type",
+        "_id_tags",
+        "_id_bytes",
+        "_odd_ids",
+        "extras",
+        "strings",
+        "_string_index",
+        "roots",
+    )
+
+    def __init__(self):
+        self.parent = array("i")
+        self.first_child = array("i")
+        self.last_child = array("i")
+        self.next_sibling = array("i")
+        self.name = array("i")
+        self.kind = array("i")
+        self.type = array("i")
+        self._id_tags = bytearray()
+        self._id_bytes = bytearray()
+        self._odd_ids: Dict[int, Any] = {}
+        # 节点下标 -> 不常见的字段
+        self.extras: Dict[int, Dict[str, Any]] = {}
+        self.strings: List[str] = []
+        self._string_index: Dict[str, int] = {}
+        self.roots = array("i")
+
+    def __len__(self) -> int:
+        return len(self.parent)
+
+    def intern(self, value: Optional[str]) -> int:
+        """字符串在字符串表里的下标，None 是 `NONE`"""
+        if value is None:
+            return NONE
+        index = self._string_index.get(value)
+        if index is None:
+            index = self._string_index[value] = len(self.strings)
+            self.strings.append(value)
+        return index
+
+    def string(self, index: int) -> Optional[str]:
+        return None if index == NONE else self.strings[index]
+
+    def _store_id(self, index: int, node_id: Any, present: bool):
+        tag, raw = _ID_ABSENT, bytes(16)
+        if not present:
+            pass
+        elif node_id is None:
+            tag = _ID_NULL
+        elif isinstance(node_id, int) and -(1 << 63) <= node_id < (1 << 63):
+            tag, raw = _ID_INT, node_id.to_bytes(16, "little", signed=True)
+        else:
+            try:
+                parsed = uuid.UUID(node_id) if isinstance(node_id, str) else None
+            except ValueError:
+                parsed = None
+            # 只有写回去一模一样的才按 UUID 存（大小写、花括号之类的保持原样）
+            if parsed is not None and str(parsed) == node_id:
+                tag, raw = _ID_UUID, parsed.bytes
+            else:
+                tag = _ID_OTHER
+                self._odd_ids[index] = node_id
+        self._id_tags.append(tag)
+        self._id_bytes += raw
+
+    def has_id(self, index: int) -> bool:
+        return self._id_tags[index] != _ID_ABSENT
+
+    def node_id(self, index: int) -> Any:
+        tag = self._id_tags[index]
+        if tag == _ID_UUID:
+            return str(uuid.UUID(bytes=bytes(self._id_bytes[index * 16 : index * 16 + 16])))
+        if tag == _ID_INT:
+            return int.from_bytes(
+                self._id_bytes[index * 16 : index * 16 + 16], "little", signed=True
+            )
+        if tag == _ID_OTHER:
+            return self._odd_ids[index]
+        return None
+
+    def content_ids(self) -> bool:
+        """
+        所有节点的 id 都是解析器按 (结构路径, 源码内容) 算的（version 5 的 UUID）
+        `--format compact` 之类的 id 只是下标，两个版本之间比不了
+        """
+        id_bytes = self._id_bytes
+        return all(
+            tag == _ID_UUID and id_bytes[index * 16 + 6] >> 4 == 5
+            for index, tag in enumerate(self._id_tags)
+        )
+
+    def add(
+        self,
+        parent: int = NONE,
+        fields: Optional[Mapping] = None,
+    ) -> int:
+        """
+        追加一个节点
+        Args:
+            parent = NONE (int, optional): 父节点下标，顶层节点用 `NONE`
+            fields = None (Mapping, optional): 节点的字段（`children` 会被忽略，子节点自己 `add`）
+
+        Returns:
+            int: 新节点的下标
+        """
+        fields = fields or {}
+        index = len(self.parent)
+        self.parent.append(parent)
+        self.first_child.append(NONE)
+        self.last_child.append(NONE)
+        self.next_sibling.append(NONE)
+        self.name.append(self.intern(fields.get("name")))
+        self.kind.append(self.intern(fields.get("kind")))
+        self.type.append(self.intern(fields.get("type")))
+        self._store_id(index, fields.get("id"), "id" in fields)
+
+        extra = {k: v for k, v in fields.items() if k not in _COLUMN_FIELDS}
+        # 有列的字段如果不是字符串（或者显式给了 None），原样放进 extras
+        for field in _STRING_FIELDS:
+            value = fields.get(field, _MISSING)
+            if value is not _MISSING and not isinstance(value, str):
+                extra[field] = value
+        if extra:
+            self.extras[index] = extra
+
+        if parent == NONE:
+            self.roots.append(index)
+        else:
+            if self.first_child[parent] == NONE:
+                self.first_child[parent] = index
+            else:
+                self.next_sibling[self.last_child[parent]] = index
+            self.last_child[parent] = index
+        return index
+
+    def add_tree(self, node: Mapping, parent: int = NONE) -> int:
+        """
+        把一棵 dict 形式的子树整个追加进来（不递归，多深都行）
+
+        Returns:
+            int: 子树根节点的下标
+        """
+        root = self.add(parent, node)
+        stack = [(root, iter(node.get("children") or ()))]
+        while stack:
+            index, children = stack[-1]
+            child = next(children, None)
+            if child is None:
+                stack.pop()
+                continue
+            child_index = self.add(index, child)
+            stack.append((child_index, iter(child.get("children") or ())))
+        return root
+
+    @classmethod
+    def from_nodes(cls, nodes: Iterable[Mapping]) -> "NodeTable":
+        """由 dict 形式的顶层节点列表建表"""
+        table = cls()
+        for node in nodes:
+            table.add_tree(node)
+        return table
+
+    def children(self, index: int) -> Iterator[int]:
+        child = self.first_child[index]
+        while child != NONE:
+            yield child
+            child = self.next_sibling[child]
+
+    def has_children(self, index: int) -> bool:
+        return self.first_child[index] != NONE
+
+    def field(self, index: int, key: str, default: Any = None) -> Any:
+        """单个字段，不存在时返回 default（和 `dict.get` 一样）"""
+        if key in _STRING_FIELDS:
+            extra = self.extras.get(index)
+            if extra and key in extra:
+                return extra[key]
+            value = getattr(self, key)[index]
+            return default if value == NONE else self.strings[value]
+        if key == "children":
+            if self.first_child[index] == NONE:
+                return default
+            return [NodeView(self, child) for child in self.children(index)]
+        if key == "id":
+            return self.node_id(index) if self.has_id(index) else default
+        extra = self.extras.get(index)
+        if extra is None:
+            return default
+        return extra.get(key, default)
+
+    def keys(self, index: int) -> List[str]:
+        keys = []
+        extra = self.extras.get(index) or {}
+        if self.has_id(index):
+            keys.append("id")
+        for field in _STRING_FIELDS:
+            if getattr(self, field)[index] != NONE or field in extra:
+                keys.append(field)
+        if self.has_children(index):
+            keys.append("children")
+        keys += [k for k in extra if k not in _STRING_FIELDS]
+        return keys
+
+    def view(self, index: int) -> "NodeView":
+        return NodeView(self, index)
+
+    def nodes(self) -> "NodeList":
+        """顶层节点的列表视图"""
+        return NodeList(self)
+
+    def to_dict(self, index: int) -> Dict:
+        """转回普通的嵌套 dict（要 `json.dump` 的时候用）"""
+        result = {key: self.field(index, key) for key in self.keys(index) if key != "children"}
+        stack: List[Tuple[Dict, int]] = [(result, index)]
+        while stack:
+            parent_dict, parent_index = stack.pop()
+            if not self.has_children(parent_index):
+                continue
+            parent_dict["children"] = []
+            for child in self.children(parent_index):
+                child_dict = {
+                    key: self.field(child, key)
+                    for key in self.keys(child)
+                    if key != "children"
+                }
+                parent_dict["children"].append(child_dict)
+                stack.append((child_dict, child))
+        return result
+
+    def nbytes(self) -> int:
+        """各列占用的字节数（不含字符串表和 extras）"""
+        columns = (
+            self.parent,
+            self.first_child,
+            self.last_child,
+            self.next_sibling,
+            self.name,
+            self.kind,
+            self.type,
+        )
+        return (
+            sum(column.itemsize * len(column) for column in columns)
+            + len(self._id_tags)
+            + len(self._id_bytes)
+        )
+
+
+class NodeView(Mapping):
+    """`NodeTable` 里一个节点的只读视图，用起来和原来的 dict 一样"""
+
+    __slots__ = ("table", "index")
+
+    def __init__(self, table: NodeTable, index: int):
+        self.table = table
+        self.index = index
+
+    def __getitem__(self, key: str) -> Any:
+        value = self.table.field(self.index, key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self.table.field(self.index, key, default)
+
+    def __contains__(self, key: object) -> bool:
+        return self.table.field(self.index, key, _MISSING) is not _MISSING
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.table.keys(self.index))
+
+    def __len__(self) -> int:
+        return len(self.table.keys(self.index))
+
+    def to_dict(self) -> Dict:
+        return self.table.to_dict(self.index)
+
+    def __repr__(self) -> str:
+        return f"NodeView({self.index}, {dict((k, self[k]) for k in self if k != 'children')})"
+
+
+class NodeList(Sequence):
+    """顶层节点的只读列表视图"""
+
+    __slots__ = ("table",)
+
+    def __init__(self, table: NodeTable):
+        self.table = table
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [NodeView(self.table, index) for index in self.table.roots[i]]
+        return NodeView(self.table, self.table.roots[i])
+
+    def __len__(self) -> int:
+        return len(self.table.roots)
+
+    def __iter__(self) -> Iterator[NodeView]:
+        for index in self.table.roots:
+            yield NodeView(self.table, index)
+
+    def to_list(self) -> List[Dict]:
+        return [self.table.to_dict(index) for index in self.table.roots]
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, (list, tuple, NodeList)):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"NodeList({len(self)} nodes)"
+
+
+def _measure(count: int = 20000):
+    """对比同一批节点用 dict 和 NodeTable 时的内存"""
+    import tracemalloc
+
+    def make():
+        nodes = []
+        for i in range(count // 4):
+            nodes.append(
+                {
+                    "id": str(uuid.uuid4()),
+                    "name": f"Class{i}",
+                    "kind": "ClassDeclaration",
+                    "type": "class",
+                    "children": [
+                        {
+                            "id": str(uuid.uuid4()),
+                            "name": f"member{j}",
+                            "kind": "PropertyDeclaration",
+                            "type": "property",
+                        }
+                        for j in range(3)
+                    ],
+                }
+            )
+        return nodes
+
+    tracemalloc.start()
+    nodes = make()
+    as_dicts = tracemalloc.get_traced_memory()[0]
+    table = NodeTable.from_nodes(nodes)
+    del nodes
+    tracemalloc.stop()
+    tracemalloc.start()
+    rebuilt = NodeTable.from_nodes(table.nodes().to_list())
+    as_table = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    assert len(rebuilt) == count
+    print(
+        f"{count} nodes: dict {as_dicts / count:.0f} B/node, "
+        f"NodeTable {as_table / count:.0f} B/node "
+        f"(columns {rebuilt.nbytes() / count:.0f} B/node)"
+    )
+
+
+if __name__ == "__main__":
+    _measure()
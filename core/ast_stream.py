@@ -0,0 +1,307 @@
+"""
+解析器输出（AnalyzedJSON）的流式读取
+
+不把整个文件 `json.load` 进来，而是边读边扫：
+想要的部分（比如 `AnalyzedAST.statements` 的每一项）逐个解码后吐出去，
+不要的部分（`StandardAST`、`idMap`……）只数括号跳过，不建对象。
+峰值内存只跟最大的那一项有关，跟文件大小无关。
+单项嵌套太深（长的链式调用、生成的代码）C 解码器会递归超限，这时换成显式栈解码。
+
+section 的写法：
+    "Metadata"                  整个值
+    "AnalyzedAST.statements[]"  数组里的每一项
+    "AnalyzedAST.idMap{}"       对象里的每一项，吐出 (key, 值)
+"""
+
+# sys
+import json
+import re
+
+# lib function
+from typing import Any, Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+
+DEFAULT_SECTIONS = (
+    "AnalyzedAST.statements[]",
+    "AnalyzedAST.imports[]",
+    "AnalyzedAST.exports[]",
+    "AnalyzedAST.relations[]",
+    "Metadata",
+    "compilerMetadata",
+)
+
+_WHITESPACE = " \t\n\r"
+# 容器里需要关心的：括号、完整的字符串（一次跳过），或者被 chunk 截断的字符串的开引号；其他的一律跳过
+_SPECIAL = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"|[\[\]{}"]', re.S)
+# 开引号之后到闭引号（含）为止
+_STRING_REST = re.compile(r'[^"\\]*(?:\\.[^"\\]*)*"', re.S)
+# 字符串里不含闭引号、也不以半个转义结尾的一段
+_STRING_BODY = re.compile(r'[^"\\]*(?:\\.[^"\\]*)*', re.S)
+# 标量（数字、true/false/null）一直到分隔符为止
+_SCALAR = re.compile(r"[^,\]}\s]+")
+# 显式栈解码用：括号、分隔符、开引号、标量
+_TOKEN = re.compile(r'\s*(?:([\[\]{}])|([,:])|(")|([^,:\[\]{}"\s]+))')
+_LITERALS = {"true": True, "false": False, "null": None}
+
+
+def _loads_deep(text: str) -> Any:
+    """
+    `json.loads` 的显式栈版本，嵌套多深都行（比 C 解码器慢，只在它递归超限时用）
+    输入是解析器写出来的合法 JSON，不做完整的语法检查
+    """
+    containers: List[Any] = []
+    # 每个未闭合的对象正在等值的 key（数组是 None）
+    keys: List[Optional[str]] = []
+    pos = 0
+    while True:
+        m = _TOKEN.match(text, pos)
+        if m is None:
+            raise ValueError(f"Invalid JSON at {pos}")
+        pos = m.end()
+        bracket, separator, quote, scalar = m.groups()
+        if separator:
+            continue
+        if bracket in ("[", "{"):
+            containers.append([] if bracket == "[" else {})
+            keys.append(None)
+            continue
+        if bracket:
+            value = containers.pop()
+            keys.pop()
+        elif quote:
+            value, pos = json.decoder.scanstring(text, pos)
+            if containers and isinstance(containers[-1], dict) and keys[-1] is None:
+                keys[-1] = value
+                continue
+        elif scalar in _LITERALS:
+            value = _LITERALS[scalar]
+        else:
+            try:
+                value = int(scalar)
+            except ValueError:
+                value = float(scalar)
+
+        if not containers:
+            return value
+        if isinstance(containers[-1], list):
+            containers[-1].append(value)
+        else:
+            containers[-1][keys[-1]] = value
+            keys[-1] = None
+
+
+class _Reader:
+    def __init__(self, fp: TextIO, chunk_size: int = 1 << 16):
+        self.fp = fp
+        self.chunk_size = chunk_size
+        self.buf = ""
+        self.pos = 0
+        # buf 里从 mark 开始的内容还要用，补数据时不能丢
+        self.mark: Optional[int] = None
+        # 补数据时从 buf 里挪出来的、mark 之后已经扫过的部分；
+        # 大的值跨很多块时不用每补一块就把前面的整段再拼一遍
+        self.marked: List[str] = []
+
+    def _fill(self) -> bool:
+        chunk = self.fp.read(self.chunk_size)
+        if not chunk:
+            return False
+        if self.mark is not None and self.mark < self.pos:
+            self.marked.append(self.buf[self.mark : self.pos])
+            self.mark = self.pos
+        # mark 不会在 pos 后面，buf 只留还没扫的
+        keep = self.pos
+        self.buf = self.buf[keep:] + chunk
+        self.pos -= keep
+        if self.mark is not None:
+            self.mark -= keep
+        return True
+
+    def peek(self) -> str:
+        """下一个非空白字符（不消费）"""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                raise ValueError("Unexpected end of analyzer output")
+
+    def expect(self, chars: str) -> str:
+        c = self.peek()
+        if c not in chars:
+            raise ValueError(f"Expected one of {chars!r} at {self.pos}, got {c!r}")
+        self.pos += 1
+        return c
+
+    def _fill_keeping_pos(self) -> bool:
+        """补一块数据，并且保留 pos 之后的内容（值被 chunk 截断时用）"""
+        temporary = self.mark is None
+        if temporary:
+            self.mark = self.pos
+        filled = self._fill()
+        if temporary:
+            self.mark = None
+        return filled
+
+    def _scan_string(self):
+        """pos 在开引号之后，移到闭引号之后"""
+        while True:
+            m = _STRING_REST.match(self.buf, self.pos)
+            if m:
+                self.pos = m.end()
+                return
+            # 字符串被 chunk 截断了：扫过的部分不用再扫，跳过时也不用留着
+            self.pos = _STRING_BODY.match(self.buf, self.pos).end()
+            if not self._fill_keeping_pos():
+                raise ValueError("Unterminated string in analyzer output")
+
+    def _scan_value(self):
+        """跳过一个完整的值，pos 停在值之后"""
+        c = self.peek()
+        if c == '"':
+            self.pos += 1
+            self._scan_string()
+        elif c in "[{":
+            depth = 0
+            while True:
+                for m in _SPECIAL.finditer(self.buf, self.pos):
+                    ch = m.group()
+                    if len(ch) > 1:
+                        continue
+                    self.pos = m.end()
+                    if ch == '"':
+                        break
+                    if ch in "[{":
+                        depth += 1
+                    else:
+                        depth -= 1
+                        if depth == 0:
+                            return
+                else:
+                    # 这一块扫完了，剩下的都是完整的字符串和标量
+                    self.pos = len(self.buf)
+                    if not self._fill():
+                        raise ValueError("Unexpected end of analyzer output")
+                    continue
+                # 字符串被 chunk 截断了
+                self._scan_string()
+        else:
+            while True:
+                m = _SCALAR.match(self.buf, self.pos)
+                if m and m.end() < len(self.buf):
+                    self.pos = m.end()
+                    return
+                if not self._fill_keeping_pos():
+                    # 文件末尾的标量
+                    m = _SCALAR.match(self.buf, self.pos)
+                    self.pos = m.end() if m else self.pos
+                    return
+
+    def skip_value(self):
+        self._scan_value()
+
+    def read_value(self) -> Any:
+        """读出并解码一个完整的值"""
+        self.peek()
+        self.mark = self.pos
+        try:
+            self._scan_value()
+            text = "".join(self.marked) + self.buf[self.mark : self.pos]
+            try:
+                return json.loads(text)
+            except RecursionError:
+                return _loads_deep(text)
+        finally:
+            self.mark = None
+            self.marked = []
+
+    def read_key(self) -> str:
+        if self.peek() != '"':
+            raise ValueError(f"Expected object key at {self.pos}")
+        return self.read_value()
+
+
+def _iter_object(
+    reader: _Reader, path: str, sections: Tuple[str, ...]
+) -> Iterator[Tuple[str, Any]]:
+    reader.expect("{")
+    if reader.peek() == "}":
+        reader.pos += 1
+        return
+    while True:
+        key = reader.read_key()
+        reader.expect(":")
+        child = f"{path}.{key}" if path else key
+
+        if child in sections:
+            yield child, reader.read_value()
+        elif f"{child}[]" in sections and reader.peek() == "[":
+            yield from _iter_array(reader, f"{child}[]")
+        elif f"{child}{{}}" in sections and reader.peek() == "{":
+            yield from _iter_members(reader, f"{child}{{}}")
+        elif reader.peek() == "{" and any(s.startswith(child + ".") for s in sections):
+            yield from _iter_object(reader, child, sections)
+        else:
+            reader.skip_value()
+
+        if reader.expect(",}") == "}":
+            return
+
+
+def _iter_array(reader: _Reader, section: str) -> Iterator[Tuple[str, Any]]:
+    reader.expect("[")
+    if reader.peek() == "]":
+        reader.pos += 1
+        return
+    while True:
+        yield section, reader.read_value()
+        if reader.expect(",]") == "]":
+            return
+
+
+def _iter_members(reader: _Reader, section: str) -> Iterator[Tuple[str, Any]]:
+    reader.expect("{")
+    if reader.peek() == "}":
+        reader.pos += 1
+        return
+    while True:
+        key = reader.read_key()
+        reader.expect(":")
+        yield section, (key, reader.read_value())
+        if reader.expect(",}") == "}":
+            return
+
+
+def iter_analyzed(
+    fp: TextIO, sections: Iterable[str] = DEFAULT_SECTIONS
+) -> Iterator[Tuple[str, Any]]:
+    """
+    流式读取解析器输出
+    Args:
+        fp (TextIO): 解析器输出（文件或者管道）
+        sections = DEFAULT_SECTIONS (Iterable[str], optional): 要的部分
+
+    Returns:
+        Iterator[Tuple[str, Any]]: 按文件顺序吐出 (section, 值)
+    """
+    yield from _iter_object(_Reader(fp), "", tuple(sections))
+
+
+def iter_analyzed_dict(
+    result: Dict, sections: Iterable[str] = DEFAULT_SECTIONS
+) -> Iterator[Tuple[str, Any]]:
+    """已经在内存里的 AnalyzedJSON，按 `iter_analyzed` 的格式吐出同样的 (section, 值)"""
+    for section in sections:
+        value: Any = result
+        for key in section.removesuffix("[]").removesuffix("{}").split("."):
+            value = value.get(key) if isinstance(value, dict) else None
+        if value is None:
+            continue
+        if section.endswith("[]"):
+            for item in value:
+                yield section, item
+        elif section.endswith("{}"):
+            for item in value.items():
+                yield section, item
+        else:
+            yield section, value
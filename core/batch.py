@@ -0,0 +1,501 @@
+# sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+import logging
+import atexit
+import time
+import os
+
+# lib function
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Tuple, TypedDict
+
+from core.batch_paths import (
+    batch_root,
+    discover_sources,
+    is_batch_input,
+    output_path,
+    supported_kinds,
+)
+from core.drawio_generator import DrawIOGenerator
+from core.parserSwitch import CodeParser
+from core.parse_cache import ParseCache
+
+if TYPE_CHECKING:
+    from core.symbol_index import SymbolIndex
+
+# asyncio、进程池（multiprocessing）、依赖图、分页合并、符号索引（sqlite3）在用到的函数里才导入，
+# 只用到其中一种的批处理不用为其他的付导入时间
+
+logger = logging.getLogger(__name__)
+
+
+class FileResult(TypedDict):
+    source: str
+    output: str
+    ok: bool
+    error: Optional[str]
+    parse_time: float  # 秒
+    render_time: float  # 秒
+
+
+def _symbol_index(index_symbols: bool) -> Optional["SymbolIndex"]:
+    if not index_symbols:
+        return None
+    from core.symbol_index import SymbolIndex
+
+    return SymbolIndex()
+
+
+# 每个进程池子进程各自持有一个 CodeParser（和它的常驻解析进程）
+_parser: Optional[CodeParser] = None
+_render_options: Dict = {}
+
+
+def _init_process(
+    use_cache: bool,
+    format: str,
+    node_filter: Optional[Dict],
+    render_options: Dict,
+    index_symbols: bool,
+):
+    global _parser, _render_options
+    _render_options = render_options
+    _parser = CodeParser(
+        use_worker=True,
+        cache=ParseCache() if use_cache else None,
+        format=format,
+        node_filter=node_filter,
+        symbol_index=_symbol_index(index_symbols),
+    )
+    atexit.register(_parser.close)
+
+
+def _process_file(source: str, output: str) -> FileResult:
+    result: FileResult = {
+        "source": source,
+        "output": output,
+        "ok": False,
+        "error": None,
+        "parse_time": 0.0,
+        "render_time": 0.0,
+    }
+    try:
+        start = time.perf_counter()
+        ast_data = _parser.parsingFile(source)
+        result["parse_time"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        DrawIOGenerator(**_render_options).generate_drawio(ast_data, output)
+        result["render_time"] = time.perf_counter() - start
+        result["ok"] = True
+    except Exception as e:
+        # 单个文件失败不影响整批
+        result["error"] = f"{type(e).__name__}: {e}"
+    return result
+
+
+def run_batch(
+    sources: List[Path],
+    output_dir: str,
+    root: Path,
+    jobs: Optional[int] = None,
+    use_cache: bool = True,
+    format: str = "json",
+    node_filter: Optional[Dict] = None,
+    render_options: Optional[Dict] = None,
+    index_symbols: bool = False,
+) -> List[FileResult]:
+    """
+    并行解析、绘制一批文件，每个文件输出到 `output_dir/<相对路径>.drawio`
+    Args:
+        sources (List[Path]): 源文件
+        output_dir (str): 输出目录
+        root (Path): 计算相对路径的起点
+        jobs = cpu_count (int, optional): 进程池大小
+        use_cache = True (bool, optional): 用解析缓存（`tmp/parse_cache`）
+        format = "json" (str, optional): 解析器输出格式（"json" / "compact"）
+        node_filter = None (Dict, optional): 解析器的节点过滤（见 `CodeParser`）
+        render_options = None (Dict, optional): 传给 `DrawIOGenerator` 的参数（writer、compress 等）
+        index_symbols = False (bool, optional): 顺便更新符号索引（`tmp/symbol_index.sqlite3`）
+
+    Returns:
+        List[FileResult]: 和 sources 同序的结果
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    jobs = max(1, min(jobs or os.cpu_count() or 1, len(sources)))
+    outputs = [output_path(source, output_dir, root) for source in sources]
+
+    results: List[Optional[FileResult]] = [None] * len(sources)
+    with ProcessPoolExecutor(
+        max_workers=jobs,
+        initializer=_init_process,
+        initargs=(use_cache, format, node_filter, render_options or {}, index_symbols),
+    ) as pool:
+        futures = {
+            pool.submit(_process_file, str(source), output): i
+            for i, (source, output) in enumerate(zip(sources, outputs))
+        }
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                results[i] = future.result()
+            except Exception as e:
+                # 子进程整个挂掉（BrokenProcessPool 等）
+                results[i] = {
+                    "source": str(sources[i]),
+                    "output": outputs[i],
+                    "ok": False,
+                    "error": f"{type(e).__name__}: {e}",
+                    "parse_time": 0.0,
+                    "render_time": 0.0,
+                }
+            if results[i]["ok"]:
+                logger.info(f"[{i + 1}/{len(sources)}] {results[i]['source']}")
+            else:
+                logger.error(
+                    f"[{i + 1}/{len(sources)}] {results[i]['source']}: {results[i]['error']}"
+                )
+    return results
+
+
+def run_pipeline(
+    sources: List[Path],
+    output_dir: str,
+    root: Path,
+    jobs: Optional[int] = None,
+    use_cache: bool = True,
+    format: str = "json",
+    node_filter: Optional[Dict] = None,
+    render_options: Optional[Dict] = None,
+    index_symbols: bool = False,
+) -> List[FileResult]:
+    """
+    `run_batch` 的单进程版本：`CodeParser.parse_many` 同时跑 jobs 个解析器，
+    哪个文件先解析完就先交给绘制线程，绘制第 N 个文件的同时第 N+1 个还在解析
+    参数和返回值同 `run_batch`，jobs 是同时在跑的解析器个数
+    """
+    import asyncio
+
+    return asyncio.run(
+        _run_pipeline(
+            sources,
+            output_dir,
+            root,
+            jobs or os.cpu_count() or 1,
+            use_cache,
+            format,
+            node_filter,
+            render_options or {},
+            index_symbols,
+        )
+    )
+
+
+async def _run_pipeline(
+    sources: List[Path],
+    output_dir: str,
+    root: Path,
+    jobs: int,
+    use_cache: bool,
+    format: str,
+    node_filter: Optional[Dict],
+    render_options: Dict,
+    index_symbols: bool,
+) -> List[FileResult]:
+    import asyncio
+
+    index = {str(source): i for i, source in enumerate(sources)}
+    results: List[Optional[FileResult]] = [None] * len(sources)
+
+    def render(ast_data: Dict, output: str) -> float:
+        start = time.perf_counter()
+        DrawIOGenerator(**render_options).generate_drawio(ast_data, output)
+        return time.perf_counter() - start
+
+    loop = asyncio.get_running_loop()
+    # 绘制是纯 Python，一个线程就够，多了只会抢 GIL
+    renderer = ThreadPoolExecutor(max_workers=1)
+    rendering: List[asyncio.Future] = []
+
+    async def finish(i: int, outcome: Dict):
+        result: FileResult = {
+            "source": outcome["file"],
+            "output": output_path(sources[i], output_dir, root),
+            "ok": False,
+            "error": None,
+            "parse_time": outcome["seconds"],
+            "render_time": 0.0,
+        }
+        try:
+            if outcome["error"] is not None:
+                raise outcome["error"]
+            result["render_time"] = await loop.run_in_executor(
+                renderer, render, outcome["result"], result["output"]
+            )
+            result["ok"] = True
+        except Exception as e:
+            # 单个文件失败不影响整批
+            result["error"] = f"{type(e).__name__}: {e}"
+        results[i] = result
+        done = sum(r is not None for r in results)
+        if result["ok"]:
+            logger.info(f"[{done}/{len(sources)}] {result['source']}")
+        else:
+            logger.error(f"[{done}/{len(sources)}] {result['source']}: {result['error']}")
+
+    async with CodeParser(
+        use_worker=True,
+        cache=ParseCache() if use_cache else None,
+        format=format,
+        node_filter=node_filter,
+        concurrency=jobs,
+        symbol_index=_symbol_index(index_symbols),
+    ) as parser:
+        try:
+            async for outcome in parser.parse_many(str(s) for s in sources):
+                rendering.append(asyncio.ensure_future(finish(index[outcome["file"]], outcome)))
+            await asyncio.gather(*rendering)
+        finally:
+            renderer.shutdown()
+    return results
+
+
+def run_combined(
+    sources: List[Path],
+    output: str,
+    root: Path,
+    jobs: Optional[int] = None,
+    use_cache: bool = True,
+    format: str = "json",
+    node_filter: Optional[Dict] = None,
+    render_options: Optional[Dict] = None,
+    index_symbols: bool = False,
+) -> List[FileResult]:
+    """
+    一批文件画进同一个 .drawio：每个文件一页（`shard_by="file"`，超出页面预算的再分页），外加目录页
+    解析同 `run_pipeline`，全部解析完后各页在 jobs 个子进程里布局
+    Args:
+        output (str): 输出文件
+        其余同 `run_batch`
+
+    Returns:
+        List[FileResult]: 和 sources 同序的结果
+    """
+    jobs = jobs or os.cpu_count() or 1
+    results, parsed = _parse_all(
+        sources, output, jobs, use_cache, format, node_filter, index_symbols
+    )
+    if not parsed:
+        return results
+
+    from core.sharding import merge_results
+
+    # 页按 sources 的顺序排，页名是相对 root 的路径
+    merged = merge_results(
+        (Path(output_path(sources[i], "", root)).with_suffix("").as_posix(), parsed[i])
+        for i in sorted(parsed)
+    )
+    _render_combined(
+        results,
+        parsed,
+        output,
+        lambda: DrawIOGenerator(
+            **{**(render_options or {}), "shard_by": "file"}, jobs=jobs
+        ).generate_drawio(merged, output),
+    )
+    return results
+
+
+def run_graph(
+    sources: List[Path],
+    output: str,
+    root: Path,
+    jobs: Optional[int] = None,
+    use_cache: bool = True,
+    format: str = "json",
+    node_filter: Optional[Dict] = None,
+    render_options: Optional[Dict] = None,
+    index_symbols: bool = False,
+) -> List[FileResult]:
+    """
+    一批文件的依赖图（`core.dependency_graph`）画成一页：每个文件一个框，import 和继承关系连线
+    解析同 `run_combined`，参数也一样（分页相关的 render_options 不起作用）
+
+    Returns:
+        List[FileResult]: 和 sources 同序的结果
+    """
+    jobs = jobs or os.cpu_count() or 1
+    results, parsed = _parse_all(
+        sources, output, jobs, use_cache, format, node_filter, index_symbols
+    )
+    if not parsed:
+        return results
+
+    from core.dependency_graph import DependencyGraph
+
+    # import 按相对 root 的路径解析，所以文件名要带后缀
+    graph = DependencyGraph(
+        (Path(output_path(sources[i], "", root)).with_suffix("").as_posix(), parsed[i])
+        for i in sorted(parsed)
+    )
+    options = {
+        key: value
+        for key, value in (render_options or {}).items()
+        if key not in ("shard_by", "page_budget")
+    }
+    _render_combined(
+        results,
+        parsed,
+        output,
+        lambda: DrawIOGenerator(**options).generate_dependency_graph(graph, output),
+    )
+    return results
+
+
+def _parse_all(
+    sources: List[Path],
+    output: str,
+    jobs: int,
+    use_cache: bool,
+    format: str,
+    node_filter: Optional[Dict],
+    index_symbols: bool,
+) -> Tuple[List[FileResult], Dict[int, Dict]]:
+    """
+    在本进程里并发解析整批文件，结果留在内存里，给画成一张图的 `run_combined` / `run_graph` 用
+
+    Returns:
+        Tuple[List[FileResult], Dict[int, Dict]]: (和 sources 同序的结果, sources 下标 -> 解析结果)
+    """
+    import asyncio
+
+    results: List[Optional[FileResult]] = [None] * len(sources)
+    index = {str(source): i for i, source in enumerate(sources)}
+    parsed: Dict[int, Dict] = {}
+
+    async def parse_all():
+        async with CodeParser(
+            use_worker=True,
+            cache=ParseCache() if use_cache else None,
+            format=format,
+            node_filter=node_filter,
+            concurrency=jobs,
+            symbol_index=_symbol_index(index_symbols),
+        ) as parser:
+            async for outcome in parser.parse_many(str(s) for s in sources):
+                i = index[outcome["file"]]
+                results[i] = {
+                    "source": outcome["file"],
+                    "output": output,
+                    "ok": outcome["error"] is None,
+                    "error": None,
+                    "parse_time": outcome["seconds"],
+                    "render_time": 0.0,
+                }
+                if outcome["error"] is None:
+                    parsed[i] = outcome["result"]
+                else:
+                    # 单个文件失败不影响整批
+                    results[i]["error"] = f"{type(outcome['error']).__name__}: {outcome['error']}"
+                    logger.error(f"{outcome['file']}: {results[i]['error']}")
+
+    asyncio.run(parse_all())
+    return results, parsed
+
+
+def _render_combined(
+    results: List[FileResult], parsed: Dict[int, Dict], output: str, render: Callable[[], None]
+):
+    """画整张图，出错的话算到每个参与的文件头上"""
+    start = time.perf_counter()
+    try:
+        render()
+        error = None
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+        logger.error(f"{output}: {error}")
+    # 整张图的绘制时间按文件平摊，汇总时加起来正好是总数
+    render_time = (time.perf_counter() - start) / len(parsed)
+    for i in parsed:
+        results[i]["render_time"] = render_time
+        if error is not None:
+            results[i]["ok"], results[i]["error"] = False, error
+
+
+def update_symbol_index(
+    inputs: List[str],
+    symbol_index: "SymbolIndex",
+    jobs: Optional[int] = None,
+    use_cache: bool = True,
+) -> Dict[str, int]:
+    """
+    把一批文件的符号写进索引，内容哈希和索引里一样的文件不解析
+    Args:
+        inputs (List[str]): 文件、目录或 glob
+        symbol_index (SymbolIndex): 要更新的索引
+        jobs = cpu_count (int, optional): 同时跑几个解析器
+        use_cache = True (bool, optional): 用解析缓存
+
+    Returns:
+        Dict[str, int]: `{"indexed", "unchanged", "failed"}` 的文件数
+    """
+    from core.symbol_index import content_hash
+
+    sources: List[Path] = []
+    for target in inputs:
+        sources += discover_sources(target) if is_batch_input(target) else [Path(target)]
+    sources = list(dict.fromkeys(sources))
+    stale = [
+        source
+        for source in sources
+        if not source.exists()
+        or not symbol_index.is_current(str(source), content_hash(source.read_bytes()))
+    ]
+    counts = {"indexed": 0, "unchanged": len(sources) - len(stale), "failed": 0}
+
+    async def parse_all():
+        async with CodeParser(
+            use_worker=True,
+            cache=ParseCache() if use_cache else None,
+            concurrency=jobs or os.cpu_count() or 1,
+            symbol_index=symbol_index,
+        ) as parser:
+            async for outcome in parser.parse_many(str(s) for s in stale):
+                if outcome["error"] is None:
+                    counts["indexed"] += 1
+                else:
+                    counts["failed"] += 1
+                    logger.error(f"{outcome['file']}: {outcome['error']}")
+
+    if stale:
+        import asyncio
+
+        asyncio.run(parse_all())
+    return counts
+
+
+def summarize(results: List[FileResult], wall_time: float, slowest: int = 5) -> str:
+    """批量结果的耗时汇总"""
+    ok = [r for r in results if r["ok"]]
+    failed = [r for r in results if not r["ok"]]
+    lines = [
+        f"Files: {len(results)} | ok: {len(ok)} | failed: {len(failed)}",
+        f"Wall time: {wall_time:.2f}s | "
+        f"parse total: {sum(r['parse_time'] for r in results):.2f}s | "
+        f"render total: {sum(r['render_time'] for r in results):.2f}s",
+    ]
+    if ok:
+        lines.append("Slowest:")
+        for r in sorted(ok, key=lambda r: -(r["parse_time"] + r["render_time"]))[
+            :slowest
+        ]:
+            lines.append(
+                f"  {r['parse_time'] + r['render_time']:.2f}s "
+                f"(parse {r['parse_time']:.2f}s, render {r['render_time']:.2f}s) {r['source']}"
+            )
+    if failed:
+        lines.append("Failed:")
+        for r in failed:
+            lines.append(f"  {r['source']}: {r['error']}")
+    return "\n".join(lines)
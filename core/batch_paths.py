@@ -0,0 +1,77 @@
+"""
+批量模式的输入和输出路径：哪些输入算一批、找出要处理的文件、每个文件的输出放哪
+`main.py` 每次运行都要问 `is_batch_input`，所以单独放在这里，只依赖标准库，
+不用为了它导入 `core.batch` 和它后面的解析器、依赖图、符号索引
+"""
+
+# sys
+from pathlib import Path
+import glob
+
+# lib function
+from typing import List, Optional
+
+base_dir = Path(__file__).parent.parent
+
+
+def is_batch_input(target: str) -> bool:
+    """输入是目录或者 glob 的时候走批量模式"""
+    return Path(target).is_dir() or any(c in target for c in "*?[")
+
+
+def supported_kinds() -> List[str]:
+    """读 `setting/supported_scriptkind`（逗号分隔的后缀，`//` 开头的行是注释）"""
+    text = (base_dir / "setting" / "supported_scriptkind").read_text(encoding="utf-8")
+    kinds = []
+    for line in text.splitlines():
+        if line.strip().startswith("//"):
+            continue
+        kinds += [kind.strip().lower() for kind in line.split(",") if kind.strip()]
+    return kinds
+
+
+def discover_sources(target: str, kinds: Optional[List[str]] = None) -> List[Path]:
+    """
+    找出要处理的源文件
+    Args:
+        target (str): 目录（递归查找）或者 glob（支持 `**`）
+        kinds = supported_scriptkind (List[str], optional): 允许的后缀
+
+    Returns:
+        List[Path]: 排好序的文件列表，跳过 node_modules
+    """
+    kinds = kinds or supported_kinds()
+    if Path(target).is_dir():
+        candidates = Path(target).rglob("*")
+    else:
+        candidates = (Path(p) for p in glob.glob(target, recursive=True))
+
+    return sorted(
+        p
+        for p in candidates
+        if p.is_file()
+        and p.suffix.lower().removeprefix(".") in kinds
+        and "node_modules" not in p.parts
+    )
+
+
+def batch_root(target: str) -> Path:
+    """输出目录里要保留的相对路径的起点"""
+    if Path(target).is_dir():
+        return Path(target)
+    # glob 取第一个带通配符的部分之前的目录
+    parts = []
+    for part in Path(target).parts:
+        if any(c in part for c in "*?["):
+            break
+        parts.append(part)
+    return Path(*parts) if parts else Path(".")
+
+
+def output_path(source: Path, output_dir: str, root: Path) -> str:
+    """`output_dir/<相对 root 的路径>.drawio`，不在 root 下就只用文件名"""
+    try:
+        relative = source.resolve().relative_to(root.resolve())
+    except ValueError:
+        relative = Path(source.name)
+    return str(Path(output_dir) / f"{relative}.drawio")
@@ -0,0 +1,736 @@
+"""
+性能基准：合成语料 + 分阶段计时 + 基线对比
+
+    python -m core.benchmark                       跑全部场景，打印各阶段耗时
+    python -m core.benchmark --save-baseline       结果存成基线（默认 tmp/benchmark/baseline.json）
+    python -m core.benchmark --compare             和基线比，有阶段慢过阈值就以 1 退出
+    python -m core.benchmark --skip-analyzer       没有 Node 的机器上只测 Python 这一侧
+    python -m core.benchmark --nesting             嵌套深度压力测试，不线性（或者爆栈）就以 1 退出
+    python -m core.benchmark --startup             `main.py` 的启动时间，超出预算就以 1 退出
+
+语料按固定种子生成，同样的场景永远得到同样的源码：
+N 个类、每个类若干方法，`depth` 层 namespace 嵌套，`deep_ratio` 决定多少个类放进最深的那层
+（0 全在顶层，是“宽”；1 全在最里面，是“深”）。
+同时生成一份形状相同的合成 AnalyzedJSON（节点种类照着解析器的输出来），
+`--skip-analyzer` 时用它代替真正的解析结果
+
+阶段（每个场景跑 `--repeat` 次取中位数，单位秒）：
+    spawn     启动常驻解析进程并解析一个空文件（进程启动 + ts-node 编译）
+    analysis  解析语料文件、写出解析结果
+    load      读解析结果并转换成 NodeTable（`CodeParser._standardize_file`）
+    size      `LayoutEngine.measure` 里除了 pack 以外的部分
+    packing   `core.packing.pack`
+    write     落位 + 写 .drawio
+
+默认用 stream 输出（要测 drawpyo 用 `--writer drawpyo`）
+
+嵌套深度压力测试：合成一条 `NESTING_DEPTHS` 层的链式调用（`a.b().c()...` 的形状，每层一个容器），
+从解析结果文件读进来再画出来，各个深度每个节点的耗时都不能比最浅的那次慢 `NESTING_SLOWDOWN` 倍以上，
+也就是整条流程对嵌套深度是线性的，而且哪一步都不递归
+
+启动时间：各跑 `--repeat` 次取中位数，和 `STARTUP_BUDGETS` 比
+    help       `main.py --help`，而且不能导入 `STARTUP_LAZY` 里的模块
+    cache_hit  解析缓存里已经有结果的 `main.py small.ts`（不起 Node，只有导入、读缓存、画图），
+               不能导入 `STARTUP_LAZY_CACHE_HIT` 里的模块
+"""
+
+# sys
+from pathlib import Path
+import contextlib
+import subprocess
+import shutil
+import statistics
+import argparse
+import platform
+import logging
+import random
+import json
+import time
+import sys
+import io
+import os
+
+# lib function
+from typing import Dict, List, Optional, Tuple, TypedDict
+
+from core.drawio_generator import DrawIOGenerator
+from core.parserSwitch import CodeParser
+
+base_dir = Path(__file__).parent.parent
+
+logger = logging.getLogger(__name__)
+
+PHASES = ("spawn", "analysis", "load", "size", "packing", "write")
+BASELINE_VERSION = 1
+
+NESTING_DEPTHS = (2500, 5000, 10000)
+NESTING_SLOWDOWN = 2.0
+
+# 启动时间预算（秒），CI 里每个文件都要付一次
+STARTUP_BUDGETS = {"help": 0.5, "cache_hit": 1.5}
+# `main.py --help` 不该导入的模块（只在用到的地方才导入）
+STARTUP_LAZY = (
+    "drawpyo",
+    "asyncio",
+    "multiprocessing",
+    "sqlite3",
+    "core.parserSwitch",
+    "core.batch",
+    "core.dependency_graph",
+    "core.symbol_index",
+)
+# 缓存命中的单个文件也不该导入的（解析器调度和默认的 drawpyo 输出它要用）
+STARTUP_LAZY_CACHE_HIT = tuple(
+    module for module in STARTUP_LAZY if module not in ("drawpyo", "core.parserSwitch")
+)
+
+
+class Shape(TypedDict):
+    classes: int
+    methods: int  # 每个类
+    depth: int  # namespace 嵌套层数
+    deep_ratio: float  # 放进最深一层的类的比例
+    seed: int
+
+
+SCENARIOS: Dict[str, Shape] = {
+    "small": {"classes": 5, "methods": 5, "depth": 1, "deep_ratio": 0.0, "seed": 1},
+    "wide": {"classes": 100, "methods": 8, "depth": 1, "deep_ratio": 0.0, "seed": 2},
+    "deep": {"classes": 30, "methods": 8, "depth": 4, "deep_ratio": 1.0, "seed": 3},
+    "mixed": {"classes": 60, "methods": 8, "depth": 3, "deep_ratio": 0.5, "seed": 4},
+}
+
+
+class _Corpus:
+    """边写 TS 源码边搭对应的 statements 树"""
+
+    def __init__(self, seed: int):
+        self.random = random.Random(seed)
+        self.lines: List[str] = []
+        self._next_id = 0
+
+    def node(self, kind: str, name: Optional[str] = None, *children: Dict) -> Dict:
+        self._next_id += 1
+        statement = {
+            "id": f"n{self._next_id}",
+            "path": "",
+            "location": {"start": 0, "end": 0},
+            "statementType": kind,
+        }
+        if name is not None:
+            statement["name"] = name
+        if children:
+            statement["children"] = list(children)
+        return statement
+
+    def identifier(self, name: str) -> Dict:
+        return self.node("Identifier", name)
+
+    def write(self, indent: int, line: str):
+        self.lines.append("    " * indent + line)
+
+    def klass(self, index: int, methods: int, indent: int) -> Dict:
+        name = f"Class{index}"
+        self.write(indent, f"class {name} {{")
+        members = [self.identifier(name)]
+        for j in range(self.random.randint(1, 3)):
+            value = self.random.randint(0, 999)
+            self.write(indent + 1, f"field{j}: number = {value};")
+            members.append(
+                self.node(
+                    "PropertyDeclaration",
+                    f"field{j}",
+                    self.identifier(f"field{j}"),
+                    self.node("NumberKeyword"),
+                    self.node("FirstLiteralToken", str(value)),
+                )
+            )
+        for k in range(methods):
+            members.append(self.method(f"method{k}", k, indent + 1))
+        self.write(indent, "}")
+        return self.node("ClassDeclaration", name, *members)
+
+    def method(self, name: str, k: int, indent: int) -> Dict:
+        # 第一个参数要参与运算，固定是 number，保证生成的源码能过类型检查
+        types = ["number"] + [
+            self.random.choice(("number", "string"))
+            for _ in range(self.random.randint(0, 2))
+        ]
+        params = ", ".join(f"a{i}: {t}" for i, t in enumerate(types))
+        self.write(indent, f"{name}({params}): number {{")
+        self.write(indent + 1, f"if (a0 > {k}) {{")
+        self.write(indent + 2, f"return a0 + {k};")
+        self.write(indent + 1, "}")
+        self.write(indent + 1, "return a0.toString().length;")
+        self.write(indent, "}")
+        keyword = {"number": "NumberKeyword", "string": "StringKeyword"}
+        return self.node(
+            "MethodDeclaration",
+            name,
+            self.identifier(name),
+            *(
+                self.node(
+                    "Parameter",
+                    f"a{i}",
+                    self.identifier(f"a{i}"),
+                    self.node(keyword[t]),
+                )
+                for i, t in enumerate(types)
+            ),
+            self.node("NumberKeyword"),
+            self.node(
+                "Block",
+                None,
+                self.node(
+                    "IfStatement",
+                    None,
+                    self.node(
+                        "BinaryExpression",
+                        None,
+                        self.identifier("a0"),
+                        self.node("GreaterThanToken"),
+                        self.node("FirstLiteralToken", str(k)),
+                    ),
+                    self.node(
+                        "Block",
+                        None,
+                        self.node(
+                            "ReturnStatement",
+                            None,
+                            self.node(
+                                "BinaryExpression",
+                                None,
+                                self.identifier("a0"),
+                                self.node("PlusToken"),
+                                self.node("FirstLiteralToken", str(k)),
+                            ),
+                        ),
+                    ),
+                ),
+                self.node(
+                    "ReturnStatement",
+                    None,
+                    self.node(
+                        "PropertyAccessExpression",
+                        None,
+                        self.node("CallExpression", None, self.identifier("toString")),
+                        self.identifier("length"),
+                    ),
+                ),
+            ),
+        )
+
+    def namespaces(
+        self, depth: int, classes: List[int], methods: int, indent: int
+    ) -> Dict:
+        """depth 层嵌套的 namespace，classes 全放在最里面"""
+        name = f"Ns{indent}"
+        self.write(indent, f"namespace {name} {{")
+        if depth > 1:
+            members = [self.namespaces(depth - 1, classes, methods, indent + 1)]
+        else:
+            members = [self.klass(i, methods, indent + 1) for i in classes]
+        self.write(indent, "}")
+        return self.node(
+            "ModuleDeclaration",
+            name,
+            self.identifier(name),
+            self.node("ModuleBlock", None, *members),
+        )
+
+
+def generate_corpus(shape: Shape) -> Tuple[str, Dict]:
+    """
+    按形状生成语料
+    Args:
+        shape (Shape): 语料形状
+
+    Returns:
+        Tuple[str, Dict]: (TS 源码, 形状相同的合成 AnalyzedJSON)
+    """
+    corpus = _Corpus(shape["seed"])
+    deep = round(shape["classes"] * shape["deep_ratio"]) if shape["depth"] else 0
+    statements = [
+        corpus.klass(i, shape["methods"], 0) for i in range(shape["classes"] - deep)
+    ]
+    if deep:
+        statements.append(
+            corpus.namespaces(
+                shape["depth"],
+                list(range(shape["classes"] - deep, shape["classes"])),
+                shape["methods"],
+                0,
+            )
+        )
+    analyzed = {
+        "AnalyzedAST": {"statements": statements},
+        "Metadata": {"parseInfo": {"parserVersion": "synthetic"}},
+        "compilerMetadata": {},
+    }
+    return "\n".join(corpus.lines) + "\n", analyzed
+
+
+def write_nested_chain(path: Path, depth: int) -> int:
+    """
+    写一份 depth 层嵌套的合成 AnalyzedJSON：每层一个 CallExpression，
+    子节点是里面那一层和一个 Identifier。边拼边写，不用 `json.dumps` 整棵树（它是递归的）
+
+    Returns:
+        int: 节点数
+    """
+
+    def statement(index: int, kind: str, name: str) -> str:
+        # 去掉结尾的 "}"，后面还要接 children
+        fields = {"id": index, "statementType": kind, "name": name}
+        fields["location"] = {"start": 0, "end": 0}
+        return json.dumps(fields)[:-1]
+
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('{"AnalyzedAST": {"statements": [')
+        for level in range(depth):
+            f.write(statement(2 * level, "CallExpression", f"call{level}"))
+            f.write(', "children": [' if level < depth - 1 else "}")
+        for level in range(depth - 2, -1, -1):
+            f.write(", " + statement(2 * level + 1, "Identifier", f"arg{level}") + "}]}")
+        f.write(']}, "Metadata": {}, "compilerMetadata": {}}')
+    return 2 * depth - 1
+
+
+def run_nesting(
+    depths: Tuple[int, ...] = NESTING_DEPTHS,
+    render_options: Optional[Dict] = None,
+    workdir: Optional[str] = None,
+) -> Dict[int, Dict[str, float]]:
+    """
+    嵌套深度压力测试
+    Args:
+        depths = NESTING_DEPTHS (Tuple[int, ...], optional): 要测的深度
+        render_options = None (Dict, optional): 传给 `DrawIOGenerator` 的参数
+        workdir = "tmp/benchmark/work" (str, optional): 语料和输出放哪
+
+    Returns:
+        Dict[int, Dict[str, float]]: 深度 -> {"nodes", 各阶段耗时（秒）}
+    """
+    workdir = Path(workdir or base_dir / "tmp" / "benchmark" / "work")
+    workdir.mkdir(parents=True, exist_ok=True)
+    parser = CodeParser()
+    results = {}
+    for depth in depths:
+        analyzed = workdir / f"nesting-{depth}.json"
+        nodes = write_nested_chain(analyzed, depth)
+        started = time.perf_counter()
+        standardized = parser._standardize_file(analyzed)
+        timings = {"nodes": nodes, "load": time.perf_counter() - started}
+
+        generator = DrawIOGenerator(**(render_options or {}))
+        with contextlib.redirect_stdout(io.StringIO()):
+            generator.generate_drawio(standardized, str(workdir / f"nesting-{depth}.drawio"))
+        timings.update(generator.timings)
+        results[depth] = timings
+        logger.info(f"nesting {depth}: {format_phases(generator.timings)}")
+    return results
+
+
+def check_linear(
+    results: Dict[int, Dict[str, float]], slowdown: float = NESTING_SLOWDOWN
+) -> List[str]:
+    """
+    `run_nesting` 的结果是不是线性的
+    Returns:
+        List[str]: 每个节点比最浅的那次慢过 slowdown 倍的深度，空就是线性的
+    """
+
+    def per_node(timings: Dict[str, float]) -> float:
+        return sum(v for k, v in timings.items() if k != "nodes") / timings["nodes"]
+
+    shallowest = per_node(results[min(results)])
+    return [
+        f"depth {depth}: {per_node(timings) * 1e6:.1f}us/node "
+        f"({per_node(timings) / shallowest:.1f}x depth {min(results)})"
+        for depth, timings in results.items()
+        if per_node(timings) > shallowest * slowdown
+    ]
+
+
+def _imported_modules(command: List[str], env: Optional[Dict[str, str]] = None) -> List[str]:
+    """`python -X importtime` 跑一遍命令，返回导入过的模块"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", *command],
+        capture_output=True,
+        text=True,
+        cwd=str(base_dir),
+        env=env,
+    )
+    modules = []
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if line.startswith("import time:") and "|" in line:
+            modules.append(line.rsplit("|", 1)[1].strip())
+    return modules
+
+
+def run_startup(repeat: int = 5, workdir: Optional[str] = None) -> Dict:
+    """
+    `main.py` 的启动时间
+    Args:
+        repeat = 5 (int, optional): 每项跑几遍取中位数
+        workdir = "tmp/benchmark/work" (str, optional): 语料、输出和缓存放哪
+            （解析缓存、布局缓存每次都从空的开始，不用仓库 tmp/ 里的）
+
+    Returns:
+        Dict: `{"help": 秒, "cache_hit": 秒, "eager": [--help 导入了的 STARTUP_LAZY 模块],
+            "eager_cache_hit": [缓存命中时导入了的 STARTUP_LAZY_CACHE_HIT 模块]}`
+    """
+    from core.parse_cache import CACHE_DIR_ENV, ParseCache
+
+    workdir = Path(workdir or base_dir / "tmp" / "benchmark" / "work")
+    workdir.mkdir(parents=True, exist_ok=True)
+    cache_root = workdir / "cache"
+    shutil.rmtree(cache_root, ignore_errors=True)
+    env = {**os.environ, CACHE_DIR_ENV: str(cache_root)}
+
+    # 先把合成的解析结果放进缓存，main.py 就不会去跑 Node
+    source_text, analyzed = generate_corpus(SCENARIOS["small"])
+    source = workdir / "startup.ts"
+    source.write_text(source_text, encoding="utf-8")
+    parser = CodeParser()
+    path, _, parser_path, parser_dir = parser._resolve(str(source))
+    ParseCache(str(cache_root / "parse_cache")).put(
+        parser._cache_key(path, parser_path, parser_dir), analyzed
+    )
+
+    commands = {
+        "help": [str(base_dir / "main.py"), "--help"],
+        "cache_hit": [
+            str(base_dir / "main.py"),
+            str(source),
+            "-o",
+            str(workdir / "startup.drawio"),
+        ],
+    }
+    results: Dict = {}
+    for name, command in commands.items():
+        runs = []
+        # 第一遍只是预热（.pyc、布局缓存）
+        for _ in range(repeat + 1):
+            started = time.perf_counter()
+            subprocess.run(
+                [sys.executable, *command],
+                capture_output=True,
+                check=True,
+                cwd=str(base_dir),
+                env=env,
+            )
+            runs.append(time.perf_counter() - started)
+        results[name] = statistics.median(runs[1:])
+    imported = set(_imported_modules(commands["help"], env))
+    results["eager"] = [module for module in STARTUP_LAZY if module in imported]
+    imported = set(_imported_modules(commands["cache_hit"], env))
+    results["eager_cache_hit"] = [
+        module for module in STARTUP_LAZY_CACHE_HIT if module in imported
+    ]
+    return results
+
+
+def check_startup(results: Dict, budgets: Dict[str, float] = STARTUP_BUDGETS) -> List[str]:
+    """
+    `run_startup` 的结果是不是在预算内
+    Returns:
+        List[str]: 超出预算的项，空就是都没超
+    """
+    over = [
+        f"{name}: {results[name]:.3f}s (budget {budget:.3f}s)"
+        for name, budget in budgets.items()
+        if results[name] > budget
+    ]
+    if results["eager"]:
+        over.append(f"help imports {', '.join(results['eager'])}")
+    if results["eager_cache_hit"]:
+        over.append(f"cache_hit imports {', '.join(results['eager_cache_hit'])}")
+    return over
+
+
+def _run_once(
+    name: str,
+    shape: Shape,
+    workdir: Path,
+    use_analyzer: bool,
+    format: str,
+    render_options: Dict,
+) -> Tuple[Dict[str, float], int, int]:
+    """跑一遍完整流程，返回 (各阶段耗时, 节点数, 输出字节数)"""
+    source_text, analyzed = generate_corpus(shape)
+    source = workdir / f"{name}.ts"
+    source.write_text(source_text, encoding="utf-8")
+
+    parser = CodeParser(use_worker=True, format=format)
+    timings = {}
+    try:
+        if use_analyzer:
+            empty = workdir / "empty.ts"
+            empty.write_text("", encoding="utf-8")
+            parser_path = base_dir / CodeParser.parserList["ts"]
+            worker = parser._get_worker(parser_path, base_dir)
+            analyzed_path = workdir / f"{name}.analyzed"
+
+            started = time.perf_counter()
+            worker.request(str(empty.resolve()), out=str(analyzed_path), format=format)
+            timings["spawn"] = time.perf_counter() - started
+
+            # `CodeParser` 边收边读，这里先落盘，分析和读结果才分得开
+            started = time.perf_counter()
+            worker.request(str(source.resolve()), out=str(analyzed_path), format=format)
+            timings["analysis"] = time.perf_counter() - started
+        else:
+            analyzed_path = workdir / f"{name}.synthetic.json"
+            analyzed_path.write_text(json.dumps(analyzed), encoding="utf-8")
+
+        started = time.perf_counter()
+        standardized = parser._standardize_file(analyzed_path)
+        timings["load"] = time.perf_counter() - started
+    finally:
+        parser.close()
+
+    output = workdir / f"{name}.drawio"
+    generator = DrawIOGenerator(**render_options)
+    with contextlib.redirect_stdout(io.StringIO()):
+        generator.generate_drawio(standardized, str(output))
+    timings.update(generator.timings)
+    return timings, len(standardized["nodes"].table), os.path.getsize(output)
+
+
+def run_benchmarks(
+    scenarios: Dict[str, Shape],
+    repeat: int = 3,
+    use_analyzer: bool = True,
+    format: str = "json",
+    render_options: Optional[Dict] = None,
+    workdir: Optional[str] = None,
+) -> Dict:
+    """
+    跑一组场景
+    Args:
+        scenarios (Dict[str, Shape]): 场景名 -> 语料形状
+        repeat = 3 (int, optional): 每个场景跑几遍，各阶段取中位数
+        use_analyzer = True (bool, optional): 真的跑解析器；False 时用合成的解析结果，没有 spawn、analysis
+        format = "json" (str, optional): 解析器输出格式
+        render_options = None (Dict, optional): 传给 `DrawIOGenerator` 的参数
+        workdir = "tmp/benchmark/work" (str, optional): 语料和输出放哪
+
+    Returns:
+        Dict: 基线格式的结果（见 `save_baseline`）
+    """
+    workdir = Path(workdir or base_dir / "tmp" / "benchmark" / "work")
+    workdir.mkdir(parents=True, exist_ok=True)
+    render_options = render_options or {}
+
+    results = {}
+    for name, shape in scenarios.items():
+        runs = []
+        for _ in range(repeat):
+            timings, nodes, size = _run_once(
+                name, shape, workdir, use_analyzer, format, render_options
+            )
+            runs.append(timings)
+        results[name] = {
+            "shape": shape,
+            "nodes": nodes,
+            "bytes": size,
+            "phases": {
+                phase: statistics.median(run[phase] for run in runs)
+                for phase in PHASES
+                if phase in runs[0]
+            },
+        }
+        logger.info(f"{name}: {format_phases(results[name]['phases'])}")
+
+    return {
+        "version": BASELINE_VERSION,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "machine": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "processor": platform.processor() or platform.machine(),
+        },
+        "settings": {
+            "repeat": repeat,
+            "analyzer": use_analyzer,
+            "format": format,
+            "render_options": render_options,
+        },
+        "scenarios": results,
+    }
+
+
+def format_phases(phases: Dict[str, float]) -> str:
+    return " | ".join(
+        f"{phase} {seconds * 1000:.1f}ms" for phase, seconds in phases.items()
+    )
+
+
+def save_baseline(results: Dict, path: str):
+    """
+    存成 JSON 基线：
+    `{"version", "created", "machine", "settings", "scenarios": {名字: {"shape", "nodes", "bytes", "phases": {阶段: 秒}}}}`
+    """
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+
+
+def compare(
+    results: Dict, baseline: Dict, threshold: float = 0.2, min_delta: float = 0.005
+) -> List[str]:
+    """
+    和基线比
+    Args:
+        results (Dict): `run_benchmarks` 的结果
+        baseline (Dict): 之前存下的基线
+        threshold = 0.2 (float, optional): 比基线慢多少（比例）算退化
+        min_delta = 0.005 (float, optional): 绝对差小于这么多秒的不算，毫秒级的阶段噪声太大
+
+    Returns:
+        List[str]: 退化的描述，空就是没有退化
+    """
+    if baseline.get("version") != BASELINE_VERSION:
+        raise ValueError(f"Unsupported baseline version: {baseline.get('version')}")
+    # 跑几遍只影响噪声，别的设置不同结果就不可比
+    settings = {k: v for k, v in results["settings"].items() if k != "repeat"}
+    previous_settings = {
+        k: v for k, v in baseline.get("settings", {}).items() if k != "repeat"
+    }
+    if settings != previous_settings:
+        logger.warning(f"Baseline settings differ: {previous_settings} vs {settings}")
+
+    regressions = []
+    for name, current in results["scenarios"].items():
+        previous = baseline["scenarios"].get(name)
+        if previous is None:
+            logger.warning(f"{name}: not in baseline, skipped")
+            continue
+        if previous["shape"] != current["shape"]:
+            logger.warning(f"{name}: corpus shape changed since the baseline, skipped")
+            continue
+        for phase, seconds in current["phases"].items():
+            before = previous["phases"].get(phase)
+            if before is None:
+                continue
+            if seconds > before * (1 + threshold) and seconds - before > min_delta:
+                regressions.append(
+                    f"{name}.{phase}: {before * 1000:.1f}ms -> {seconds * 1000:.1f}ms "
+                    f"(+{(seconds / before - 1) * 100 if before else float('inf'):.0f}%)"
+                )
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    default_baseline = str(base_dir / "tmp" / "benchmark" / "baseline.json")
+    parser = argparse.ArgumentParser(
+        prog="python -m core.benchmark",
+        description="Time every pipeline phase on a synthetic TS corpus",
+    )
+    parser.add_argument(
+        "--scenario",
+        action="append",
+        choices=sorted(SCENARIOS),
+        help="Scenario to run (repeatable, default: all)",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=3, help="Runs per scenario (median is kept)"
+    )
+    parser.add_argument(
+        "--skip-analyzer",
+        action="store_true",
+        help="Feed a synthetic analyzer result instead of running Node "
+        "(no spawn/analysis phases)",
+    )
+    parser.add_argument("--format", choices=("json", "compact"), default="json")
+    parser.add_argument("--writer", choices=("drawpyo", "stream"), default="stream")
+    parser.add_argument("--output", help="Also write the results to this JSON file")
+    parser.add_argument(
+        "--save-baseline",
+        nargs="?",
+        const=default_baseline,
+        help=f"Save the results as the baseline (default: {default_baseline})",
+    )
+    parser.add_argument(
+        "--compare",
+        nargs="?",
+        const=default_baseline,
+        help="Compare with a baseline and exit with 1 on regressions",
+    )
+    parser.add_argument(
+        "--nesting",
+        action="store_true",
+        help=f"Run the nesting stress test (depths {', '.join(map(str, NESTING_DEPTHS))}) "
+        "instead of the scenarios; exits with 1 unless time grows linearly",
+    )
+    parser.add_argument(
+        "--startup",
+        action="store_true",
+        help="Time `main.py --help` and a parse-cache-hit run instead of the scenarios; "
+        "exits with 1 when over budget or when --help imports heavy modules",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="Slowdown ratio that counts as a regression (default: 0.2 = 20%%)",
+    )
+    args = parser.parse_args(argv)
+
+    if args.nesting:
+        nesting = run_nesting(render_options={"writer": args.writer})
+        for depth, timings in nesting.items():
+            phases = {k: v for k, v in timings.items() if k != "nodes"}
+            print(f"depth {depth:>6} {timings['nodes']:>8} nodes  {format_phases(phases)}")
+        slow = check_linear(nesting)
+        if slow:
+            print("Not linear:\n  " + "\n  ".join(slow))
+            return 1
+        print(f"Linear within {NESTING_SLOWDOWN:.1f}x per node")
+        return 0
+
+    if args.startup:
+        startup = run_startup(repeat=max(args.repeat, 5))
+        for name, budget in STARTUP_BUDGETS.items():
+            print(f"{name:10} {startup[name]:.3f}s  (budget {budget:.3f}s)")
+        over = check_startup(startup)
+        if over:
+            print("Over budget:\n  " + "\n  ".join(over))
+            return 1
+        print("Startup within budget")
+        return 0
+
+    scenarios = {name: SCENARIOS[name] for name in args.scenario or SCENARIOS}
+    results = run_benchmarks(
+        scenarios,
+        repeat=args.repeat,
+        use_analyzer=not args.skip_analyzer,
+        format=args.format,
+        render_options={"writer": args.writer},
+    )
+    for name, result in results["scenarios"].items():
+        print(f"{name:8} {result['nodes']:>8} nodes  {format_phases(result['phases'])}")
+
+    if args.output:
+        save_baseline(results, args.output)
+    if args.save_baseline:
+        save_baseline(results, args.save_baseline)
+        print(f"Baseline saved to {args.save_baseline}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print("Regressions:\n  " + "\n  ".join(regressions))
+            return 1
+        print(f"No regressions over {args.threshold:.0%} against {args.compare}")
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+    )
+    sys.exit(main())
@@ -0,0 +1,104 @@
+"""
+解析器紧凑二进制格式（`--format compact`）的读取端，格式定义见
+ts-js.parser/index.ts 的 `encodeCompact`
+
+吐出来的 (section, 值) 和 `core.ast_stream.iter_analyzed` 一样，
+所以 `CodeParser._standardize_events` 两种格式通吃
+"""
+
+# sys
+from pathlib import Path
+import struct
+import json
+
+# lib function
+from typing import Any, Dict, Iterator, List, Tuple
+
+MAGIC = b"CFAB"
+VERSION = 1
+NONE = 0xFFFFFFFF
+# 放在末尾 JSON 里的 AnalyzedAST 部分
+LINK_KEYS = ("imports", "exports", "relations")
+
+_U16 = struct.Struct("<H")
+_U32 = struct.Struct("<I")
+# 父节点序号, statementType, name, start, end
+_RECORD = struct.Struct("<IIIII")
+
+
+def is_compact(head: bytes) -> bool:
+    """看文件开头判断是不是紧凑格式"""
+    return head[:4] == MAGIC
+
+
+def iter_compact(data: bytes) -> Iterator[Tuple[str, Any]]:
+    """
+    解码紧凑格式
+    Args:
+        data (bytes): 解析器输出的全部字节
+
+    Returns:
+        Iterator[Tuple[str, Any]]: 每个顶层 statement 一条 ("AnalyzedAST.statements[]", 节点)，
+            然后是 "Metadata"、"compilerMetadata"，
+            最后是 imports / exports / relations 的每一项（旧的解析器写的文件里没有）
+    """
+    view = memoryview(data)
+    if not is_compact(data):
+        raise ValueError("Not a compact analyzer output")
+    (version,) = _U16.unpack_from(view, 4)
+    if version > VERSION:
+        raise ValueError(f"Compact format v{version} is newer than this reader (v{VERSION})")
+    offset = 6
+
+    (string_count,) = _U32.unpack_from(view, offset)
+    offset += 4
+    strings: List[str] = []
+    for _ in range(string_count):
+        (length,) = _U32.unpack_from(view, offset)
+        offset += 4
+        strings.append(str(view[offset : offset + length], "utf-8"))
+        offset += length
+
+    (node_count,) = _U32.unpack_from(view, offset)
+    offset += 4
+    # 只留当前顶层 statement 的节点，吐出去就丢
+    current: Dict[int, Dict] = {}
+    top = None
+    for index in range(node_count):
+        (record_length,) = _U16.unpack_from(view, offset)
+        parent, kind, name, start, end = _RECORD.unpack_from(view, offset + 2)
+        offset += 2 + record_length
+
+        node = {
+            "id": index,
+            "statementType": strings[kind],
+            "location": {"start": start, "end": end},
+        }
+        if name != NONE:
+            node["name"] = strings[name]
+
+        if parent == NONE:
+            if top is not None:
+                yield "AnalyzedAST.statements[]", top
+            top = node
+            current = {index: node}
+        else:
+            current[parent].setdefault("children", []).append(node)
+            current[index] = node
+    if top is not None:
+        yield "AnalyzedAST.statements[]", top
+
+    (meta_length,) = _U32.unpack_from(view, offset)
+    offset += 4
+    meta = json.loads(str(view[offset : offset + meta_length], "utf-8"))
+    yield "Metadata", meta.get("Metadata", {})
+    yield "compilerMetadata", meta.get("compilerMetadata", {})
+    for key in LINK_KEYS:
+        for item in meta.get(key) or ():
+            yield f"AnalyzedAST.{key}[]", item
+
+
+def read_compact_file(path: Path) -> Iterator[Tuple[str, Any]]:
+    with open(path, "rb") as f:
+        data = f.read()
+    return iter_compact(data)
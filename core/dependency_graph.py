@@ -0,0 +1,479 @@
+"""
+跨文件的依赖图：import / export 解析到文件，extends / implements 解析到声明
+
+图存成 CSR（压缩邻接表）：顶点 v 的出边是 `targets[offsets[v]:offsets[v + 1]]`，
+两个 `array("i")`，几万条边也只占几百 KB，遍历时不建每条边一个的对象。在这上面：
+    strongly_connected  Tarjan 求强连通分量（循环依赖），显式栈，O(V+E)
+    layering            缩点后按最长路分层，import 别人的在上层，O(V+E)
+    order_layers        层内按上一层的重心排序，减少连线交叉
+
+只解析相对路径的 import（`./a`、`../b/index`），按 TS 的规则试后缀；
+包名（`react`）和 tsconfig 的 paths 别名算外部模块，不进图
+"""
+
+# sys
+from array import array
+import posixpath
+
+# lib function
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple, TypedDict
+
+from core.ast_model import NONE, NodeList, NodeTable
+
+# 按顺序试的后缀
+MODULE_SUFFIXES = (".ts", ".tsx", ".d.ts", ".js", ".jsx", ".mjs", ".cjs")
+# TS 里 "./a.js" 指的可能是 a.ts
+_JS_SUFFIXES = {".js": (".ts", ".tsx"), ".jsx": (".tsx",), ".mjs": (".mts",), ".cjs": (".cts",)}
+
+# 有名字、会出现在限定名里的节点（同解析器的 `declarationName`）
+NAMED_KINDS = frozenset(
+    (
+        "ClassDeclaration",
+        "ClassExpression",
+        "FunctionDeclaration",
+        "FunctionExpression",
+        "MethodDeclaration",
+        "MethodSignature",
+        "GetAccessor",
+        "SetAccessor",
+        "InterfaceDeclaration",
+        "TypeAliasDeclaration",
+        "EnumDeclaration",
+        "EnumMember",
+        "ModuleDeclaration",
+        "VariableDeclaration",
+        "PropertyDeclaration",
+        "PropertySignature",
+    )
+)
+
+
+class Graph:
+    """CSR 邻接表，顶点是 0..count-1"""
+
+    __slots__ = ("count", "offsets", "targets", "edge_ids")
+
+    def __init__(self, count: int, offsets: array, targets: array, edge_ids: array):
+        self.count = count
+        self.offsets = offsets
+        self.targets = targets
+        # CSR 里第 k 条边是建图时传进来的第 edge_ids[k] 条，按它找边上附带的信息
+        self.edge_ids = edge_ids
+
+    @classmethod
+    def from_edges(cls, count: int, sources: Sequence[int], targets: Sequence[int]) -> "Graph":
+        """
+        按起点计数排序建图，O(V+E)，同一起点的边保持传入的顺序
+        Args:
+            count (int): 顶点数
+            sources, targets (Sequence[int]): 第 i 条边是 sources[i] -> targets[i]
+        """
+        offsets = array("i", [0]) * (count + 1)
+        for source in sources:
+            offsets[source + 1] += 1
+        for v in range(count):
+            offsets[v + 1] += offsets[v]
+        cursor = offsets[:-1]
+        out = array("i", [0]) * len(sources)
+        edge_ids = array("i", [0]) * len(sources)
+        for edge, (source, target) in enumerate(zip(sources, targets)):
+            k = cursor[source]
+            cursor[source] = k + 1
+            out[k] = target
+            edge_ids[k] = edge
+        return cls(count, offsets, out, edge_ids)
+
+    def __len__(self) -> int:
+        return self.count
+
+    @property
+    def edge_count(self) -> int:
+        return len(self.targets)
+
+    def successors(self, v: int) -> array:
+        return self.targets[self.offsets[v] : self.offsets[v + 1]]
+
+    def edges(self) -> Iterator[Tuple[int, int, int]]:
+        """(起点, 终点, 建图时的边号)，按起点排"""
+        offsets, targets, edge_ids = self.offsets, self.targets, self.edge_ids
+        for v in range(self.count):
+            for k in range(offsets[v], offsets[v + 1]):
+                yield v, targets[k], edge_ids[k]
+
+
+def strongly_connected(graph: Graph) -> Tuple[array, int]:
+    """
+    Tarjan 强连通分量，用显式栈，不受递归深度限制
+
+    Returns:
+        Tuple[array, int]: (每个顶点的分量号, 分量数)；
+            分量按完成的先后编号，有 u -> v 跨分量的边时总有 component[u] > component[v]
+    """
+    n = graph.count
+    offsets, targets = graph.offsets, graph.targets
+    order = array("i", [-1]) * n  # 访问序号
+    low = array("i", [0]) * n
+    component = array("i", [-1]) * n
+    stack: List[int] = []
+    visited = count = 0
+
+    for root in range(n):
+        if order[root] >= 0:
+            continue
+        order[root] = low[root] = visited
+        visited += 1
+        stack.append(root)
+        # (顶点, 下一条要看的边)
+        work = [(root, offsets[root])]
+        while work:
+            v, k = work[-1]
+            end = offsets[v + 1]
+            while k < end:
+                w = targets[k]
+                k += 1
+                if order[w] < 0:
+                    work[-1] = (v, k)
+                    order[w] = low[w] = visited
+                    visited += 1
+                    stack.append(w)
+                    work.append((w, offsets[w]))
+                    break
+                if component[w] < 0 and order[w] < low[v]:
+                    # w 还在栈上
+                    low[v] = order[w]
+            else:
+                work.pop()
+                if low[v] == order[v]:
+                    while True:
+                        w = stack.pop()
+                        component[w] = count
+                        if w == v:
+                            break
+                    count += 1
+                if work:
+                    parent = work[-1][0]
+                    if low[v] < low[parent]:
+                        low[parent] = low[v]
+    return component, count
+
+
+def layering(graph: Graph, component: Optional[array] = None, count: int = 0) -> array:
+    """
+    分层：u -> v 跨分量的边总有 layer[u] < layer[v]，同一个强连通分量的顶点同层，
+    没有入边的分量在第 0 层；就是缩点后的最长路
+    Args:
+        graph (Graph): 图
+        component = None (array, optional): `strongly_connected` 的结果，没给就现算
+        count = 0 (int, optional): 分量数，和 component 一起给
+
+    Returns:
+        array: 每个顶点的层号
+    """
+    if component is None:
+        component, count = strongly_connected(graph)
+    n = graph.count
+    offsets, targets = graph.offsets, graph.targets
+    # 按分量分桶（计数排序）
+    start = array("i", [0]) * (count + 1)
+    for v in range(n):
+        start[component[v] + 1] += 1
+    for c in range(count):
+        start[c + 1] += start[c]
+    cursor = start[:-1]
+    members = array("i", [0]) * n
+    for v in range(n):
+        members[cursor[component[v]]] = v
+        cursor[component[v]] += 1
+
+    # 分量号倒着扫就是拓扑序，不用再跑一遍 Kahn
+    level = array("i", [0]) * count
+    for c in range(count - 1, -1, -1):
+        below = level[c] + 1
+        for m in range(start[c], start[c + 1]):
+            v = members[m]
+            for k in range(offsets[v], offsets[v + 1]):
+                d = component[targets[k]]
+                if d != c and level[d] < below:
+                    level[d] = below
+    return array("i", (level[component[v]] for v in range(n)))
+
+
+def order_layers(graph: Graph, layer: Sequence[int]) -> List[List[int]]:
+    """
+    每层的顶点排个顺序：从上往下，按指向它的顶点在各自层里的相对位置的平均值（重心）排，
+    没有入边的排在最前面（按编号）
+    Returns:
+        List[List[int]]: 第 i 项是第 i 层从左到右的顶点
+    """
+    n = graph.count
+    depth = max(layer, default=-1) + 1
+    layers: List[List[int]] = [[] for _ in range(depth)]
+    for v in range(n):
+        layers[layer[v]].append(v)
+
+    offsets, targets = graph.offsets, graph.targets
+    weight = [0.0] * n
+    incoming = array("i", [0]) * n
+    for row in layers:
+        row.sort(key=lambda v: (weight[v] / incoming[v]) if incoming[v] else 0.0)
+        size = len(row)
+        for position, v in enumerate(row):
+            relative = (position + 0.5) / size
+            for k in range(offsets[v], offsets[v + 1]):
+                w = targets[k]
+                if layer[w] > layer[v]:
+                    weight[w] += relative
+                    incoming[w] += 1
+    return layers
+
+
+def _candidates(base: str) -> Iterator[str]:
+    """模块说明符（已经拼成相对 root 的路径）可能对应的文件"""
+    yield base
+    stem, suffix = posixpath.splitext(base)
+    for alternative in _JS_SUFFIXES.get(suffix, ()):
+        yield stem + alternative
+    for suffix in MODULE_SUFFIXES:
+        yield base + suffix
+    for suffix in MODULE_SUFFIXES:
+        yield f"{base}/index{suffix}"
+
+
+def resolve_module(importer: str, specifier: str, files: Dict[str, int]) -> Optional[int]:
+    """
+    Args:
+        importer (str): 写 import 的文件（相对 root 的 posix 路径）
+        specifier (str): 模块说明符
+        files (Dict[str, int]): 文件 -> 顶点号
+
+    Returns:
+        Optional[int]: 解析到的文件，包名和找不到的是 None
+    """
+    if not specifier.startswith("."):
+        return None
+    base = posixpath.normpath(posixpath.join(posixpath.dirname(importer), specifier))
+    for candidate in _candidates(base):
+        found = files.get(candidate)
+        if found is not None:
+            return found
+    return None
+
+
+def declaration_names(table: NodeTable) -> Dict[str, int]:
+    """
+    限定名 -> 节点下标；限定名是外层具名声明的名字用 "." 连起来（同解析器 idMap 的 path + name），
+    重名取先出现的
+    """
+    # 父节点下标总比子节点小，正着扫一遍就能接上父节点的限定名
+    prefixes: List[str] = [""] * len(table)
+    names: Dict[str, int] = {}
+    parent = table.parent
+    for index in range(len(table)):
+        prefix = prefixes[parent[index]] if parent[index] != NONE else ""
+        name = table.field(index, "name")
+        if name and table.field(index, "kind") in NAMED_KINDS:
+            prefix = f"{prefix}.{name}" if prefix else name
+            names.setdefault(prefix, index)
+        prefixes[index] = prefix
+    return names
+
+
+class Relation(TypedDict):
+    source: int  # 文件
+    source_node: int  # 在这个文件的 NodeTable 里的下标
+    kind: str  # "extends" / "implements"
+    target: int
+    target_node: int
+
+
+class DependencyGraph:
+    """
+    一批文件的依赖图
+        results     各文件的 `CodeParser` 结果（nodes 统一成 `NodeList`）
+        files       文件（相对 root 的 posix 路径），顶点 v 就是 files[v]
+        imports     文件 -> 它 import 的文件，同一对文件只有一条边
+        names       imports 的第 i 条边（`Graph.edge_ids` 里的号）带进来的名字
+        relations   两端都解析到了的 extends / implements
+        external    每个文件 import 的、不在这批文件里的模块
+        component   `strongly_connected` 的结果，分量里不止一个文件的就是循环依赖
+        layer       `layering` 的结果
+    """
+
+    def __init__(self, results: Iterable[Tuple[str, Dict]]):
+        """
+        Args:
+            results (Iterable[Tuple[str, Dict]]): (文件, `CodeParser` 的结果)，
+                文件是相对同一个 root 的路径（带后缀）
+        """
+        self.files: List[str] = []
+        self.results: List[Dict] = []
+        for name, result in results:
+            if not isinstance(result["nodes"], NodeList):
+                result = {**result, "nodes": NodeTable.from_nodes(result["nodes"]).nodes()}
+            self.files.append(name.replace("\\", "/"))
+            self.results.append(result)
+        index = {name: v for v, name in enumerate(self.files)}
+
+        # 每个文件：说明符 -> 文件、本地名 -> import、对外的名字 -> export、`export *` 的文件
+        self._modules: List[Dict[str, Optional[int]]] = []
+        self._imports: List[Dict[str, Dict]] = []
+        self._exports: List[Dict[str, Dict]] = []
+        self._stars: List[List[int]] = []
+        self._declarations: List[Optional[Dict[str, int]]] = [None] * len(self.files)
+        self.external: List[List[str]] = []
+
+        sources: List[int] = []
+        targets: List[int] = []
+        self.names: List[List[str]] = []
+        for v, (name, result) in enumerate(zip(self.files, self.results)):
+            modules: Dict[str, Optional[int]] = {}
+            links = (result.get("imports") or []) + (result.get("exports") or [])
+            for link in links:
+                specifier = link.get("module")
+                if specifier is not None and specifier not in modules:
+                    modules[specifier] = resolve_module(name, specifier, index)
+            self._modules.append(modules)
+            self.external.append([s for s, target in modules.items() if target is None])
+
+            edges: Dict[int, List[str]] = {}
+            for link in links:
+                target = modules.get(link.get("module"))
+                if target is not None and target != v:
+                    imported = edges.setdefault(target, [])
+                    if link.get("name"):
+                        imported.append(link.get("alias") or link["name"])
+            for target, imported in edges.items():
+                sources.append(v)
+                targets.append(target)
+                self.names.append(imported)
+
+            self._imports.append(
+                {
+                    link.get("alias") or link["name"]: link
+                    for link in result.get("imports") or []
+                    if link.get("name")
+                }
+            )
+            exports: Dict[str, Dict] = {}
+            stars: List[int] = []
+            for link in result.get("exports") or []:
+                if link.get("name") == "*" and not link.get("alias"):
+                    target = modules.get(link.get("module"))
+                    if target is not None:
+                        stars.append(target)
+                else:
+                    exports.setdefault(link.get("alias") or link.get("name"), link)
+            self._exports.append(exports)
+            self._stars.append(stars)
+
+        self.imports = Graph.from_edges(len(self.files), sources, targets)
+        self.component, self.components = strongly_connected(self.imports)
+        self.layer = layering(self.imports, self.component, self.components)
+        self.relations: List[Relation] = list(self._resolve_relations())
+
+    def cycles(self) -> List[List[int]]:
+        """循环依赖：不止一个文件的强连通分量，每个按文件顺序"""
+        members: Dict[int, List[int]] = {}
+        for v in range(len(self.files)):
+            members.setdefault(self.component[v], []).append(v)
+        return [group for group in members.values() if len(group) > 1]
+
+    def declarations(self, file: int) -> Dict[str, int]:
+        """`declaration_names`，用到时才算"""
+        names = self._declarations[file]
+        if names is None:
+            names = self._declarations[file] = declaration_names(
+                self.results[file]["nodes"].table
+            )
+        return names
+
+    def _exported(self, file: int, name: str) -> Optional[Tuple[int, str]]:
+        """file 对外的 name 是哪个文件里的哪个本地名（顺着 `export ... from` 找）"""
+        stack, seen = [(file, name)], set()
+        while stack:
+            file, name = stack.pop()
+            if (file, name) in seen:
+                continue
+            seen.add((file, name))
+            link = self._exports[file].get(name)
+            if link is None:
+                stack.extend((target, name) for target in reversed(self._stars[file]))
+            elif link.get("module") is None:
+                return file, link["name"]
+            else:
+                target = self._modules[file].get(link["module"])
+                if target is not None:
+                    if link["name"] == "*":
+                        # export * as ns from：ns 自己不是声明
+                        return None
+                    stack.append((target, link["name"]))
+        return None
+
+    def lookup(self, file: int, name: str) -> Optional[Tuple[int, int]]:
+        """
+        file 里的一个（可以带 "." 的）名字指向的声明，本地的或者 import 进来的
+        Returns:
+            Optional[Tuple[int, int]]: (文件, 节点下标)，找不到是 None
+        """
+        seen: Set[Tuple[int, str]] = set()
+        while (file, name) not in seen:
+            seen.add((file, name))
+            index = self.declarations(file).get(name)
+            if index is not None:
+                return file, index
+            head, _, rest = name.partition(".")
+            link = self._imports[file].get(head)
+            target = None if link is None else self._modules[file].get(link["module"])
+            if target is None:
+                return None
+            exported = link["name"]
+            if exported == "*":
+                # 命名空间导入：ns.Foo 是对方导出的 Foo
+                if not rest:
+                    return None
+                exported, _, rest = rest.partition(".")
+            found = self._exported(target, exported)
+            if found is None:
+                return None
+            file, local = found
+            name = f"{local}.{rest}" if rest else local
+        return None
+
+    def _resolve_relations(self) -> Iterator[Relation]:
+        for v, result in enumerate(self.results):
+            for relation in result.get("relations") or []:
+                source = self.declarations(v).get(relation["from"])
+                if source is None:
+                    continue
+                target = self._resolve_in_scope(v, relation["from"], relation["to"])
+                if target is not None:
+                    yield {
+                        "source": v,
+                        "source_node": source,
+                        "kind": relation["kind"],
+                        "target": target[0],
+                        "target_node": target[1],
+                    }
+
+    def _resolve_in_scope(self, file: int, scope: str, name: str) -> Optional[Tuple[int, int]]:
+        """从 scope（声明的限定名）所在的作用域往外找 name"""
+        names = self.declarations(file)
+        parts = scope.split(".")[:-1]
+        while parts:
+            index = names.get(".".join(parts + [name]))
+            if index is not None:
+                return file, index
+            parts.pop()
+        return self.lookup(file, name)
+
+
+def local_relations(ast_data: Dict) -> List[Tuple[int, str, int]]:
+    """
+    单个文件里两端都在本文件的 extends / implements
+    Returns:
+        List[Tuple[int, str, int]]: (节点下标, 关系, 节点下标)
+    """
+    if not ast_data.get("relations"):
+        return []
+    graph = DependencyGraph([("input.ts", {**ast_data, "imports": [], "exports": []})])
+    return [(r["source_node"], r["kind"], r["target_node"]) for r in graph.relations]
@@ -1,14 +1,111 @@
-import drawpyo
-from typing import Dict, TypedDict
-import math
+import logging
+import os
+import time
+from itertools import repeat
+from typing import TYPE_CHECKING, Any, Dict, List, Tuple
+from core.ast_model import NONE, NodeList, NodeTable
+from core.layout import LayoutEngine
+from core.layout_cache import LayoutCache
+from core.drawio_writer import CellBuffer, DrawpyoWriter, StyleTable, open_writer
+from core.profiler import Profiler, span
+from core.sharding import Shard, extract, plan_shards
+from core.spatial import SpatialGrid, route
+
+if TYPE_CHECKING:
+    # Imported where they are used: a plain single-file run never needs the
+    # dependency graph (see STARTUP_LAZY in core.benchmark)
+    from core.dependency_graph import DependencyGraph
+
+logger = logging.getLogger(__name__)
+
+# Dependency graph layout: file box width, files per row, declaration rows
+FILE_WIDTH = 280
+GRAPH_COLUMNS = 8
+ENTRY_HEIGHT = 24
+# Top-level declarations listed in a file box (the rest are summarized)
+GRAPH_KINDS = (
+    "ClassDeclaration",
+    "InterfaceDeclaration",
+    "EnumDeclaration",
+    "FunctionDeclaration",
+    "TypeAliasDeclaration",
+    "ModuleDeclaration",
+)
+GRAPH_ENTRIES = 20
+# Diff mode (see core.ast_diff): statuses drawn in their own colour; "context"
+# containers are drawn as usual
+DIFF_STATUSES = ("added", "removed", "changed", "unchanged")
 
 
 class DrawIOGenerator:
-    def __init__(self, display_aspect_ratio: float = 3 / 2, height: float = None):
-        """Initialize with enhanced Palenight Theme styles"""
+    def __init__(
+        self,
+        display_aspect_ratio: float = 3 / 2,
+        height: float = None,
+        writer: str = "drawpyo",
+        compact_styles: bool = False,
+        compress: bool = False,
+        profiler: Profiler = None,
+        shard_by: str = None,
+        page_budget: int = 2000,
+        jobs: int = 1,
+        relations: bool = False,
+        layout_cache: LayoutCache = None,
+        diff: bool = False,
+    ):
+        """Initialize with enhanced Palenight Theme styles
+
+        ``writer`` picks the output backend (see core.drawio_writer): "drawpyo"
+        builds the whole object graph before writing, "stream" writes cells as
+        they are laid out. Both produce the same diagram.
+
+        ``compact_styles`` drops style entries that match draw.io defaults and
+        writes code snippets as bare ``<font>`` markup (the snippet cell style
+        already sets the font). ``compress`` stores the page as the deflated
+        payload draw.io itself writes.
+
+        ``profiler`` (see core.profiler) records the measure/render/write phases
+        and counts the cells and drawpyo objects that were created.
+
+        ``shard_by`` ("declaration", "namespace" or "file", see core.sharding)
+        splits the diagram into pages of at most ``page_budget`` nodes each,
+        preceded by an index page linking to them. With ``jobs`` > 1 the pages
+        are laid out in that many worker processes.
+
+        ``relations`` connects classes and interfaces to what they extend or
+        implement within the same diagram (unsharded only; see
+        core.dependency_graph for the cross-file view).
+
+        ``layout_cache`` (see core.layout_cache) keeps measured sizes and child
+        packings on disk between runs, so rerunning a mostly unchanged file only
+        lays out the subtrees that changed. Sharded pages don't use it.
+
+        ``diff`` draws the merged tree from core.ast_diff: added, removed and
+        changed nodes are outlined in their own colour, renamed ones show
+        ``old → new``, and each unchanged placeholder is a muted dashed box
+        standing for the subtrees folded into it. A legend with the counts
+        goes above the diagram.
+        """
         # colors from Palenight
 
         self.display_aspect_ratio = display_aspect_ratio
+        self.writer = writer
+        self.compact_styles = compact_styles
+        self.compress = compress
+        self.profiler = profiler
+        self.shard_by = shard_by
+        self.page_budget = page_budget
+        self.jobs = jobs
+        self.relations = relations
+        self.layout_cache = layout_cache
+        self.diff = diff
+        # What a worker process needs to lay out one page the same way
+        self._page_options = {
+            "display_aspect_ratio": display_aspect_ratio,
+            "height": height,
+            "compact_styles": compact_styles,
+            "diff": diff,
+        }
 
         self.theme = {
             "background": "#292D3E",
@@ -27,6 +124,10 @@ class DrawIOGenerator:
             "operator": "#89DDFF",
             "function": "#82AAFF",
             "variable": "#EEFFFF",
+            "added": "#C3E88D",
+            "removed": "#FF5370",
+            "changed": "#FFCB6B",
+            "unchanged": "#676E95",
         }
 
         # Enhanced shape styles with more variations
@@ -41,417 +142,760 @@ class DrawIOGenerator:
             "default": "rounded=1;whiteSpace=wrap;html=1;fillColor=#434758;strokeColor=#676E95;fontColor=#EEFFFF;strokeWidth=2;",
         }
 
-    def generate_drawio(self, ast_data: Dict, output_path: str):
-        """Generate hierarchical diagram with nested containers"""
-        doc = drawpyo.File(file_name=output_path)
-        page = drawpyo.Page(file=doc, title="Main")
+        # Every cell refers to one of these by name, so each style string is
+        # normalized and escaped once per generator instead of once per cell
+        self.styles = StyleTable(
+            {
+                "main": "swimlane;whiteSpace=wrap;html=1;movable=1;resizable=1;"
+                "fillColor=none;swimlaneFillColor=none;",
+                "container": self._container_style(False),
+                "container_border": self._container_style(True),
+                "title": f"fillColor=none;fontFamily=Verdana;fontSize=14;"
+                f"fontColor={self.theme['highlight']};html=1;",
+                "snippet": f"fillColor={self.theme['code_bg']};"
+                f"fontColor={self.theme['code_text']};"
+                "fontFamily=Consolas;fontSize=12;"
+                "html=1;whiteSpace=wrap;",
+                "type_text": f"fontColor={self.theme['type']};"
+                "fontFamily=Consolas;fontSize=12;",
+                "item_text": f"fontColor={self.theme['text']};"
+                "fontFamily=Consolas;fontSize=12;",
+                "type_text_right": f"fontColor={self.theme['type']};"
+                "fontFamily=Consolas;fontSize=12;align=right;",
+                "item_text_right": f"fontColor={self.theme['text']};"
+                "fontFamily=Consolas;fontSize=12;align=right;",
+                "dot": None,
+                "index_entry": self.style_map["default"],
+                # Dependency graph: file boxes, their declarations and connectors
+                "file": self._container_style(True),
+                "file_cycle": self._container_style(True).replace(
+                    self.theme["primary"], self.theme["number"]
+                ),
+                **{f"entry_{kind}": style for kind, style in self.style_map.items()},
+                "import": f"html=1;endArrow=open;strokeColor={self.theme['border']};",
+                "import_cycle": f"html=1;endArrow=open;strokeWidth=2;"
+                f"strokeColor={self.theme['number']};",
+                "extends": "edgeStyle=orthogonalEdgeStyle;rounded=1;html=1;"
+                f"endArrow=block;endFill=0;endSize=12;strokeColor={self.theme['keyword']};",
+                "implements": "edgeStyle=orthogonalEdgeStyle;rounded=1;html=1;dashed=1;"
+                f"endArrow=block;endFill=0;endSize=12;strokeColor={self.theme['keyword']};",
+            },
+            compact=compact_styles,
+        )
+        if diff:
+            for status in DIFF_STATUSES:
+                for name, style in self._diff_styles(status).items():
+                    self.styles.register(name, style)
+        # Snippet markup by (type, name, kind, value), so repeated members share one string
+        self._snippets: Dict[Tuple, str] = {}
+
+        # Sizes survive between generate_drawio calls, keyed by subtree signature,
+        # so unchanged subtrees are not re-measured on the next (incremental) run
+        self._size_cache: Dict[str, Tuple] = (
+            layout_cache.load(display_aspect_ratio) if layout_cache is not None else {}
+        )
+        # Sizes and positions of the current run, see core.layout
+        self._engine: LayoutEngine = None
+        self._writer = None
+        # Cell of every drawn node by table index, kept only when relations are drawn
+        self._cells: Dict[int, Any] = None
+        # Boxes of the top-level containers on the current page, see core.spatial
+        self._obstacles: SpatialGrid = None
+        # Placement of top-level containers from the last run
+        self.layout: Dict[str, Dict] = {}
+        # Seconds spent per phase in the last run: size, packing, write
+        self.timings: Dict[str, float] = {}
+
+    def generate_drawio(self, ast_data: Dict, output_path: str, incremental=False):
+        """Generate hierarchical diagram with nested containers
+
+        With ``incremental`` the top-level containers that existed in the previous
+        call keep their positions, and only subtrees whose signature changed are
+        measured again.
+        """
+        nodes = ast_data.get("nodes", [])
+        if not isinstance(nodes, NodeList):
+            # Plain dict nodes from older callers
+            nodes = NodeTable.from_nodes(nodes).nodes()
+        if self.shard_by:
+            # Pages are always laid out from scratch
+            return self._generate_sharded(ast_data, nodes, output_path)
+        started = time.perf_counter()
+        with span(self.profiler, "layout.measure", nodes=len(nodes.table)) as phase:
+            self._engine = LayoutEngine(
+                nodes.table, self._size_cache, self.display_aspect_ratio
+            )
+            self._engine.measure()
+            if phase is not None:
+                phase["args"]["packing_s"] = self._engine.pack_time
+        measured = time.perf_counter()
+        relations = []
+        if self.relations:
+            from core.dependency_graph import local_relations
+
+            relations = local_relations({**ast_data, "nodes": nodes})
+        nodes = list(nodes)
+
+        self._writer = open_writer(
+            self.writer, output_path, self.styles, self.compress
+        )
+        self._cells = {} if relations else None
+        try:
+            with span(self.profiler, "render", writer=self.writer):
+                self._render(nodes, incremental)
+                self._add_relations(relations)
+                if self.diff:
+                    self._add_legend(ast_data.get("diff") or {})
+            with span(self.profiler, "write"):
+                abs_path = self._writer.close()
+            if self.profiler is not None:
+                self.profiler.count("cells", self._writer.count)
+                if isinstance(self._writer, DrawpyoWriter):
+                    self.profiler.count("drawpyo_objects", self._writer.count)
+        except BaseException:
+            self._writer.abort()
+            raise
+        finally:
+            self._writer = None
+            self._cells = None
+            self._snippets.clear()
+        self.timings = {
+            "size": measured - started - self._engine.pack_time,
+            "packing": self._engine.pack_time,
+            "write": time.perf_counter() - measured,
+        }
+        logger.info(
+            f"Wrote {os.path.getsize(abs_path)} bytes "
+            f"in {self.timings['write']:.2f}s"
+            f" (compact_styles={self.compact_styles}, compress={self.compress})"
+        )
 
-        # Main diagram container
-        main_container = drawpyo.diagram.Object(
-            page=page, value="", position=(30, 75), width=1580, height=1075
+        if self.layout_cache is not None:
+            self.layout_cache.save(
+                self._size_cache, self._engine.signatures, self.display_aspect_ratio
+            )
+        # Forget sizes of subtrees that no longer exist
+        live = set(self._engine.signatures)
+        self._size_cache = {
+            sig: size for sig, size in self._size_cache.items() if sig in live
+        }
+
+        print(f"Successfully generated diagram at: {abs_path}")
+
+    def _generate_sharded(self, ast_data: Dict, nodes: NodeList, output_path: str):
+        """One index page plus one page per shard, merged into a single file"""
+        started = time.perf_counter()
+        shards = plan_shards({**ast_data, "nodes": nodes}, self.shard_by, self.page_budget)
+        tables = [extract(nodes.table, shard["roots"]) for shard in shards]
+        jobs = max(1, min(self.jobs, len(shards)))
+
+        self._writer = open_writer(self.writer, output_path, self.styles, self.compress)
+        pool = None
+        if jobs > 1:
+            # multiprocessing is only imported when pages are actually laid out in parallel
+            from concurrent.futures import ProcessPoolExecutor
+
+            pool = ProcessPoolExecutor(max_workers=jobs)
+        measure_time = pack_time = 0.0
+        try:
+            with span(
+                self.profiler, "render.pages", pages=len(shards) + 1, jobs=jobs
+            ):
+                # Workers start on the shards while the index page is written
+                if pool is not None:
+                    pages = pool.map(_render_page, repeat(self._page_options), tables)
+                else:
+                    pages = map(_render_page, repeat(self._page_options), tables)
+                self._writer.new_page("Index", "page-0")
+                self._render_index(shards)
+                # map() hands pages back in shard order
+                for n, (shard, page) in enumerate(zip(shards, pages), 1):
+                    xml, count, measured, packed = page
+                    self._writer.new_page(shard["title"], f"page-{n}")
+                    self._writer.add_raw(xml, count)
+                    measure_time += measured
+                    pack_time += packed
+            with span(self.profiler, "write"):
+                abs_path = self._writer.close()
+            if self.profiler is not None:
+                self.profiler.count("cells", self._writer.count)
+                self.profiler.count("pages", len(shards) + 1)
+        except BaseException:
+            self._writer.abort()
+            raise
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+            self._writer = None
+            self._snippets.clear()
+
+        # Page layout is summed over workers, so it can exceed the wall time
+        self.timings = {
+            "size": measure_time - pack_time,
+            "packing": pack_time,
+            "write": time.perf_counter() - started,
+        }
+        self.layout = {}
+        logger.info(
+            f"Wrote {len(shards) + 1} pages ({os.path.getsize(abs_path)} bytes) "
+            f"in {self.timings['write']:.2f}s with {jobs} job(s)"
         )
-        main_container.apply_style_string(
-            "swimlane;whiteSpace=wrap;html=1;movable=1;resizable=1;"
-            "fillColor=none;swimlaneFillColor=none;"
+        logger.info(f"Successfully generated diagram at: {abs_path}")
+
+    def render_cells(self, nodes: NodeList) -> Tuple[str, int, float, float]:
+        """Lay out one page into a detached cell fragment
+
+        Returns the mxCell XML (see core.drawio_writer.CellBuffer), the number
+        of cells, and the seconds spent measuring and packing.
+        """
+        started = time.perf_counter()
+        self._engine = LayoutEngine(nodes.table, self._size_cache, self.display_aspect_ratio)
+        self._engine.measure()
+        measured = time.perf_counter() - started
+        self._writer = CellBuffer(self.styles)
+        try:
+            self._render(list(nodes), False)
+            return self._writer.xml(), self._writer.count, measured, self._engine.pack_time
+        finally:
+            self._writer = None
+            self._snippets.clear()
+
+    def _render_index(self, shards: List[Shard]):
+        """Grid of links to the shard pages, in page order"""
+        columns, width, height, gap = 5, 280, 60, 20
+        rows = (len(shards) + columns - 1) // columns
+        main_container = self._writer.add(
+            "",
+            (30, 75),
+            max(1580, columns * (width + gap) + 20),
+            max(1075, rows * (height + gap) + 45),
+            style="main",
+        )
+        for n, shard in enumerate(shards):
+            row, column = divmod(n, columns)
+            self._writer.add(
+                f'<a href="data:page/id,page-{n + 1}">{shard["title"]}</a>'
+                f'<br>{shard["nodes"]} nodes',
+                (50 + column * (width + gap), 100 + row * (height + gap)),
+                width,
+                height,
+                main_container,
+                "index_entry",
+            )
+
+    def generate_dependency_graph(self, graph: "DependencyGraph", output_path: str):
+        """Project view: one box per file, stacked in dependency layers
+
+        Files sit above the files they import (see core.dependency_graph), and
+        each layer is ordered to keep import connectors short. A box lists the
+        file's top-level declarations; imports connect the boxes and
+        extends/implements connect the declarations. Import cycles are drawn in
+        the highlight colour. The file is always written with the stream
+        writer, whatever ``writer`` says.
+        """
+        from core.dependency_graph import order_layers
+
+        started = time.perf_counter()
+        with span(self.profiler, "graph.layout", files=len(graph.files)):
+            rows = order_layers(graph.imports, graph.layer)
+            entries = [self._graph_entries(graph, v) for v in range(len(graph.files))]
+            boxes = {}  # file -> (x, y, height)
+            bottom = 100
+            for row in rows:
+                for start in range(0, len(row), GRAPH_COLUMNS):
+                    chunk = row[start : start + GRAPH_COLUMNS]
+                    height = 0
+                    for column, v in enumerate(chunk):
+                        box_height = 55 + len(entries[v]) * (ENTRY_HEIGHT + 4)
+                        boxes[v] = (50 + column * (FILE_WIDTH + 60), bottom, box_height)
+                        height = max(height, box_height)
+                    bottom += height + 100
+            in_cycle = bytearray(len(graph.files))
+            for group in graph.cycles():
+                for v in group:
+                    in_cycle[v] = 1
+                logger.warning(
+                    "Import cycle: " + " -> ".join(graph.files[v] for v in group[:10])
+                    + (f" (+{len(group) - 10} more)" if len(group) > 10 else "")
+                )
+
+        # Always streamed: drawpyo joins a page's cells one concatenation at a time,
+        # which is quadratic in the cell count and too slow for thousands of edges
+        self._writer = open_writer("stream", output_path, self.styles, self.compress)
+        try:
+            with span(self.profiler, "render", writer="stream"):
+                main_container = self._writer.add(
+                    "",
+                    (30, 75),
+                    max(1580, min(len(graph.files), GRAPH_COLUMNS) * (FILE_WIDTH + 60)),
+                    max(1075, bottom - 75),
+                    style="main",
+                )
+                file_cells, node_cells = [], {}
+                for v, name in enumerate(graph.files):
+                    x, y, height = boxes[v]
+                    container = self._writer.add(
+                        "",
+                        (x, y),
+                        FILE_WIDTH,
+                        height,
+                        main_container,
+                        "file_cycle" if in_cycle[v] else "file",
+                    )
+                    file_cells.append(container)
+                    self._writer.add(
+                        f"<b>{name}</b>", (x + 5, y + 5), FILE_WIDTH - 10, 30, container, "title"
+                    )
+                    for n, (index, value, style) in enumerate(entries[v]):
+                        cell = self._writer.add(
+                            value,
+                            (x + 10, y + 45 + n * (ENTRY_HEIGHT + 4)),
+                            FILE_WIDTH - 20,
+                            ENTRY_HEIGHT,
+                            container,
+                            style,
+                        )
+                        if index != NONE:
+                            node_cells[v, index] = cell
+
+                for source, target, _ in graph.imports.edges():
+                    same = graph.component[source] == graph.component[target]
+                    self._writer.add_edge(
+                        file_cells[source],
+                        file_cells[target],
+                        style="import_cycle" if same else "import",
+                    )
+                for relation in graph.relations:
+                    self._writer.add_edge(
+                        self._graph_cell(
+                            graph, relation["source"], relation["source_node"], node_cells
+                        )
+                        or file_cells[relation["source"]],
+                        self._graph_cell(
+                            graph, relation["target"], relation["target_node"], node_cells
+                        )
+                        or file_cells[relation["target"]],
+                        style=relation["kind"],
+                    )
+            with span(self.profiler, "write"):
+                abs_path = self._writer.close()
+            if self.profiler is not None:
+                self.profiler.count("cells", self._writer.count)
+                self.profiler.count("edges", graph.imports.edge_count + len(graph.relations))
+        except BaseException:
+            self._writer.abort()
+            raise
+        finally:
+            self._writer = None
+            self._snippets.clear()
+
+        self.layout = {}
+        logger.info(
+            f"Wrote dependency graph of {len(graph.files)} files, "
+            f"{graph.imports.edge_count} imports and {len(graph.relations)} relations "
+            f"in {time.perf_counter() - started:.2f}s"
         )
+        logger.info(f"Successfully generated diagram at: {abs_path}")
+
+    def _graph_entries(self, graph: "DependencyGraph", file: int) -> List[Tuple[int, str, str]]:
+        """(node index or NONE, markup, style) of the declarations listed in a file box"""
+        entries = []
+        roots = [
+            node for node in graph.results[file]["nodes"] if node.get("kind") in GRAPH_KINDS
+        ]
+        for node in roots[:GRAPH_ENTRIES]:
+            style = f"entry_{node.get('type')}"
+            if node.get("type") not in self.style_map:
+                style = "entry_default"
+            entries.append((node.index, self._format_code_snippet(node), style))
+        if len(roots) > GRAPH_ENTRIES:
+            entries.append((NONE, f"+{len(roots) - GRAPH_ENTRIES} more", "entry_default"))
+        return entries
+
+    def _graph_cell(self, graph, file, index, node_cells):
+        """Entry cell of a declaration or of its nearest listed ancestor, None if neither is listed"""
+        parent = graph.results[file]["nodes"].table.parent
+        while index != NONE:
+            cell = node_cells.get((file, index))
+            if cell is not None:
+                return cell
+            index = parent[index]
+        return None
+
+    def _render(self, nodes, incremental):
+        """Hand every cell to the writer, top-level containers first-to-last"""
+        previous_layout = self.layout if incremental else {}
+        layout = {}
 
         # Starting position for top-level elements
         x_pos, y_pos = 50, 100
+        if previous_layout:
+            # New containers go below everything that keeps its place
+            y_pos = max(p["y"] + p["height"] for p in previous_layout.values()) + 50
+
+        keys, taken = [], set()
+        for node in nodes:
+            keys.append(self._layout_key(node, taken))
+            taken.add(keys[-1])
+        # A renamed node takes over the slot of the vanished node at its index
+        vanished = {p["index"]: p for k, p in previous_layout.items() if k not in taken}
+
+        # Position all top-level nodes first, so the main container can enclose them.
+        # Containers that keep their place go first; one that grew into another
+        # is placed again like a new one
+        grid = self._obstacles = SpatialGrid()
+        positions = [None] * len(nodes)
+        for index, (node, key) in enumerate(zip(nodes, keys)):
+            previous = previous_layout.get(key) or vanished.get(index)
+            if previous:
+                box = (previous["x"], previous["y"], *self._engine.size(node.index))
+                if not grid.overlaps(_with_gap(box)):
+                    grid.insert(node.index, box)
+                    positions[index] = box
+        for index, node in enumerate(nodes):
+            if positions[index] is not None:
+                continue
+            width, height = self._engine.size(node.index)
+            x, y = self._free_slot(x_pos, y_pos, width, height)
+            grid.insert(node.index, (x, y, width, height))
+            positions[index] = (x, y, width, height)
+
+            # Update position for next node
+            x_pos = x + width + 50
+            y_pos = y
+            if x_pos > 1400:  # Move to next row
+                x_pos = 50
+                y_pos += height + 50
+
+        # Main diagram container, grown past its default size if the content needs it
+        main_container = self._writer.add(
+            "",
+            (30, 75),
+            max([1580] + [x + width - 10 for x, _, width, _ in positions]),
+            max([1075] + [y + height - 55 for _, y, _, height in positions]),
+            style="main",
+        )
 
         # Process all top-level nodes
-        for node in ast_data.get("nodes", []):
+        for index, (node, key) in enumerate(zip(nodes, keys)):
+            x, y, width, height = positions[index]
+            self._engine.place(node.index, x, y)
+
             # Create container for this node
-            container = self._create_node_container(
-                page=page,
+            self._create_node_container(
                 node=node,
-                x=x_pos,
-                y=y_pos,
                 parent=main_container,
                 is_top_level=True,
             )
+            layout[key] = {
+                "index": index,
+                "signature": self._engine.signatures[node.index],
+                "x": x,
+                "y": y,
+                "width": width,
+                "height": height,
+            }
+
+        self.layout = layout
+
+    def _free_slot(self, x, y, width, height):
+        """First slot from (x, y) on, in row order, where the box keeps a gap to every placed box"""
+        grid = self._obstacles
+        while True:
+            hits = [grid.rects[k] for k in grid.query(_with_gap((x, y, width, height)))]
+            if not hits:
+                return x, y
+            x = max(hx + hw for hx, _, hw, _ in hits) + 50
+            if x > 1400:
+                x = 50
+                y = min(hy + hh for _, hy, _, hh in hits) + 50
+
+    def _add_relations(self, relations):
+        """Extends/implements connectors, routed around the other top-level containers"""
+        engine = self._engine
+        parent = engine.table.parent
+
+        def root(index):
+            while parent[index] != NONE:
+                index = parent[index]
+            return index
+
+        for source, kind, target in relations:
+            points = ()
+            if root(source) != root(target):
+                points = route(
+                    self._obstacles,
+                    (engine.x[source], engine.y[source], *engine.size(source)),
+                    (engine.x[target], engine.y[target], *engine.size(target)),
+                    ignore=(root(source), root(target)),
+                ) or ()
+            self._writer.add_edge(
+                self._cells[source], self._cells[target], style=kind, points=points
+            )
 
-            # Update position for next node
-            x_pos += container.width + 50
-            if x_pos > 1400:  # Move to next row
-                x_pos = 50
-                y_pos += container.height + 50
-
-        # Handle file writing with proper path handling
-        import os
-
-        abs_path = os.path.abspath(output_path)
-        output_dir = os.path.dirname(abs_path)
-
-        if output_dir:  # Only create dir if path contains directory
-            os.makedirs(output_dir, exist_ok=True)
-
-        # Write file with absolute path
-        doc.write(file_path=abs_path, overwrite=True)
+    def _layout_key(self, node, taken):
+        """Stable key of a top-level node: kind, name and occurrence number"""
+        base = f"{node.get('kind', '')}:{node.get('name', '')}"
+        key, n = base, 1
+        while key in taken:
+            n += 1
+            key = f"{base}#{n}"
+        return key
+
+    def _create_node_container(self, node, parent, is_top_level=False):
+        """
+        Create a container and everything inside it at the sizes and positions
+        from the layout engine. The subtree is walked on an explicit stack, so
+        deeply nested expressions don't run into the recursion limit
+        """
+        engine = self._engine
+        container = self._open_container(node, parent)
+        stack = [(node, container, iter(node.get("children") or ()))]
+        while stack:
+            current, cell, children = stack[-1]
+            child = next(children, None)
+            if child is None:
+                stack.pop()
+                self._add_sections(current, cell)
+                continue
+
+            # Add content at the packed positions
+            if engine.complex[child.index]:
+                inner = self._open_container(child, cell)
+                stack.append((child, inner, iter(child.get("children") or ())))
+            else:  # Simple child shows as code
+                snippet = self._writer.add(
+                    self._format_code_snippet(child),
+                    (engine.x[child.index], engine.y[child.index]),
+                    engine.width[child.index],
+                    engine.height[child.index],
+                    cell,
+                    self._diff_style(child, "snippet"),
+                )
+                if self._cells is not None:
+                    self._cells[child.index] = snippet
 
-        print(f"Successfully generated diagram at: {abs_path}")
+        return container
 
-    def _calculate_container_size(self, node):
-        """Recursively calculate container size based on content"""
-        if node.get("children"):
-            child_width, child_height = 0, 0
-            for child in node["children"]:
-                cw, ch = self._calculate_container_size(child)
-                child_width += cw + 20  # Add spacing
-                child_height = max(child_height, ch)
-
-            # Add padding
-            width = max(node.get("min_width", 200), child_width + 40)
-            height = max(node.get("min_height", 100), child_height + 60)
-        else:
-            # Leaf node default sizes
-            width = node.get("width", 180)
-            height = node.get("height", 40)
-        return width, height
-
-    def _sort_elements(self, elements):
-
-        class RectObject(TypedDict):
-            w: float  # 横长
-            h: float  # 竖长
-            no: int  # 编号
-            con: Dict[int, float]  # 连系度序列
-
-        def rectangle_packing(
-            rects: list[RectObject], ratio: float, tolerance: float = 1e-5
-        ):
-            """
-            矩形包装算法
-            :param rects: 小矩形列表
-            :param ratio: 大矩形长宽比 A/B
-            :param tolerance: 二分搜索精度
-            :return: (min_area, A, B, positions)
-            """
-            if not rects:
-                return 0.0, 0.0, 0.0, []
-
-            n = len(rects)
-            # 1. 计算B的搜索范围
-            total_area = sum(rect["w"] * rect["h"] for rect in rects)
-            max_height = max(rect["h"] for rect in rects)
-            # B的下界
-            B_low = max(max_height, math.sqrt(total_area / ratio))
-            # B的上界初始估计
-            B_high = B_low * 2.0
-
-            # 2. 天际线放置算法
-            def try_place(B: float):
-                A = ratio * B
-                skyline = [(0.0, A, 0.0)]  # (x_start, x_end, y)
-                positions = [None] * n
-
-                # 按高度降序排序矩形
-                sorted_rects = sorted(rects, key=lambda r: -r["h"])
-
-                for rect in sorted_rects:
-                    w, h = rect["w"], rect["h"]
-                    best_y = float("inf")
-                    best_x = None
-                    best_seg_idx = None
-
-                    for seg_idx, seg in enumerate(skyline):
-                        x_start, x_end, y_current = seg
-                        seg_length = x_end - x_start
-
-                        if seg_length >= w and y_current + h <= B:
-                            if y_current < best_y or (
-                                y_current == best_y and x_start < best_x
-                            ):
-                                best_y = y_current
-                                best_x = x_start
-                                best_seg_idx = seg_idx
-
-                    if best_seg_idx is None:
-                        return None
-
-                    positions[rect["no"]] = (best_x, best_y)
-                    seg = skyline.pop(best_seg_idx)
-                    x_start, x_end, y_current = seg
-
-                    new_segments = []
-                    if x_start < best_x:
-                        new_segments.append((x_start, best_x, y_current))
-                    new_segments.append((best_x, best_x + w, y_current + h))
-                    if best_x + w < x_end:
-                        new_segments.append((best_x + w, x_end, y_current))
-
-                    skyline[best_seg_idx:best_seg_idx] = new_segments
-                    merge_skyline(skyline)
-
-                return positions
-
-            def merge_skyline(skyline):
-                skyline.sort(key=lambda s: s[0])
-                i = 0
-                while i < len(skyline) - 1:
-                    s1 = skyline[i]
-                    s2 = skyline[i + 1]
-                    if s1[2] == s2[2] and abs(s1[1] - s2[0]) < 1e-6:
-                        skyline[i] = (s1[0], s2[1], s1[2])
-                        skyline.pop(i + 1)
-                    else:
-                        i += 1
-
-            # 3. 二分搜索最小B值
-            min_B = None
-            while B_high - B_low > tolerance:
-                B_mid = (B_low + B_high) / 2.0
-                if try_place(B_mid) is not None:
-                    min_B = B_mid
-                    B_high = B_mid
-                else:
-                    B_low = B_mid
-
-            # 4. 最终放置
-            if min_B is None:
-                # 线性扩大上界直到找到解
-                while True:
-                    positions = try_place(B_high)
-                    if positions is not None:
-                        min_B = B_high
-                        break
-                    B_high *= 1.5
-                    if B_high > 100 * B_low:  # 防止无限循环
-                        raise ValueError("无法找到可行解，请检查输入")
-            else:
-                positions = try_place(min_B)
-
-            A = ratio * min_B
-            min_area = A * min_B
-            return min_area, A, min_B, positions
-
-        # 转换elements为RectObject列表
-        rects = []
-        for i, elem in enumerate(elements):
-            w, h = self._calculate_container_size(elem)
-            rects.append({"w": w, "h": h, "no": i, "con": {}})  # 留空供后续填充
-
-        _, A, B, positions = rectangle_packing(rects, self.display_aspect_ratio)
-
-        # 根据位置排序元素
-        sorted_elements = [None] * len(elements)
-        for i, pos in enumerate(positions):
-            sorted_elements[i] = elements[i]
-
-        return sorted_elements
-
-    def _create_node_container(self, page, node, x, y, parent, is_top_level=False):
-        """Create a container with calculated size and layout"""
-        # Calculate size based on content
-        width, height = self._calculate_container_size(node)
+    def _open_container(self, node, parent):
+        """Container box and title bar of one node; children are added by the caller"""
+        engine = self._engine
+        x, y = engine.x[node.index], engine.y[node.index]
+        width, height = engine.size(node.index)
 
         # Create main container with conditional border
-        border_style = (
-            "strokeColor=none;"
-            if not node.get("show_border")
-            else f"strokeColor={self.theme['primary']};"
-        )
-        bg_color = self.theme["background"]
-
-        container = drawpyo.diagram.Object(
-            page=page,
-            value="",
-            position=(x, y),
-            width=width,
-            height=height,
-            parent=parent,
-        )
-        container.apply_style_string(
-            f"rounded=1;whiteSpace=wrap;html=1;"
-            f"fillColor={bg_color};"
-            f"{border_style}"
-            "strokeWidth=3;"
+        container = self._writer.add(
+            "",
+            (x, y),
+            width,
+            height,
+            parent,
+            self._diff_style(
+                node, "container_border" if node.get("show_border") else "container"
+            ),
         )
+        if self._cells is not None:
+            self._cells[node.index] = container
 
         # Add title bar with name and type
         title = f"{node.get('name', 'unnamed')}"
+        if self.diff and node.get("old_name") is not None:
+            title = f"{node['old_name']} → {title}"
         if node.get("kind") and len(node["kind"]) < 20:  # Only show short types
             title += f" : {node['kind']}"
 
-        title_obj = drawpyo.diagram.Object(
-            page=page,
-            value=f"<b>{title}</b>",
-            position=(x + 5, y + 5),
-            width=width - 10,
-            height=30,
-            parent=container,
-        )
-        title_obj.apply_style_string(
-            f"fillColor=none;fontFamily=Verdana;fontSize=14;"
-            f"fontColor={self.theme['highlight']};html=1;"
+        self._writer.add(
+            f"<b>{title}</b>",
+            (x + 5, y + 5),
+            width - 10,
+            30,
+            container,
+            "title",
         )
+        return container
 
-        # Add sorted and positioned content
-        content_y = y + 60  # Extra space for title
-        sorted_children = self._sort_elements(node.get("children", []))
-
-        for child in sorted_children:
-            child_width, child_height = self._calculate_container_size(child)
-
-            if self._is_complex(child):
-                child_container = self._create_node_container(
-                    page=page,
-                    node=child,
-                    x=x + 20,  # Indent children
-                    y=content_y,
-                    parent=container,
-                )
-                content_y += child_height + 15  # Vertical spacing
-            else:  # Simple child shows as code
-                code_obj = drawpyo.diagram.Object(
-                    page=page,
-                    value=self._format_code_snippet(child),
-                    position=(x + 10, content_y),
-                    width=width - 20,
-                    height=40,
-                    parent=container,
-                )
-                code_obj.apply_style_string(
-                    f"fillColor={self.theme['code_bg']};"
-                    f"fontColor={self.theme['code_text']};"
-                    "fontFamily=Consolas;fontSize=12;"
-                    "html=1;whiteSpace=wrap;"
-                )
-                content_y += 50
+    def _diff_style(self, node, style):
+        """Style of a cell in diff mode: one per status, the given one otherwise"""
+        status = node.get("diff") if self.diff else None
+        if status not in DIFF_STATUSES:
+            return style
+        return f"{'snippet' if style == 'snippet' else 'container'}_{status}"
+
+    def _diff_styles(self, status):
+        """Container, snippet and legend styles of one diff status"""
+        color = self.theme[status]
+        muted = status == "unchanged"
+        dashed = "dashed=1;" if muted or status == "removed" else ""
+        return {
+            f"container_{status}": self._container_style(True).replace(
+                self.theme["primary"], color
+            )
+            + dashed,
+            f"snippet_{status}": self.styles["snippet"]
+            + f"strokeColor={color};strokeWidth=2;{dashed}"
+            + (f"fontColor={color};fontStyle=2;" if muted else ""),
+            f"legend_{status}": f"rounded=1;html=1;fillColor=none;strokeColor={color};"
+            f"fontColor={color};fontFamily=Consolas;fontSize=12;{dashed}",
+        }
 
-        # Add return value and parameters sections for functions
-        if node.get("type") == "function":
-            if node.get("returns"):
-                self._add_return_section(
-                    page=page, node=node, container=container, x=x, y=y, width=width
-                )
-            if node.get("parameters"):
-                self._add_parameters_section(
-                    page=page, node=node, container=container, x=x, y=y, width=width
-                )
+    def _add_legend(self, counts):
+        """Row of status boxes with their node counts above the main container"""
+        for n, status in enumerate(DIFF_STATUSES):
+            self._writer.add(
+                f"{status}: {counts.get(status, 0)}",
+                (30 + n * 170, 25),
+                160,
+                30,
+                None,
+                f"legend_{status}",
+            )
 
-        # Update container height based on content
-        container.height = content_y - y + 20
-        return container
+    def _add_sections(self, node, container):
+        """Return value and parameters sections of a function, below its children"""
+        if node.get("type") != "function":
+            return
+        engine = self._engine
+        x, y = engine.x[node.index], engine.y[node.index]
+        width, height = engine.size(node.index)
+        if node.get("returns"):
+            self._add_return_section(
+                node=node, container=container, x=x, y=y, width=width, height=height
+            )
+        if node.get("parameters"):
+            self._add_parameters_section(
+                node=node, container=container, x=x, y=y, width=width, height=height
+            )
 
-    def _is_complex(self, node: Dict) -> bool:
-        """Check if node should be rendered as complex container"""
+    def _container_style(self, show_border: bool) -> str:
+        border_style = (
+            f"strokeColor={self.theme['primary']};"
+            if show_border
+            else "strokeColor=none;"
+        )
         return (
-            node.get("children")
-            or len(node.get("name", "")) > 20
-            or len(node.get("kind", "")) > 30
+            f"rounded=1;whiteSpace=wrap;html=1;"
+            f"fillColor={self.theme['background']};"
+            f"{border_style}"
+            "strokeWidth=3;"
         )
 
+    def _color(self, color: str, text) -> str:
+        if self.compact_styles:
+            return f'<font color="{color}">{text}</font>'
+        return f'<span style="color:{color}">{text}</span>'
+
     def _format_code_snippet(self, node: Dict) -> str:
         """Format node with syntax highlighting"""
+        key = (node.get("type"), node.get("name"), node.get("kind"), node.get("value"))
+        if self.diff and node.get("old_name") is not None:
+            # Renamed in diff mode
+            key = key[:1] + (f"{node['old_name']} → {key[1]}",) + key[2:]
+        snippet = self._snippets.get(key)
+        if snippet is not None:
+            return snippet
+
+        node_type, name, kind, value = key
         parts = []
-        if node.get("type"):
-            parts.append(
-                f'<span style="color:{self.theme["keyword"]}">{node["type"]}</span>'
-            )
-        if node.get("name"):
+        if node_type:
+            parts.append(self._color(self.theme["keyword"], node_type))
+        if name:
+            parts.append(self._color(self.theme["text"], name))
+        if kind:
             parts.append(
-                f'<span style="color:{self.theme["text"]}">{node["name"]}</span>'
+                self._color(self.theme["operator"], ":")
+                + " "
+                + self._color(self.theme["type"], kind)
             )
-        if node.get("kind"):
+        if value:
             parts.append(
-                f'<span style="color:{self.theme["operator"]}">:</span> '
-                f'<span style="color:{self.theme["type"]}">{node["kind"]}</span>'
+                self._color(self.theme["operator"], "=")
+                + " "
+                + self._color(self.theme["string"], value)
             )
-        if node.get("value"):
-            parts.append(
-                f'<span style="color:{self.theme["operator"]}">=</span> '
-                f'<span style="color:{self.theme["string"]}">{node["value"]}</span>'
+
+        snippet = " ".join(parts)
+        if not self.compact_styles:
+            snippet = (
+                '<div style="font-family:Consolas;font-size:12px">' + snippet + "</div>"
             )
+        self._snippets[key] = snippet
+        return snippet
 
-        return (
-            '<div style="font-family:Consolas;font-size:12px">'
-            + " ".join(parts)
-            + "</div>"
-        )
+    def _add_return_section(self, node, container, x, y, width, height):
+        """Add return value section to function container (bottom left)
 
-    def _add_return_section(self, page, node, container, x, y, width):
-        """Add return value section to function container (left side)"""
+        The layout engine reserves these rows below the children; with
+        parameters present the returns take the left half of them.
+        """
         returns = node["returns"]
+        section_width = width / 2 if node.get("parameters") else width
         if isinstance(returns, dict) and returns.get("complex"):
             # Complex return type - use dots
             for i, ret in enumerate(returns["items"]):
-                dot = drawpyo.diagram.Object(
-                    page=page,
-                    value="•",
-                    position=(x + 10, y + container.height - 30 - i * 20),
-                    width=10,
-                    height=10,
-                    parent=container,
-                )
-                text = drawpyo.diagram.Object(
-                    page=page,
-                    value=ret,
-                    position=(x + 25, y + container.height - 30 - i * 20),
-                    width=width - 35,
-                    height=15,
-                    parent=container,
+                self._writer.add(
+                    "•", (x + 10, y + height - 30 - i * 20), 10, 10, container, "dot"
                 )
-                text.apply_style_string(
-                    f"fontColor={self.theme['text']};"
-                    "fontFamily=Consolas;fontSize=12;"
+                self._writer.add(
+                    ret,
+                    (x + 25, y + height - 30 - i * 20),
+                    section_width - 35,
+                    15,
+                    container,
+                    "item_text",
                 )
         else:
             # Simple return type
-            return_obj = drawpyo.diagram.Object(
-                page=page,
-                value=f"→ {returns}",
-                position=(x + 10, y + container.height - 30),
-                width=width - 20,
-                height=20,
-                parent=container,
-            )
-            return_obj.apply_style_string(
-                f"fontColor={self.theme['type']};" "fontFamily=Consolas;fontSize=12;"
+            self._writer.add(
+                f"→ {returns}",
+                (x + 10, y + height - 30),
+                section_width - 20,
+                20,
+                container,
+                "type_text",
             )
 
-    def _add_parameters_section(self, page, node, container, x, y, width):
-        """Add parameters section to function container (right side)"""
+    def _add_parameters_section(self, node, container, x, y, width, height):
+        """Add parameters section to function container (bottom right, right-aligned)"""
         params = node["parameters"]
+        section_width = width / 2 if node.get("returns") else width
+        left = x + width - section_width
         if isinstance(params, dict) and params.get("complex"):
             # Complex parameters - use dots
             for i, param in enumerate(params["items"]):
-                dot = drawpyo.diagram.Object(
-                    page=page,
-                    value="•",
-                    position=(x + width - 20, y + container.height - 30 - i * 20),
-                    width=10,
-                    height=10,
-                    parent=container,
-                )
-                text = drawpyo.diagram.Object(
-                    page=page,
-                    value=param,
-                    position=(x + width - 35, y + container.height - 30 - i * 20),
-                    width=width - 35,
-                    height=15,
-                    align="right",
-                    parent=container,
+                self._writer.add(
+                    "•", (x + width - 20, y + height - 30 - i * 20), 10, 10, container, "dot"
                 )
-                text.apply_style_string(
-                    f"fontColor={self.theme['text']};"
-                    "fontFamily=Consolas;fontSize=12;"
+                self._writer.add(
+                    param,
+                    (left + 10, y + height - 30 - i * 20),
+                    section_width - 35,
+                    15,
+                    container,
+                    "item_text_right",
                 )
         else:
             # Simple parameters
-            param_obj = drawpyo.diagram.Object(
-                page=page,
-                value=f"{params} ←",
-                position=(x + width - 20, y + container.height - 30),
-                width=width - 20,
-                height=20,
-                align="right",
-                parent=container,
-            )
-            param_obj.apply_style_string(
-                f"fontColor={self.theme['type']};" "fontFamily=Consolas;fontSize=12;"
+            self._writer.add(
+                f"{params} ←",
+                (left + 10, y + height - 30),
+                section_width - 20,
+                20,
+                container,
+                "type_text_right",
             )
 
 
+def _with_gap(box):
+    """Box grown by half the 50px gap between top-level containers on every side"""
+    x, y, width, height = box
+    return x - 25, y - 25, width + 50, height + 50
+
+
+def _render_page(options: Dict, table: NodeTable) -> Tuple[str, int, float, float]:
+    """One shard page, run in a worker process (see DrawIOGenerator.render_cells)"""
+    return DrawIOGenerator(**options).render_cells(table.nodes())
+
+
 if __name__ == "__main__":
     # Example usage
     generator = DrawIOGenerator()
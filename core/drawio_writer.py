@@ -0,0 +1,535 @@
+"""
+.drawio 的输出后端，`DrawIOGenerator` 通过 `add` 一个一个地交出图元
+
+    drawpyo  先建完整的 drawpyo 对象图，最后 `File.write` 一次写出（默认）
+    stream   边布局边把 `<mxCell>` 写进文件，内存里只留样式表和一个计数器
+
+两者输出逐字节一致（除了 id 和文件头里的 modified 时间，drawpyo 的 id 本来就是 `id(obj)`）：
+文件头、页面标签和两个空 mxCell 直接借 drawpyo 的对象生成
+
+样式走 `StyleTable`：绘图器把主题里的样式按名字登记一次，图元只带名字，
+样式串的规范化（和 drawpyo `apply_style_string` 的结果一致）、转义都只做一次。
+.drawio 文件里没有地方放自定义样式表（命名样式只能引用 draw.io 自带的），
+所以每个 mxCell 最终还是写完整的样式串；`compact` 会去掉和 draw.io 默认值相同的项
+
+`add_edge` 在两个图元之间连线（parent 是页面，端点位置由 draw.io 自己算）
+
+一个文件可以有多页（`new_page`），不调用的话第一次 `add` 时自动开一页；
+`CellBuffer` 把一页的图元攒成一段 XML，分页绘制时在子进程里画、在主进程里 `add_raw` 拼进文件
+
+`compress` 按 draw.io 自己的格式压缩页面内容：
+base64(deflateRaw(encodeURIComponent(<mxGraphModel>...)))
+"""
+
+# sys
+from urllib.parse import quote
+import logging
+import base64
+import zlib
+import os
+
+# lib function
+from typing import Any, Dict, Optional, Sequence, TextIO, Tuple
+
+import drawpyo
+from drawpyo.xml_base import xmlize
+
+logger = logging.getLogger(__name__)
+
+_ESCAPE = str.maketrans(xmlize)
+# draw.io 的默认值，compact 时省掉
+_DEFAULT_STYLE_ITEMS = ("rounded=0", "dashed=0")
+# encodeURIComponent 不转义的字符
+_URI_SAFE = "!'()*-._~"
+
+Position = Tuple[float, float]
+
+
+def _prepare_path(output_path: str) -> str:
+    """绝对路径，顺便把目录建好"""
+    abs_path = os.path.abspath(output_path)
+    output_dir = os.path.dirname(abs_path)
+    if output_dir:  # Only create dir if path contains directory
+        os.makedirs(output_dir, exist_ok=True)
+    return abs_path
+
+
+class StyleTable:
+    """名字 -> 最终写进文件的样式串"""
+
+    def __init__(self, styles: Dict[str, Optional[str]], compact: bool = False):
+        """
+        Args:
+            styles (Dict[str, Optional[str]]): 名字 -> draw.io 样式串（None 是 drawpyo 的默认样式）
+            compact = False (bool, optional): 去掉和 draw.io 默认值相同的项
+        """
+        self.compact = compact
+        self._styles: Dict[str, str] = {}
+        self._escaped: Dict[str, str] = {}
+        for name, style in styles.items():
+            self.register(name, style)
+
+    def register(self, name: str, style: Optional[str]):
+        probe = drawpyo.diagram.Object()
+        if style is not None:
+            probe.apply_style_string(style)
+        normalized = probe.style
+        if self.compact:
+            normalized = ";".join(
+                item
+                for item in normalized.split(";")
+                if item not in _DEFAULT_STYLE_ITEMS
+            )
+        self._styles[name] = normalized
+        self._escaped[name] = normalized.translate(_ESCAPE)
+
+    def __getitem__(self, name: str) -> str:
+        return self._styles[name]
+
+    def escaped(self, name: str) -> str:
+        return self._escaped[name]
+
+
+class _DiagramCompressor:
+    """边写边压缩：encodeURIComponent -> deflateRaw -> base64，按 3 字节对齐分块输出"""
+
+    def __init__(self, out: TextIO):
+        self.out = out
+        self._deflate = zlib.compressobj(9, zlib.DEFLATED, -15)
+        self._pending = b""
+
+    def write(self, text: str):
+        self._emit(self._deflate.compress(quote(text, safe=_URI_SAFE).encode("ascii")))
+
+    def _emit(self, data: bytes):
+        data = self._pending + data
+        cut = len(data) - len(data) % 3
+        if cut:
+            self.out.write(base64.b64encode(data[:cut]).decode("ascii"))
+        self._pending = data[cut:]
+
+    def close(self):
+        self._emit(self._deflate.flush())
+        self.out.write(base64.b64encode(self._pending).decode("ascii"))
+        self._pending = b""
+
+
+def _split_page(page: drawpyo.Page) -> Tuple[str, str, str]:
+    """
+    页面的开头和结尾拆成 (<diagram> 开标签, <mxGraphModel><root> 开头, </root></mxGraphModel> 结尾)，
+    压缩时只压缩中间的 mxGraphModel
+    """
+    diagram_open = page.diagram.xml_open_tag
+    graph_open = page.xml_open_tag[len(diagram_open) :].removeprefix("\n    ")
+    diagram_close = page.diagram.xml_close_tag
+    graph_close = page.xml_close_tag[: -len(diagram_close)].removesuffix("\n  ")
+    return diagram_open, graph_open, graph_close
+
+
+class _TableObject(drawpyo.diagram.Object):
+    """样式直接取自 `StyleTable` 的 drawpyo 对象，不用每个对象都解析一遍样式串"""
+
+    table_style = ""
+
+    @property
+    def style(self) -> str:
+        return self.table_style
+
+
+class _TableEdge(drawpyo.diagram.Edge):
+    """样式直接取自 `StyleTable` 的 drawpyo 连线"""
+
+    table_style = ""
+
+    @property
+    def style(self) -> str:
+        return self.table_style
+
+
+class _RawCells:
+    """`CellBuffer` 写好的一段 mxCell，原样放进 drawpyo 的页面"""
+
+    def __init__(self, xml: str):
+        self.xml = xml
+
+
+def _mxcell(
+    cell_id: int,
+    value: Any,
+    position: Position,
+    width: float,
+    height: float,
+    parent: Any,
+    escaped_style: str,
+) -> str:
+    """一个 mxCell 的 XML，和 drawpyo 生成的格式一致"""
+    x, y = position
+    return (
+        f'<mxCell id="{cell_id}"'
+        + ("" if value is None else f' value="{str(value).translate(_ESCAPE)}"')
+        + f' style="{escaped_style}"'
+        + f' vertex="1" parent="{1 if parent is None else parent}">'
+        + "\n  "
+        + f'<mxGeometry x="{x}" y="{y}" width="{width}" height="{height}" as="geometry" />'
+        + "\n</mxCell>"
+    )
+
+
+def _edge_cell(
+    cell_id: int,
+    source: Any,
+    target: Any,
+    value: Any,
+    escaped_style: str,
+    points: Sequence[Position] = (),
+) -> str:
+    """一条连线的 XML，和 drawpyo `Edge` 生成的格式一致"""
+    if points:
+        geometry = (
+            '<mxGeometry relative="1" as="geometry">\n<Array as="points">\n'
+            + "".join(f'<mxPoint x="{x}" y="{y}" />\n' for x, y in points)
+            + "</Array>\n</mxGeometry>"
+        )
+    else:
+        geometry = '<mxGeometry relative="1" as="geometry" />'
+    return (
+        f'<mxCell id="{cell_id}" style="{escaped_style}" edge="1" parent="1"'
+        + f' source="{source}" target="{target}"'
+        + ("" if value is None else f' value="{str(value).translate(_ESCAPE)}"')
+        + ">\n  "
+        + geometry
+        + "\n</mxCell>"
+    )
+
+
+def _new_page(
+    doc: drawpyo.File, name: Optional[str], page_id: Optional[str]
+) -> drawpyo.Page:
+    page = drawpyo.Page(file=doc) if name is None else drawpyo.Page(file=doc, name=name)
+    if page_id is not None:
+        page.diagram._id = page_id
+    return page
+
+
+class DrawpyoWriter:
+    """用 drawpyo 的对象图输出"""
+
+    def __init__(self, output_path: str, styles: StyleTable, compress: bool = False):
+        self.output_path = output_path
+        self.styles = styles
+        self.compress = compress
+        self.doc = drawpyo.File(file_name=output_path)
+        self.page: Optional[drawpyo.Page] = None
+        self.count = 0
+
+    def new_page(self, name: Optional[str] = None, page_id: Optional[str] = None) -> str:
+        """
+        开始新的一页，之后 `add` 的图元都在这一页上；不调用的话 `add` 时自动开一页
+        Args:
+            name = "Page-n" (str, optional): 页名
+            page_id = id(...) (str, optional): 页面 id，页面链接 `data:page/id,<id>` 用
+
+        Returns:
+            str: 页面 id
+        """
+        self.page = _new_page(self.doc, name, page_id)
+        return str(self.page.diagram.id)
+
+    def add(
+        self,
+        value: Any,
+        position: Position,
+        width: float,
+        height: float,
+        parent: Any = None,
+        style: str = "default",
+    ) -> drawpyo.diagram.Object:
+        """
+        加一个图元
+        Args:
+            value (Any): 显示的内容（HTML）
+            position (Position): 左上角的绝对坐标
+            width, height (float): 尺寸
+            parent = None (Any, optional): 父图元（`add` 的返回值）
+            style = "default" (str, optional): `StyleTable` 里登记的样式名
+
+        Returns:
+            drawpyo.diagram.Object: 当作子图元的 parent 用
+        """
+        if self.page is None:
+            self.new_page()
+        obj = _TableObject(value=value, position=position, width=width, height=height)
+        if parent is not None:
+            # 建好再挂到父图元下：构造时传 parent 会按 parent 链算绝对坐标，
+            # 每层算两遍，嵌套深了是指数级的；写出来的 XML 一样
+            parent.add_object(obj)
+        self._place(obj)
+        obj.table_style = self.styles[style]
+        self.count += 1
+        return obj
+
+    def _place(self, obj: Any):
+        """放到当前页上；不用 `Page.add_object`，它每次先在整页的对象里查重，整页下来是平方级的"""
+        obj._page = self.page
+        self.page.objects.append(obj)
+
+    def add_edge(
+        self,
+        source: Any,
+        target: Any,
+        value: Any = None,
+        style: str = "edge",
+        points: Sequence[Position] = (),
+    ):
+        """
+        加一条连线，画在最上层（parent 是页面），端点由 draw.io 按两个图元的位置算
+        Args:
+            source, target (Any): 两端的图元（`add` 的返回值）
+            value = None (Any, optional): 线上的文字
+            style = "edge" (str, optional): `StyleTable` 里登记的样式名
+            points = () (Sequence[Position], optional): 中间的拐点（绝对坐标）
+        """
+        if self.page is None:
+            self.new_page()
+        edge = _TableEdge(source=source, target=target, label=value)
+        self._place(edge)
+        for x, y in points:
+            edge.add_point(x, y)
+        edge.table_style = self.styles[style]
+        self.count += 1
+
+    def add_raw(self, xml: str, count: int):
+        """
+        把 `CellBuffer.xml()` 拼好的一段图元接到当前页上
+        Args:
+            xml (str): mxCell 片段
+            count (int): 片段里的图元个数
+        """
+        if self.page is None:
+            self.new_page()
+        if xml:
+            self.page.add_object(_RawCells(xml))
+        self.count += count
+
+    def close(self) -> str:
+        """写出文件，返回绝对路径"""
+        if self.page is None:
+            self.new_page()
+        abs_path = _prepare_path(self.output_path)
+        with open(abs_path, "w", encoding="utf-8") as f:
+            f.write(self.doc.xml_open_tag)
+            for page in self.doc.pages:
+                if not self.compress:
+                    # 和 `File.write` 的输出一样，但逐个图元写：drawpyo 的 `Page.xml`
+                    # 一路拼接字符串，图元多了是平方级的
+                    f.write("\n  " + page.xml_open_tag)
+                    for obj in page.objects:
+                        f.write("\n        " + obj.xml)
+                    f.write("\n" + page.xml_close_tag)
+                    continue
+                diagram_open, graph_open, graph_close = _split_page(page)
+                f.write("\n  " + diagram_open)
+                compressor = _DiagramCompressor(f)
+                compressor.write(graph_open)
+                for obj in page.objects:
+                    compressor.write("\n        " + obj.xml)
+                compressor.write("\n" + graph_close)
+                compressor.close()
+                f.write(page.diagram.xml_close_tag)
+            f.write("\n" + self.doc.xml_close_tag)
+        return abs_path
+
+    def abort(self):
+        pass
+
+
+class StreamingWriter:
+    """边加边写的输出，见模块说明"""
+
+    def __init__(self, output_path: str, styles: StyleTable, compress: bool = False):
+        self.output_path = _prepare_path(output_path)
+        self.styles = styles
+        self.compress = compress
+        self._tmp_path = f"{self.output_path}.{os.getpid()}.tmp"
+
+        self._doc = drawpyo.File(file_name=output_path)
+        self._file = open(self._tmp_path, "w", encoding="utf-8")
+        self._file.write(self._doc.xml_open_tag)
+        self._out = None
+        self._compressor = None
+        self._page_close = ""
+        self._next_id = 2
+        self.count = 0
+
+    def new_page(self, name: Optional[str] = None, page_id: Optional[str] = None) -> str:
+        """同 `DrawpyoWriter.new_page`，前一页在这里写完"""
+        self._close_page()
+        page = _new_page(self._doc, name, page_id)
+        if self.compress:
+            diagram_open, graph_open, graph_close = _split_page(page)
+            self._file.write("\n  " + diagram_open)
+            self._out = self._compressor = _DiagramCompressor(self._file)
+            self._out.write(graph_open)
+            self._page_close = "\n" + graph_close
+        else:
+            self._file.write("\n  " + page.xml_open_tag)
+            self._out = self._file
+            self._page_close = "\n" + page.xml_close_tag
+        # 两个空的顶层 mxCell
+        for obj in page.objects:
+            self._out.write("\n        " + obj.xml)
+        # 0 和 1 已经被上面两个占了；id 只要在一页里不重复
+        self._next_id = 2
+        self._page = page
+        return str(page.diagram.id)
+
+    def _close_page(self):
+        if self._out is None:
+            return
+        if self._compressor is not None:
+            self._compressor.write(self._page_close)
+            self._compressor.close()
+            self._file.write(self._page.diagram.xml_close_tag)
+        else:
+            self._file.write(self._page_close)
+        self._out = self._compressor = None
+
+    def add(
+        self,
+        value: Any,
+        position: Position,
+        width: float,
+        height: float,
+        parent: Any = None,
+        style: str = "default",
+    ) -> int:
+        """同 `DrawpyoWriter.add`，返回的是写进文件的 id"""
+        if self._out is None:
+            self.new_page()
+        cell_id = self._next_id
+        self._next_id += 1
+        self._out.write(
+            "\n        "
+            + _mxcell(
+                cell_id, value, position, width, height, parent, self.styles.escaped(style)
+            )
+        )
+        self.count += 1
+        return cell_id
+
+    def add_edge(
+        self,
+        source: int,
+        target: int,
+        value: Any = None,
+        style: str = "edge",
+        points: Sequence[Position] = (),
+    ):
+        """同 `DrawpyoWriter.add_edge`"""
+        if self._out is None:
+            self.new_page()
+        cell_id = self._next_id
+        self._next_id += 1
+        self._out.write(
+            "\n        "
+            + _edge_cell(
+                cell_id, source, target, value, self.styles.escaped(style), points
+            )
+        )
+        self.count += 1
+
+    def add_raw(self, xml: str, count: int):
+        """同 `DrawpyoWriter.add_raw`"""
+        if self._out is None:
+            self.new_page()
+        if xml:
+            self._out.write("\n        " + xml)
+        self.count += count
+
+    def close(self) -> str:
+        """写完收尾标签，换成正式文件，返回绝对路径"""
+        if self._out is None and not self._doc.pages:
+            self.new_page()
+        self._close_page()
+        self._file.write("\n" + self._doc.xml_close_tag)
+        self._file.close()
+        os.replace(self._tmp_path, self.output_path)
+        logger.info(f"Streamed {self.count} cells to {self.output_path}")
+        return self.output_path
+
+    def abort(self):
+        """出错时丢掉写了一半的文件"""
+        self._file.close()
+        try:
+            os.remove(self._tmp_path)
+        except FileNotFoundError:
+            pass
+
+
+class CellBuffer:
+    """
+    不落盘的输出：图元攒成一段 mxCell 片段，交给 `add_raw` 接到某个 writer 的页面上
+    分页绘制时每页在子进程里画进一个 `CellBuffer`，主进程只负责拼接
+    """
+
+    def __init__(self, styles: StyleTable):
+        self.styles = styles
+        self._cells = []
+        # 和 StreamingWriter 一样从 2 开始，同一页不管在哪个进程画出来都一样
+        self._next_id = 2
+        self.count = 0
+
+    def add(
+        self,
+        value: Any,
+        position: Position,
+        width: float,
+        height: float,
+        parent: Any = None,
+        style: str = "default",
+    ) -> int:
+        """同 `DrawpyoWriter.add`，返回的是片段里的 id"""
+        cell_id = self._next_id
+        self._next_id += 1
+        self._cells.append(
+            _mxcell(
+                cell_id, value, position, width, height, parent, self.styles.escaped(style)
+            )
+        )
+        self.count += 1
+        return cell_id
+
+    def add_edge(
+        self,
+        source: int,
+        target: int,
+        value: Any = None,
+        style: str = "edge",
+        points: Sequence[Position] = (),
+    ):
+        """同 `DrawpyoWriter.add_edge`"""
+        cell_id = self._next_id
+        self._next_id += 1
+        self._cells.append(
+            _edge_cell(cell_id, source, target, value, self.styles.escaped(style), points)
+        )
+        self.count += 1
+
+    def xml(self) -> str:
+        return "\n        ".join(self._cells)
+
+
+WRITERS = {"drawpyo": DrawpyoWriter, "stream": StreamingWriter}
+
+
+def open_writer(kind: str, output_path: str, styles: StyleTable, compress: bool = False):
+    """
+    Args:
+        kind (str): "drawpyo" 或 "stream"
+        output_path (str): 输出文件
+        styles (StyleTable): 图元引用的样式
+        compress = False (bool, optional): 压缩页面内容
+    """
+    if kind not in WRITERS:
+        raise ValueError(f"Unknown drawio writer: {kind}")
+    return WRITERS[kind](output_path, styles, compress)
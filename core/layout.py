@@ -0,0 +1,190 @@
+"""
+DrawIOGenerator 的尺寸和位置计算
+
+两遍，每个节点各碰一次：
+    measure  自底向上：子树签名、画成容器还是代码片段、用 `core.packing` 排好子节点、得出尺寸
+    place    自顶向下：从顶层容器的位置推出每个子节点的位置
+
+`NodeTable` 里父节点的下标总比子节点小（先加父节点再加子节点），
+所以倒着扫一遍下标就是合法的自底向上顺序，不用递归也不用栈
+"""
+
+# sys
+import hashlib
+import time
+
+# lib function
+from typing import Dict, List, Optional, Tuple
+
+from core.ast_model import NONE, NodeTable
+from core.packing import pack
+
+# 影响布局的字段，子树签名只看这些
+SIGNATURE_FIELDS = (
+    "name",
+    "kind",
+    "type",
+    "value",
+    "returns",
+    "parameters",
+    "width",
+    "height",
+    "min_width",
+    "min_height",
+    "show_border",
+)
+
+# 容器内边距
+TITLE_HEIGHT = 60
+CHILD_INDENT = 20
+BOTTOM_PADDING = 20
+# 子节点之间的横向、纵向间距
+CHILD_GAP = (20, 15)
+# 函数容器底部的返回值 / 参数区：每行的高度，和上面内容之间的间距
+SECTION_ROW = 20
+SECTION_PADDING = 10
+
+
+def section_rows(node_type: Optional[str], returns, parameters) -> int:
+    """函数容器底部要留几行给返回值和参数（两者左右并排，取多的那个）"""
+    if node_type != "function":
+        return 0
+
+    def rows(section) -> int:
+        if not section:
+            return 0
+        if isinstance(section, dict) and section.get("complex"):
+            return len(section["items"])
+        return 1
+
+    return max(rows(returns), rows(parameters))
+
+
+class LayoutEngine:
+    """
+    一张 `NodeTable` 的布局结果，每个节点一格：
+        width / height   尺寸
+        x / y            位置（place 之后才有）
+        offset           在父容器内容区里排好的位置
+        complex          画成容器（1）还是一行代码（0）
+        signatures       子树签名，尺寸和子节点排布按签名缓存，增量重绘时没变的子树不用重排
+    """
+
+    def __init__(
+        self,
+        table: NodeTable,
+        size_cache: Optional[Dict[str, Tuple]] = None,
+        ratio: float = 3 / 2,
+    ):
+        """
+        Args:
+            table (NodeTable): 要布局的节点
+            size_cache = None (Dict[str, Tuple], optional): 签名 -> (宽, 高, 子节点排布)，跨次调用沿用
+            ratio = 3/2 (float, optional): 容器内子节点排布的目标长宽比
+        """
+        self.table = table
+        self.size_cache = size_cache if size_cache is not None else {}
+        self.ratio = ratio
+        # 用 list 不用 array("d")：整数坐标要原样写进 .drawio（"50" 而不是 "50.0"）
+        n = len(table)
+        self.width: List[float] = [0] * n
+        self.height: List[float] = [0] * n
+        self.x: List[float] = [0] * n
+        self.y: List[float] = [0] * n
+        self.offset: List[Tuple[float, float]] = [(0, 0)] * n
+        self.complex = bytearray(n)
+        self.signatures: List[str] = [""] * n
+        # 量了多少个节点、摆了多少个节点（每个节点至多一次）
+        self.measured = 0
+        self.placed = 0
+        # measure 里花在 `pack` 上的时间（秒）
+        self.pack_time = 0.0
+
+    def measure(self):
+        """自底向上量一遍所有节点"""
+        table = self.table
+        field = table.field
+        for index in range(len(table) - 1, -1, -1):
+            digest = hashlib.sha1()
+            for name in SIGNATURE_FIELDS:
+                digest.update(repr(field(index, name)).encode("utf-8") + b"\0")
+            children = list(table.children(index))
+            for child in children:
+                digest.update(self.signatures[child].encode("ascii"))
+            signature = self.signatures[index] = digest.hexdigest()
+
+            self.complex[index] = bool(
+                children
+                or len(field(index, "name", "")) > 20
+                or len(field(index, "kind", "")) > 30
+            )
+
+            cached = self.size_cache.get(signature)
+            if cached is None:
+                # 返回值 / 参数区只有画成容器时才有，排在子节点下面，不和它们重叠
+                footer = self._footer(index) if self.complex[index] else 0
+                if children:
+                    started = time.perf_counter()
+                    used_width, used_height, offsets = pack(
+                        [(self.width[c], self.height[c]) for c in children],
+                        self.ratio,
+                        CHILD_GAP,
+                    )
+                    self.pack_time += time.perf_counter() - started
+                    cached = (
+                        max(field(index, "min_width", 200), used_width + 2 * CHILD_INDENT),
+                        max(
+                            field(index, "min_height", 100),
+                            TITLE_HEIGHT + used_height + BOTTOM_PADDING + footer,
+                        ),
+                        tuple(offsets),
+                    )
+                else:
+                    height = field(index, "height", 40)
+                    if footer:
+                        height = max(height, TITLE_HEIGHT + footer)
+                    cached = (field(index, "width", 180), height, ())
+                self.size_cache[signature] = cached
+            self.width[index], self.height[index], offsets = cached
+            if table.parent[index] == NONE and not self.complex[index]:
+                # 顶层节点总是画成容器；缓存里是它当代码片段的尺寸，底部区另外留
+                footer = self._footer(index)
+                if footer:
+                    self.height[index] = max(self.height[index], TITLE_HEIGHT + footer)
+            for child, offset in zip(children, offsets):
+                self.offset[child] = offset
+            self.measured += 1
+
+    def _footer(self, index: int) -> int:
+        """画成容器时底部返回值 / 参数区的高度，没有是 0"""
+        field = self.table.field
+        rows = section_rows(
+            field(index, "type"), field(index, "returns"), field(index, "parameters")
+        )
+        return rows and rows * SECTION_ROW + SECTION_PADDING
+
+    def size(self, index: int) -> Tuple[float, float]:
+        return self.width[index], self.height[index]
+
+    def place(self, root: int, x: float, y: float):
+        """
+        自顶向下摆好一个顶层容器里的所有节点
+        Args:
+            root (int): 顶层节点的下标（顶层节点总是画成容器）
+            x, y (float): 顶层容器的位置
+        """
+        table = self.table
+        stack = [(root, x, y)]
+        while stack:
+            index, x, y = stack.pop()
+            self.x[index], self.y[index] = x, y
+            self.placed += 1
+
+            for child in table.children(index):
+                dx, dy = self.offset[child]
+                child_x, child_y = x + CHILD_INDENT + dx, y + TITLE_HEIGHT + dy
+                if self.complex[child]:
+                    stack.append((child, child_x, child_y))
+                else:
+                    self.x[child], self.y[child] = child_x, child_y
+                    self.placed += 1
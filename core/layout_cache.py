@@ -0,0 +1,107 @@
+"""
+布局结果的磁盘缓存，让 `LayoutEngine` 的尺寸缓存跨次运行沿用
+
+key 是子树签名（见 `core.layout`），值是 (宽, 高, 子节点排布)。
+解析器的节点 id 是内容寻址的，同样的代码每次得到同样的节点，
+没改过的文件重跑时几乎每棵子树都能命中，只有改了的那几棵和它们的祖先要重新量、重新排
+
+整个缓存是一个 JSON 文件，带着布局代码（core/layout.py、core/packing.py）的哈希和长宽比，
+这些变了整个作废；条目按最近使用排序，超过 `max_entries` 时丢掉最久没用的
+"""
+
+# sys
+from pathlib import Path
+import hashlib
+import logging
+import json
+import os
+
+# lib function
+from typing import Dict, Iterable, Optional, Tuple
+
+from core.parse_cache import cache_path
+
+# 布局结果取决于这些文件的代码
+_LAYOUT_SOURCES = ("layout.py", "packing.py")
+
+
+def layout_fingerprint(ratio: float) -> str:
+    """布局代码的哈希加上长宽比"""
+    digest = hashlib.sha256(repr(ratio).encode("utf-8"))
+    for name in _LAYOUT_SOURCES:
+        digest.update((Path(__file__).parent / name).read_bytes())
+    return digest.hexdigest()
+
+
+class LayoutCache:
+    """签名 -> 布局结果，存在一个 JSON 文件里"""
+
+    def __init__(self, path: Optional[str] = None, max_entries: int = 50000):
+        """
+        Args:
+            path = "tmp/layout_cache.json" (str, optional): 缓存文件（见 `core.parse_cache.CACHE_DIR_ENV`）
+            max_entries = 50000 (int, optional): 最多留多少条（每条几十字节，启动时整个读进来）
+        """
+        self.path = Path(path or cache_path("layout_cache.json"))
+        self.max_entries = max_entries
+        self.logger = logging.getLogger(__name__)
+        self.loaded = 0
+        self.stored = 0
+
+    def load(self, ratio: float) -> Dict[str, Tuple]:
+        """
+        读缓存，文件不在、坏了或者布局代码 / 长宽比变了都当作空的
+        Returns:
+            Dict[str, Tuple]: 可以直接交给 `LayoutEngine` 的 size_cache，按最近使用排序
+        """
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if data.get("fingerprint") != layout_fingerprint(ratio):
+            self.logger.info("Layout cache is from different layout code or ratio, ignored")
+            return {}
+        sizes = {
+            signature: (width, height, tuple(tuple(offset) for offset in offsets))
+            for signature, (width, height, offsets) in data.get("sizes", {}).items()
+        }
+        self.loaded = len(sizes)
+        return sizes
+
+    def save(self, sizes: Dict[str, Tuple], used: Iterable[str], ratio: float):
+        """
+        把这次用到的条目排到最后（最近使用）再写回去
+        Args:
+            sizes (Dict[str, Tuple]): `load` 读出来的加上这次新算的
+            used (Iterable[str]): 这次布局用到的签名
+            ratio (float): 这次布局的长宽比
+        """
+        recent = {}
+        for signature in used:
+            if signature in sizes:
+                recent[signature] = sizes[signature]
+        merged = {k: v for k, v in sizes.items() if k not in recent}
+        merged.update(recent)
+        if len(merged) > self.max_entries:
+            keep = list(merged)[-self.max_entries :]
+            merged = {k: merged[k] for k in keep}
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # 先写临时文件再替换，并发的进程不会读到半截文件（互相覆盖只是少几条缓存）
+        tmp = self.path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(
+                {"fingerprint": layout_fingerprint(ratio), "sizes": merged},
+                f,
+                separators=(",", ":"),
+            )
+        os.replace(tmp, self.path)
+        self.stored = len(merged)
+
+    def invalidate(self):
+        """删掉缓存文件"""
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,139 @@
+"""
+容器内子节点的矩形排布（天际线算法）
+
+给定一组矩形和目标长宽比 A/B，找尽量小的 B，使所有矩形能放进 A x B 的区域：
+    - 矩形只按高度降序排一次
+    - 天际线是按 x 排好序的线段列表，放一个矩形只改动它覆盖的那几段，不重新排序
+    - 高度 B 按整像素二分，从面积估计的下界起步，按 1.25 倍放大找到能放下的上界再收窄
+"""
+
+# sys
+import math
+
+# lib function
+from typing import List, Optional, Sequence, Tuple
+
+Size = Tuple[float, float]
+Position = Tuple[float, float]
+
+
+def _place_all(
+    rects: Sequence[Size], order: Sequence[int], A: float, B: float
+) -> Optional[List[Position]]:
+    """
+    在 A x B 里按 order 的顺序逐个放矩形（每个都放在能放的最低、最左的位置）
+
+    Returns:
+        Optional[List[Position]]: 每个矩形的左上角，放不下返回 None
+    """
+    # 天际线：(x 起点, 长度, 高度)，按 x 有序且首尾相接覆盖 [0, A)
+    skyline: List[List[float]] = [[0, A, 0]]
+    positions: List[Optional[Position]] = [None] * len(rects)
+
+    for i in order:
+        w, h = rects[i]
+        best_y = best_x = math.inf
+        best_start = best_end = -1
+
+        for start in range(len(skyline)):
+            x = skyline[start][0]
+            if x + w > A:
+                # 后面的起点只会更靠右
+                break
+            # 从 start 开始往右盖住宽度 w，落在这些线段里最高的那一段上
+            y, end, covered = 0, start, 0
+            while covered < w and end < len(skyline):
+                y = max(y, skyline[end][2])
+                covered += skyline[end][1]
+                end += 1
+            if covered < w - 1e-6:
+                # 浮点误差，右边界差一点点
+                break
+            if y + h <= B and (y < best_y or (y == best_y and x < best_x)):
+                best_y, best_x, best_start, best_end = y, x, start, end
+
+        if best_start < 0:
+            return None
+        positions[i] = (best_x, best_y)
+
+        # 被盖住的 [best_start, best_end) 换成新的一段，最后一段没盖满的部分留下
+        last_x, last_len, last_y = skyline[best_end - 1]
+        replacement = [[best_x, w, best_y + h]]
+        rest = last_x + last_len - (best_x + w)
+        if rest > 0:
+            replacement.append([best_x + w, rest, last_y])
+        skyline[best_start:best_end] = replacement
+
+        # 只和左右邻居合并
+        if best_start > 0 and skyline[best_start - 1][2] == skyline[best_start][2]:
+            skyline[best_start - 1][1] += skyline[best_start][1]
+            del skyline[best_start]
+            best_start -= 1
+        if (
+            best_start + 1 < len(skyline)
+            and skyline[best_start + 1][2] == skyline[best_start][2]
+        ):
+            skyline[best_start][1] += skyline[best_start + 1][1]
+            del skyline[best_start + 1]
+
+    return positions
+
+
+def pack(
+    sizes: Sequence[Size],
+    ratio: float,
+    gap: Tuple[float, float] = (0, 0),
+) -> Tuple[float, float, List[Position]]:
+    """
+    矩形包装
+    Args:
+        sizes (Sequence[Size]): 每个矩形的 (宽, 高)
+        ratio (float): 区域的长宽比 A/B
+        gap = (0, 0) (Tuple[float, float], optional): 矩形之间的横向、纵向间距
+
+    Returns:
+        Tuple[float, float, List[Position]]: (实际用到的宽, 实际用到的高, 每个矩形的左上角)，
+            positions 和 sizes 同序
+    """
+    if not sizes:
+        return 0, 0, []
+
+    gap_x, gap_y = gap
+    # 间距算进矩形里，最后再减掉最右、最下的那一份
+    rects = [(w + gap_x, h + gap_y) for w, h in sizes]
+    order = sorted(range(len(rects)), key=lambda i: (-rects[i][1], -rects[i][0]))
+
+    widest = max(w for w, _ in rects)
+    total_height = sum(h for _, h in rects)
+    total_area = sum(w * h for w, h in rects)
+
+    # 下界：最高的矩形，和面积刚好够的高度
+    low = math.ceil(max(max(h for _, h in rects), math.sqrt(total_area / ratio)))
+    # 一定放得下的上界：排成一列
+    feasible = math.ceil(max(total_height, widest / ratio))
+
+    # 热启动：先试下界，不行再放大，比直接从上界二分少很多次
+    best = None
+    high = low
+    while high < feasible:
+        best = _place_all(rects, order, ratio * high, high)
+        if best is not None:
+            break
+        low = high + 1
+        high = min(feasible, math.ceil(high * 1.25) + 1)
+    if best is None:
+        high = feasible
+        best = _place_all(rects, order, ratio * high, high)
+
+    # 整像素二分：low 之下都放不下，high 放得下
+    while low < high:
+        mid = (low + high) // 2
+        positions = _place_all(rects, order, ratio * mid, mid)
+        if positions is None:
+            low = mid + 1
+        else:
+            high, best = mid, positions
+
+    used_width = max(x + w for (x, _), (w, _) in zip(best, rects)) - gap_x
+    used_height = max(y + h for (_, y), (_, h) in zip(best, rects)) - gap_y
+    return used_width, used_height, best
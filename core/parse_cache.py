@@ -0,0 +1,219 @@
+# sys
+from pathlib import Path
+import tempfile
+import hashlib
+import logging
+import shutil
+import json
+import os
+
+# lib function
+from contextlib import contextmanager
+from typing import BinaryIO, Dict, Iterator, Optional, Tuple
+
+# 设置了的话解析缓存、布局缓存都放在这个目录下，而不是仓库的 tmp/（测试、基准测试用，不碰开发者的缓存）
+CACHE_DIR_ENV = "CONFUSEFULLIEST_CACHE_DIR"
+
+
+def cache_path(name: str) -> Path:
+    """缓存目录（`tmp/`，或者 `CACHE_DIR_ENV`）下的 name"""
+    root = os.environ.get(CACHE_DIR_ENV)
+    return Path(root or Path(__file__).parent.parent / "tmp") / name
+
+
+class ParseCache:
+    """
+    解析结果的磁盘缓存
+    key = 源码内容哈希 + 解析器版本 + tsconfig（以及其他影响输出的解析选项），
+    命中就不用再跑一次 Node
+
+    每条缓存一个文件，文件的 mtime 当作最近使用时间，
+    总大小超过 `max_bytes` 时按 LRU 淘汰
+    """
+
+    def __init__(
+        self, cache_dir: Optional[str] = None, max_bytes: int = 256 * 1024 * 1024
+    ):
+        """
+        Args:
+            cache_dir = "tmp/parse_cache" (str, optional): 缓存目录（见 `CACHE_DIR_ENV`）
+            max_bytes = 256MB (int, optional): 缓存总大小上限
+        """
+        self.cache_dir = Path(cache_dir or cache_path("parse_cache"))
+        self.max_bytes = max_bytes
+        self.logger = logging.getLogger(__name__)
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.stores = 0
+        # key -> (大小, 最近使用时间)，第一次用到时才扫目录
+        self._index: Optional[Dict[str, Tuple[int, float]]] = None
+
+    @staticmethod
+    def key(
+        source: bytes, parser_version: str, tsconfig: str, extra: Optional[Dict] = None
+    ) -> str:
+        """
+        Args:
+            source (bytes): 源文件内容
+            parser_version (str): 解析器版本（最好连解析器本身的哈希一起带上）
+            tsconfig (str): 解析器读到的 tsconfig 内容
+            extra = None (Dict, optional): 其他会改变解析输出的选项
+
+        Returns:
+            str: 缓存 key（sha256 hex）
+        """
+        digest = hashlib.sha256()
+        digest.update(hashlib.sha256(source).digest())
+        for part in (
+            parser_version,
+            tsconfig,
+            json.dumps(extra or {}, sort_keys=True),
+        ):
+            digest.update(b"\0" + part.encode("utf-8"))
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.json"
+
+    def _load_index(self) -> Dict[str, Tuple[int, float]]:
+        if self._index is None:
+            self._index = {}
+            if self.cache_dir.exists():
+                for entry in self.cache_dir.glob("*/*.json"):
+                    try:
+                        st = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    self._index[entry.stem] = (st.st_size, st.st_mtime)
+        return self._index
+
+    def path(self, key: str) -> Optional[Path]:
+        """
+        命中时返回缓存文件的位置（交给 `core.ast_stream` 流式读），没有就返回 None
+        """
+        path = self._path(key)
+        try:
+            # 刷新 mtime，算作最近使用
+            os.utime(path)
+            st = path.stat()
+        except FileNotFoundError:
+            self.misses += 1
+            self._load_index().pop(key, None)
+            return None
+
+        self.hits += 1
+        self._load_index()[key] = (st.st_size, st.st_mtime)
+        return path
+
+    def get(self, key: str) -> Optional[Dict]:
+        """取缓存并整个读进来，没有就返回 None"""
+        path = self.path(key)
+        if path is None:
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def put_file(self, key: str, source: Path, move: bool = False):
+        """
+        把解析器的输出文件放进缓存，写完检查一下总大小
+        Args:
+            key (str): 缓存 key
+            source (Path): 解析器输出的文件
+            move = False (bool, optional): 直接挪过去而不是复制
+        """
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # 先放到临时文件再替换，并发的批量进程不会读到半截文件
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        if move:
+            shutil.move(source, tmp)
+        else:
+            shutil.copyfile(source, tmp)
+        os.replace(tmp, path)
+        self._stored(key, path)
+
+    @contextmanager
+    def writing(self, key: str) -> Iterator[BinaryIO]:
+        """
+        边读解析器的输出边写进缓存（json 或紧凑格式的原始字节）
+        with 正常结束才换上去；中途出错就删掉写了一半的临时文件，缓存里不会有半截的结果
+        """
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # 同一个进程里也可能有几个同时在写同一条（parse_async），临时文件名不能只带 pid
+        f = tempfile.NamedTemporaryFile(
+            dir=path.parent, prefix=f"{key}.", suffix=".tmp", delete=False
+        )
+        try:
+            yield f
+        except BaseException:
+            f.close()
+            os.remove(f.name)
+            raise
+        f.close()
+        os.replace(f.name, path)
+        self._stored(key, path)
+
+    def put(self, key: str, result: Dict):
+        """把已经在内存里的解析结果写进缓存"""
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(result, f, separators=(",", ":"))
+        os.replace(tmp, path)
+        self._stored(key, path)
+
+    def _stored(self, key: str, path: Path):
+        st = path.stat()
+        self._load_index()[key] = (st.st_size, st.st_mtime)
+        self.stores += 1
+        self._evict()
+
+    def _evict(self):
+        index = self._load_index()
+        total = sum(size for size, _ in index.values())
+        if total <= self.max_bytes:
+            return
+        for key, (size, _) in sorted(index.items(), key=lambda item: item[1][1]):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+            del index[key]
+            total -= size
+            self.evictions += 1
+
+    def invalidate(self, key: Optional[str] = None):
+        """
+        让缓存失效
+        Args:
+            key = None (str, optional): 只删这一条；不给就清空整个缓存
+        """
+        keys = [key] if key else list(self._load_index())
+        for k in keys:
+            try:
+                os.remove(self._path(k))
+            except FileNotFoundError:
+                pass
+            self._load_index().pop(k, None)
+        self.logger.info(f"Invalidated {len(keys)} parse cache entries")
+
+    def stats(self) -> Dict:
+        """本次运行的命中统计，加上磁盘上的缓存大小"""
+        index = self._load_index()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "entries": len(index),
+            "bytes": sum(size for size, _ in index.values()),
+            "max_bytes": self.max_bytes,
+        }
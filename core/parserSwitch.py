@@ -1,16 +1,72 @@
 # sys
 from pathlib import Path
 import subprocess
+import threading
 import logging
-import os
+import hashlib
+import time
+import re
 import json
+import io
 
 "".removesuffix
 # lib function
-from typing import Dict, Optional
-from promise import Promise
+from typing import TYPE_CHECKING, Any, AsyncIterator, BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, TypedDict, Union
+from contextlib import ExitStack, contextmanager
 from enum import Enum
 
+from core.parse_cache import ParseCache
+from core.ast_stream import DEFAULT_SECTIONS, iter_analyzed, iter_analyzed_dict
+from core.compact_format import MAGIC, is_compact, iter_compact, read_compact_file
+from core.ast_model import NONE, NodeTable
+from core.profiler import Profiler, span
+from core import toolchain
+
+if TYPE_CHECKING:
+    # asyncio、常驻进程和符号索引（sqlite3）只在用到的时候才导入，`main.py` 缓存命中时不用付它们的导入时间
+    import asyncio
+    from core.parser_worker import AsyncParserWorker, ParserWorker
+    from core.symbol_index import SymbolIndex
+
+# 要更新符号索引时多读 idMap
+SYMBOL_SECTIONS = DEFAULT_SECTIONS + ("AnalyzedAST.idMap{}",)
+# 原样放进结果的列表，给依赖图用（见 `core.dependency_graph`）
+LINK_SECTIONS = {
+    "AnalyzedAST.imports[]": "imports",
+    "AnalyzedAST.exports[]": "exports",
+    "AnalyzedAST.relations[]": "relations",
+}
+
+
+# 读解析器输出的块大小
+CHUNK_SIZE = 1 << 16
+
+
+class _Tee(io.RawIOBase):
+    """读解析器输出的同时原样写进 sinks（缓存、`keep_output`），不用先攒成一整块"""
+
+    def __init__(self, source: BinaryIO, sinks: List[BinaryIO]):
+        self._source = source
+        self._sinks = sinks
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        n = self._source.readinto(buffer)
+        if n:
+            chunk = memoryview(buffer)[:n]
+            for sink in self._sinks:
+                sink.write(chunk)
+        return n
+
+
+class ParseOutcome(TypedDict, total=False):
+    file: str
+    result: Optional[Dict]  # 同 `CodeParser.parsingFile` 的返回值
+    error: Optional[Exception]
+    seconds: float  # 从开始排队到解析完
+
 
 class CodeParser:
     """
@@ -26,118 +82,649 @@ class CodeParser:
     内置路径，以后会移至到`setting/`
     """
 
-    def parsingFile(self, filePath: str, outDir: Optional[str]) -> Promise:
+    typeMap: Dict[str, str] = {
+        "ClassDeclaration": "class",
+        "ClassExpression": "class",
+        "FunctionDeclaration": "function",
+        "FunctionExpression": "function",
+        "ArrowFunction": "function",
+        "MethodDeclaration": "function",
+        "Constructor": "function",
+        "GetAccessor": "function",
+        "SetAccessor": "function",
+        "InterfaceDeclaration": "interface",
+        "EnumDeclaration": "enum",
+        "VariableStatement": "variable",
+        "VariableDeclaration": "variable",
+        "PropertyDeclaration": "property",
+        "PropertySignature": "property",
+    }
+    """
+    解析器的 statementType 到绘图器节点 type 的映射，没列出来的就没有 type
+    """
+
+    def __init__(
+        self,
+        use_worker: bool = False,
+        worker_max_requests: int = 500,
+        worker_timeout: Optional[float] = 300,
+        cache: Optional[ParseCache] = None,
+        format: str = "json",
+        node_filter: Optional[Dict] = None,
+        profiler: Optional[Profiler] = None,
+        concurrency: int = 4,
+        symbol_index: Optional["SymbolIndex"] = None,
+        type_check: bool = False,
+        keep_output: Optional[str] = None,
+    ):
         """
-        处理文件
         Args:
-            filePath (str): 目标文件的位置
-            outDir = "/tmp/xx_analyzed.json" (str, optional): 输出的位置
+            use_worker = False (bool, optional): 用常驻的解析进程，而不是每个文件起一次 `npx ts-node`
+            worker_max_requests = 500 (int, optional): 常驻进程处理多少个文件后重启
+            worker_timeout = 300 (float, optional): 常驻进程解析一个文件最多等多少秒，超时杀掉重启，None 是一直等
+            cache = None (ParseCache, optional): 解析结果缓存，源码没变就不再跑解析器
+            format = "json" (str, optional): 解析器输出格式，"json"（方便调试）或 "compact"（二进制，快得多）
+            node_filter = None (Dict, optional): 交给解析器的节点过滤
+                `{"keep": [SyntaxKind...], "collapse": [SyntaxKind...], "maxDepth": int}`，
+                解析器遍历时就把不要的节点剪掉（见 index.ts 的 `NodeFilter`）
+            profiler = None (Profiler, optional): 记录查缓存、跑解析器、读结果各阶段，并合并解析器自己的指标
+            concurrency = 4 (int, optional): `parse_async` 同时跑几个解析器
+            symbol_index = None (SymbolIndex, optional): 解析完顺便把文件的符号写进索引（内容没变的文件跳过）
+            type_check = False (bool, optional): 让解析器做类型检查：idMap 带上 typeText，Metadata 带上 diagnostics。
+                常驻进程里所有文件共用一个增量 program，只有第一个文件要载入 lib.d.ts；
+                结果还取决于 import 进来的文件，不走解析缓存
+            keep_output = None (str, optional): 解析器的原始输出另存一份到这个目录，调试用。
+                平时解析器的输出从管道边读边转换，不落盘，也不整块留在内存里（放进缓存的那份同样边读边写）
+        """
+        if format not in ("json", "compact"):
+            raise ValueError(f"Unknown analyzer output format: {format}")
+        unknown = set(node_filter or ()) - {"keep", "collapse", "maxDepth"}
+        if unknown:
+            raise ValueError(f"Unknown node filter fields: {sorted(unknown)}")
+        self.logger = logging.getLogger(__name__)
+        self.use_worker = use_worker
+        self.worker_max_requests = worker_max_requests
+        self.worker_timeout = worker_timeout
+        self.cache = cache
+        self.format = format
+        # 空的字段不传，没有过滤时和不给一样（缓存键也一样）
+        self.node_filter = {
+            key: value
+            for key, value in (node_filter or {}).items()
+            if value is not None and value != []
+        }
+        self.profiler = profiler
+        self.concurrency = max(1, concurrency)
+        self.symbol_index = symbol_index
+        self.type_check = type_check
+        self.keep_output = keep_output
+        self._workers: Dict[str, ParserWorker] = {}
+        # parse_async 用的，绑定在一个事件循环上，见 `_async_slots`
+        self._async_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._idle_workers: Dict[str, List[AsyncParserWorker]] = {}
+        self._parser_versions: Dict[str, str] = {}
+
+    def _parser_version(self, parser_path: Path) -> str:
+        """解析器声明的版本号加上解析器源码的哈希，改了解析器缓存自然失效"""
+        key = str(parser_path)
+        if key not in self._parser_versions:
+            source = parser_path.read_bytes()
+            declared = re.search(rb'parser_version\s*=\s*"([^"]*)"', source)
+            self._parser_versions[key] = (
+                (declared.group(1).decode() if declared else "")
+                + "+"
+                + hashlib.sha256(source).hexdigest()[:16]
+            )
+        return self._parser_versions[key]
+
+    def _cache_key(self, path: Path, parser_path: Path, base_dir: Path) -> str:
+        # 解析器在 base_dir 下读 tsconfig.json
+        tsconfig_path = base_dir / "tsconfig.json"
+        tsconfig = (
+            tsconfig_path.read_text(encoding="utf-8") if tsconfig_path.exists() else ""
+        )
+        extra: Dict[str, Any] = {"format": self.format}
+        if self.node_filter:
+            extra["filter"] = self.node_filter
+        return ParseCache.key(path.read_bytes(), self._parser_version(parser_path), tsconfig, extra)
+
+    def _filter_args(self) -> List[str]:
+        """node_filter 对应的解析器命令行参数"""
+        args = []
+        if "keep" in self.node_filter:
+            args += ["--keep", ",".join(self.node_filter["keep"])]
+        if "collapse" in self.node_filter:
+            args += ["--collapse", ",".join(self.node_filter["collapse"])]
+        if "maxDepth" in self.node_filter:
+            args += ["--max-depth", str(self.node_filter["maxDepth"])]
+        return args
+
+    def _worker_command(self, parser_path: Path) -> List[str]:
+        command = [*toolchain.ts_node_command(), str(parser_path), "--worker"]
+        if self.type_check:
+            # 也决定 worker 退出时要不要存 .tsbuildinfo
+            command.append("--no-skip-type-check")
+        return command
+
+    def _get_worker(self, parser_path: Path, base_dir: Path) -> "ParserWorker":
+        """同一个解析器只开一个常驻进程（js、ts 共用 ts-js.parser）"""
+        from core.parser_worker import ParserWorker
+
+        key = str(parser_path)
+        if key not in self._workers:
+            self._workers[key] = ParserWorker(
+                self._worker_command(parser_path),
+                cwd=str(base_dir),
+                max_requests=self.worker_max_requests,
+                timeout=self.worker_timeout,
+            )
+        return self._workers[key]
+
+    def close(self):
+        """关掉所有常驻解析进程"""
+        for worker in self._workers.values():
+            worker.close()
+        self._workers.clear()
+
+    def __enter__(self):
+        return self
 
+    def __exit__(self, *exc):
+        self.close()
+
+    def _standardize_ast(self, result: Dict) -> Dict:
+        """
+        把解析器的 AnalyzedJSON 转成绘图器要的结构
+        `{"nodes": [{"name", "kind", "type", "children"...}], "metadata": {...},
+          "imports": [...], "exports": [...], "relations": [...]}`
+        nodes 是 `core.ast_model.NodeList`：存在紧凑的 `NodeTable` 里，用法和 dict 列表一样；
+        imports / exports / relations 是解析器给的原样（见 AnalyzedJSON 的说明）
+        """
+        return self._standardize_events(iter_analyzed_dict(result))
+
+    def _standardize_events(
+        self, events: Iterable[Tuple[str, Any]], source: Optional[bytes] = None
+    ) -> Dict:
+        """
+        同 `_standardize_ast`，但吃的是 `core.ast_stream` 吐出来的 (section, 值)，
+        statements 一条一条转换，不用先把整个解析结果读进内存
+        给了 source（源文件内容）时结果里多一个 `symbols`（见 `core.symbol_index`）
+        """
+
+        table = NodeTable()
+
+        def convert(statement: Dict):
+            # 先序追加，显式栈，嵌套多深都不会爆栈
+            stack = [(statement, NONE)]
+            while stack:
+                statement, parent = stack.pop()
+                kind = statement.get("statementType", "")
+                node = {
+                    "id": statement.get("id"),
+                    "name": statement.get("name") or "",
+                    "kind": kind,
+                }
+                if kind in self.typeMap:
+                    node["type"] = self.typeMap[kind]
+                index = table.add(parent, node)
+                children = statement.get("children") or []
+                stack.extend((child, index) for child in reversed(children))
+
+        standardized = {"nodes": table.nodes(), "metadata": {}, "compilerMetadata": {}}
+        for key in LINK_SECTIONS.values():
+            standardized[key] = []
+        # 符号优先取 idMap，没有 idMap（紧凑格式）再用 statements
+        statements: List[Dict] = []
+        id_map: List[Tuple[str, Dict]] = []
+        for section, value in events:
+            if section == "AnalyzedAST.statements[]":
+                convert(value)
+                if source is not None:
+                    statements.append(value)
+            elif section in LINK_SECTIONS:
+                standardized[LINK_SECTIONS[section]].append(value)
+            elif section == "AnalyzedAST.idMap{}":
+                id_map.append(value)
+            elif section == "Metadata":
+                standardized["metadata"] = value
+            elif section == "compilerMetadata":
+                standardized["compilerMetadata"] = value
+        if source is not None:
+            from core.symbol_index import symbols_from_id_map, symbols_from_statements
+
+            standardized["symbols"] = list(
+                symbols_from_id_map(id_map, source)
+                if id_map
+                else symbols_from_statements(statements, source)
+            )
+        return standardized
+
+    def _standardize_file(
+        self, analyzed: Union[Path, BinaryIO], source: Optional[bytes] = None
+    ) -> Dict:
+        """
+        读取解析器输出并转换，按文件头区分紧凑格式和 JSON（JSON 流式读）
+        analyzed 是缓存里的文件，或者解析器输出的二进制流（管道：边读边转换，一直读到 EOF）；
+        source 见 `_standardize_events`
+        """
+        sections = DEFAULT_SECTIONS if source is None else SYMBOL_SECTIONS
+        if not isinstance(analyzed, Path):
+            reader = io.BufferedReader(analyzed, CHUNK_SIZE)
+            # peek 不保证给够 4 个字节；JSON 总是 "{" 开头，看第一个字节就够了
+            head = reader.peek(1)[:1]
+            if not head:
+                raise EOFError("Analyzer output is empty")
+            if head == MAGIC[:1]:
+                # 紧凑格式要整块解码（见 `core.compact_format`），它本来就小
+                return self._standardize_events(iter_compact(reader.read()), source)
+            text = io.TextIOWrapper(reader, encoding="utf-8")
+            standardized = self._standardize_events(iter_analyzed(text, sections), source)
+            text.detach()
+            # 要的部分读完了也要读到底：tee 才完整，worker 的下一个响应才对得上
+            while reader.read(CHUNK_SIZE):
+                pass
+            return standardized
+
+        with open(analyzed, "rb") as f:
+            head = f.read(4)
+        if is_compact(head):
+            return self._standardize_events(read_compact_file(analyzed), source)
+        with open(analyzed, "r", encoding="utf-8") as f:
+            return self._standardize_events(iter_analyzed(f, sections), source)
+
+    def _resolve(self, filePath: str) -> Tuple[Path, str, Path, Path]:
+        """
+        检查文件和对应的解析器
         Returns:
-            Promise：
+            Tuple[Path, str, Path, Path]: (文件, 文件类型, 解析器, 解析器的工作目录)
         """
+        path = Path(filePath)
+        # 文件尾缀，过滤后是支持的语言类型之一
+        fileType: str = path.suffix.lower().removeprefix(".")
 
-        def resolver(resolve, reject):
-            nonlocal outDir
-            try:
-                path = Path(filePath)
-                # 文件尾缀，过滤后是支持的语言类型之一
-                fileType: str = path.suffix.lower().removeprefix(".")
-
-                if not path.exists():
-                    self.logger.error(f"File not found: {filePath}")
-                    reject(FileNotFoundError(f"File not found: {filePath}"))
-                    return
-
-                if not fileType in self.parserList:
-                    self.logger.error(f"FileType not supported: {path.suffix.lower()}")
-                    self.logger.info(f"*info* Supported: {self.parserList.keys}")
-                    reject(ValueError(f"FileType not supported: {path.suffix.lower()}"))
-                    return
-
-                base_dir = Path(__file__).parent.parent
-                parser_path = base_dir / self.parserList[fileType]
-                outDir = (
-                    (outDir if outDir else base_dir)
-                    / "tmp"
-                    / f"{fileType}.analyzed.json"
+        if not path.exists():
+            self.logger.error(f"File not found: {filePath}")
+            raise FileNotFoundError(f"File not found: {filePath}")
+
+        if not fileType in self.parserList:
+            self.logger.error(f"FileType not supported: {path.suffix.lower()}")
+            self.logger.info(f"*info* Supported: {self.parserList.keys}")
+            raise ValueError(f"FileType not supported: {path.suffix.lower()}")
+
+        base_dir = Path(__file__).parent.parent
+        parser_path = base_dir / self.parserList[fileType]
+        self.logger.info(f"Trying to parse with: {parser_path}")
+
+        if not parser_path.exists():
+            self.logger.error(f"{fileType} parser not found at: {parser_path}")
+            raise FileNotFoundError(f"{fileType} parser not found at: {parser_path}")
+        return path, fileType, parser_path, base_dir
+
+    def _lookup_cache(
+        self, path: Path, parser_path: Path, base_dir: Path
+    ) -> Tuple[Optional[Path], Optional[str]]:
+        """Returns: (缓存里的解析结果（没命中是 None）, 缓存 key（不用缓存是 None）)"""
+        if self.cache is None:
+            return None, None
+        if self.type_check:
+            # 键只有这个文件的内容，import 进来的文件改了类型也会变，缓存会给出过时的类型
+            self.logger.debug(f"Type checking, parse cache skipped: {path}")
+            return None, None
+        with span(self.profiler, "parse.cache"):
+            cache_key = self._cache_key(path, parser_path, base_dir)
+            analyzed = self.cache.path(cache_key)
+        if analyzed is not None:
+            self.logger.info(f"Parse cache hit: {path}")
+        return analyzed, cache_key
+
+    def _analyzer_command(self, parser_path: Path, filePath: Path) -> List[str]:
+        """单次运行的命令，输出文件给 "-"：结果写到 stdout，日志走 stderr"""
+        return [
+            *toolchain.ts_node_command(),
+            str(parser_path),
+            str(filePath),
+            "-",
+            "--format",
+            self.format,
+            *self._filter_args(),
+            *(["--no-skip-type-check"] if self.type_check else []),
+        ]
+
+    def _worker_options(self) -> Dict:
+        # payload：结果的原始字节跟在响应行后面回来，不经过临时文件
+        options: Dict[str, Any] = {"format": self.format, "payload": True}
+        if self.node_filter:
+            options["filter"] = self.node_filter
+        if self.type_check:
+            options["typeCheck"] = True
+        return options
+
+    def _symbol_source(self, path: Path) -> Tuple[Optional[bytes], Optional[str]]:
+        """
+        符号索引要的 (源文件内容, 内容哈希)：没开索引是 (None, None)，
+        索引里已经是这个内容时源文件内容是 None（idMap 不用读）
+        """
+        if self.symbol_index is None:
+            return None, None
+        from core.symbol_index import content_hash
+
+        source = path.read_bytes()
+        digest = content_hash(source)
+        if self.symbol_index.is_current(str(path), digest):
+            return None, digest
+        return source, digest
+
+    @contextmanager
+    def _capture(
+        self, path: Path, cache_key: Optional[str], outDir: Optional[str] = None
+    ) -> Iterator[List[BinaryIO]]:
+        """
+        解析器刚输出的结果要原样另存的地方：缓存（with 正常结束才换上去）和 keep 目录（见 `keep_output`）
+        交给 `_Tee` 边读边写
+        """
+        with ExitStack() as stack:
+            sinks = []
+            if cache_key:
+                sinks.append(stack.enter_context(self.cache.writing(cache_key)))
+            keep_dir = outDir or self.keep_output
+            if keep_dir:
+                suffix = ".analyzed" if self.format == "compact" else ".analyzed.json"
+                kept = Path(keep_dir) / f"{path.name}{suffix}"
+                kept.parent.mkdir(parents=True, exist_ok=True)
+                sinks.append(stack.enter_context(open(kept, "wb")))
+                self.logger.info(f"Keeping analyzer output at: {kept}")
+            yield sinks
+
+    def _load(
+        self,
+        analyzed: Union[Path, BinaryIO],
+        source: Optional[bytes],
+        sinks: Optional[List[BinaryIO]] = None,
+    ) -> Dict:
+        """读解析结果（缓存文件，或者解析器的输出流，给了 sinks 就边读边写进去）"""
+        with span(self.profiler, "parse.load"):
+            if sinks:
+                analyzed = _Tee(analyzed, sinks)
+            return self._standardize_file(analyzed, source)
+
+    def _load_fresh(
+        self,
+        path: Path,
+        stream: BinaryIO,
+        cache_key: Optional[str],
+        outDir: Optional[str],
+        source: Optional[bytes],
+    ) -> Dict:
+        """常驻进程回传的 payload：边读边转换、边写进缓存，读完才换上缓存；每次调用都从头来（worker 重试时）"""
+        with self._capture(path, cache_key, outDir) as sinks:
+            return self._load(stream, source, sinks)
+
+    def _finish(
+        self, path: Path, standardized: Dict, digest: Optional[str], fresh: bool
+    ) -> Dict:
+        """更新符号索引（见 `_symbol_source`），记下解析器的指标"""
+        if "symbols" in standardized:
+            with span(self.profiler, "parse.index"):
+                count = self.symbol_index.update(
+                    str(path), digest, standardized.pop("symbols")
                 )
+            self.logger.info(f"Indexed {count} symbols: {path}")
+        if self.profiler is not None:
+            self.profiler.merge_analyzer(standardized["metadata"], cached=not fresh)
+            self.profiler.count("nodes", len(standardized["nodes"]))
+        return standardized
 
-                try:
-                    os.remove(outDir)
-                except Exception:
-                    pass
+    @contextmanager
+    def _analyzer_output(
+        self, parser_path: Path, base_dir: Path, path: Path
+    ) -> Iterator[BinaryIO]:
+        """
+        单次运行的解析器，交出它的 stdout 边读边处理，结束时检查返回码（见 `_check_analyzer`）
+        """
+        process = subprocess.Popen(
+            self._analyzer_command(parser_path, path),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            cwd=str(base_dir),
+        )
+        stderr: List[bytes] = []
+        # stderr 是解析器的日志，另开线程收着，不然它的管道塞满解析器会卡住
+        drain = threading.Thread(target=lambda: stderr.extend(process.stderr), daemon=True)
+        drain.start()
+        failure = None
+        try:
+            yield process.stdout
+        except BaseException as e:
+            failure = e
+            if not isinstance(e, EOFError):
+                process.kill()
+        finally:
+            process.stdout.close()
+            process.wait()
+            drain.join()
+        self._check_analyzer(path, process.returncode, b"".join(stderr), failure)
+
+    def _check_analyzer(
+        self,
+        path: Path,
+        returncode: int,
+        stderr: bytes,
+        failure: Optional[BaseException],
+    ):
+        """
+        单次运行的解析器结束之后：解析器失败（没有输出、返回码不是 0）时抛出带着它的 stderr 的错误，
+        读输出时出的其他错原样抛出
+        """
+        message = stderr.decode("utf-8", errors="replace")
+        self.logger.debug(message)
+        if failure is None and returncode == 0:
+            return
+        if failure is None or isinstance(failure, EOFError):
+            raise FileNotFoundError(
+                f"Analyzer failed on {path} (exit {returncode}): {message}"
+            ) from failure
+        raise failure
 
-                self.logger.info(f"Trying to parse with: {parser_path}")
+    def parsingFile(self, filePath: str, outDir: Optional[str] = None) -> Dict:
+        """
+        处理文件（阻塞），需要并发的用 `parse_async` / `parse_many`
+        Args:
+            filePath (str): 目标文件的位置
+            outDir = None (str, optional): 解析器的原始输出另存到这个目录，不给就用 `keep_output`
 
-                if not parser_path.exists():
-                    self.logger.error(f"{fileType} parser not found at: {parser_path}")
-                    reject(
-                        FileNotFoundError(
-                            f"{fileType} parser not found at: {parser_path}"
-                        )
-                    )
-                    return
-
-                def handle_js_ts_parsing():
-                    # Node.js路径
-                    try:
-                        node_path = (
-                            subprocess.run(
-                                ["where", "node"], capture_output=True, text=True
-                            )
-                            .stdout.splitlines()[0]
-                            .strip()
-                        )
-                        npm_path = str(Path(node_path).parent / "npx.cmd")
-
-                        # 边run边吐日志
-                        result = subprocess.run(
-                            [
-                                npm_path,
-                                "ts-node",
-                                str(parser_path),
-                                str(filePath),
-                                str(outDir),
-                            ],
-                            capture_output=True,
-                            text=True,
-                            encoding="utf-8",
-                            errors="replace",
-                            cwd=str(base_dir),
-                        )
-                        self.logger.info(result)
-
-                        # 加载JSON
-                        with open(outDir, "r", encoding="utf-8") as f:
-                            data = json.load(f)
-                        return data
-                    except Exception as e:
-                        self.logger.error(
-                            f"Failed to read/parse analyzed.json: {str(e)}"
+        Returns:
+            Dict: 转换好的结果，见 `_standardize_ast`
+        """
+        try:
+            path, fileType, parser_path, base_dir = self._resolve(filePath)
+            analyzed, cache_key = self._lookup_cache(path, parser_path, base_dir)
+            source, digest = self._symbol_source(path)
+
+            if analyzed is not None:
+                standardized = self._load(analyzed, source)
+            else:
+                # 解析器的输出从管道边读边转换，峰值内存只跟最大的一条 statement 有关
+                with span(
+                    self.profiler,
+                    "parse.analyzer",
+                    worker=self.use_worker,
+                    format=self.format,
+                ):
+                    if self.use_worker:
+                        standardized = self._get_worker(parser_path, base_dir).request(
+                            str(path.resolve()),
+                            consume=lambda stream: self._load_fresh(
+                                path, stream, cache_key, outDir, source
+                            ),
+                            **self._worker_options(),
                         )
-                        raise
-
-                result = None
-                match fileType:
-                    case "ts", "js":
-                        result = handle_js_ts_parsing()
-
-                if result:
-                    standardized = self._standardize_ast(result)
-                    resolve(standardized)
-                else:
-                    reject(
-                        ValueError(
-                            "Unsupported file type or parsing failed \nview core/parserSwitch.py 130"
+                    else:
+                        # 解析器失败时缓存也不要
+                        with self._capture(path, cache_key, outDir) as sinks:
+                            with self._analyzer_output(parser_path, base_dir, path) as stdout:
+                                standardized = self._load(stdout, source, sinks)
+
+            return self._finish(path, standardized, digest, fresh=analyzed is None)
+        except Exception as e:
+            self.logger.error(f"Parsing failed: {str(e)}")
+            raise
+
+    async def parse_async(self, filePath: str) -> Dict:
+        """
+        `parsingFile` 的 asyncio 版本：解析器用 asyncio 子进程跑，
+        同时在跑的解析器不超过 `concurrency` 个（常驻进程模式下就是开几个常驻进程），
+        读结果放到线程里做，不卡事件循环（管道里的输出一块一块交给线程，见 `parser_worker.consume_stream`）
+
+        Returns:
+            Dict: 同 `parsingFile`
+        """
+        import asyncio
+
+        try:
+            path, fileType, parser_path, base_dir = self._resolve(filePath)
+            analyzed, cache_key = self._lookup_cache(path, parser_path, base_dir)
+            source, digest = await asyncio.to_thread(self._symbol_source, path)
+
+            if analyzed is not None:
+                standardized = await asyncio.to_thread(self._load, analyzed, source)
+            else:
+                async with self._async_slots():
+                    if self.use_worker:
+                        standardized = await self._run_async_worker(
+                            parser_path,
+                            base_dir,
+                            path,
+                            lambda stream: self._load_fresh(path, stream, cache_key, None, source),
                         )
-                    )
+                    else:
+                        with self._capture(path, cache_key) as sinks:
+                            standardized = await self._run_async_process(
+                                parser_path,
+                                base_dir,
+                                path,
+                                lambda stream: self._load(stream, source, sinks),
+                            )
+
+            return await asyncio.to_thread(
+                self._finish, path, standardized, digest, analyzed is None
+            )
+        except Exception as e:
+            self.logger.error(f"Parsing failed: {str(e)}")
+            raise
+
+    async def parse_many(self, filePaths: Iterable[str]) -> AsyncIterator[ParseOutcome]:
+        """
+        并发解析一批文件，哪个先解析完先交出哪个，调用方可以边收边画
+        单个文件失败不抛出，放在 `error` 里
+
+        Yields:
+            ParseOutcome: 每个文件一个
+        """
+        import asyncio
 
+        async def parse_one(filePath: str) -> ParseOutcome:
+            started = time.perf_counter()
+            outcome: ParseOutcome = {"file": filePath, "result": None, "error": None}
+            try:
+                outcome["result"] = await self.parse_async(filePath)
             except Exception as e:
-                self.logger.error(f"Parsing failed: {str(e)}")
-                reject(e)
+                outcome["error"] = e
+            outcome["seconds"] = time.perf_counter() - started
+            return outcome
+
+        tasks = [asyncio.ensure_future(parse_one(str(p))) for p in filePaths]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def _async_slots(self) -> "asyncio.Semaphore":
+        """同一个事件循环里共用一个信号量，换了循环（又一次 asyncio.run）就重建"""
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        if self._async_loop is not loop:
+            self._async_loop = loop
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+            self._idle_workers = {}
+        return self._semaphore
+
+    async def _run_async_process(
+        self,
+        parser_path: Path,
+        base_dir: Path,
+        path: Path,
+        consume: Callable[[BinaryIO], Dict],
+    ) -> Dict:
+        """同 `_analyzer_output`，consume 在线程里边读边处理解析器的 stdout"""
+        import asyncio
+        from core.parser_worker import consume_stream
+
+        process = await asyncio.create_subprocess_exec(
+            *self._analyzer_command(parser_path, path),
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            cwd=str(base_dir),
+        )
+        stderr = asyncio.ensure_future(process.stderr.read())
+        failure = None
+        try:
+            result = await consume_stream(process.stdout, consume)
+        except BaseException as e:
+            failure = e
+            if not isinstance(e, EOFError) and process.returncode is None:
+                try:
+                    process.kill()
+                except ProcessLookupError:
+                    pass
+        await process.wait()
+        self._check_analyzer(path, process.returncode, await stderr, failure)
+        return result
+
+    async def _run_async_worker(
+        self,
+        parser_path: Path,
+        base_dir: Path,
+        path: Path,
+        consume: Callable[[BinaryIO], Dict],
+    ) -> Dict:
+        from core.parser_worker import AsyncParserWorker
+
+        # 信号量保证闲置 + 在用的 worker 不超过 concurrency 个
+        idle = self._idle_workers.setdefault(str(parser_path), [])
+        worker = (
+            idle.pop()
+            if idle
+            else AsyncParserWorker(
+                self._worker_command(parser_path),
+                cwd=str(base_dir),
+                max_requests=self.worker_max_requests,
+                timeout=self.worker_timeout,
+            )
+        )
+        try:
+            return await worker.request(
+                str(path.resolve()), consume=consume, **self._worker_options()
+            )
+        finally:
+            idle.append(worker)
+
+    async def aclose(self):
+        """关掉 `parse_async` 开的常驻进程（和同步的那些）"""
+        for idle in self._idle_workers.values():
+            for worker in idle:
+                await worker.close()
+        self._idle_workers = {}
+        self.close()
+
+    async def __aenter__(self):
+        return self
 
-        return Promise(resolver)
+    async def __aexit__(self, *exc):
+        await self.aclose()
 
 
 if __name__ == "__main__":
@@ -148,6 +735,7 @@ if __name__ == "__main__":
     parser = CodeParser()
     test_file = "/ts-js.parser/test/sample.ts"
     result = parser.parsingFile(test_file)
+    result["nodes"] = result["nodes"].to_list()
 
     if result:
         print("Parsing successful!")
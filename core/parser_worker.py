@@ -0,0 +1,532 @@
+# sys
+import subprocess
+import threading
+import asyncio
+import logging
+import queue
+import json
+import io
+
+# lib function
+from typing import Any, BinaryIO, Callable, Dict, List, Optional, Union
+
+# 读 payload 的块大小
+CHUNK_SIZE = 1 << 16
+
+
+class ParserWorker:
+    """
+    常驻的解析进程（`xx.parser/index.xx --worker`）
+    只启动一次，之后通过 stdin/stdout 按行收发 JSON，
+    解析器里的 `scriptParser` 一直是热的，不用每个文件都重新编译、重新读 tsconfig
+    `payload=True` 的请求，结果的原始字节紧跟在响应行后面从管道回来（见 index.ts 的 `worker`），
+    所以 stdout 按二进制读；给了 `consume` 时直接把管道交给它边读边处理，不先攒成一整块
+
+    进程崩溃、或者处理满 `max_requests` 个请求之后会自动重启，防止内存一直涨
+    一次请求中途出了任何错（响应对不上、超时、被取消……），管道里可能还留着半个响应，
+    这个进程直接杀掉，下一个请求重新起
+    """
+
+    def __init__(
+        self,
+        command: List[str],
+        cwd: str,
+        max_requests: int = 500,
+        timeout: Optional[float] = 300,
+    ):
+        """
+        Args:
+            command (List[str]): 启动 worker 的完整命令行（已经带上 `--worker`）
+            cwd (str): worker 的工作目录
+            max_requests = 500 (int, optional): 处理多少个请求后重启
+            timeout = 300 (float, optional): 单个请求最多等多少秒，超时杀掉进程、抛 TimeoutError；
+                None 是一直等
+        """
+        self.command = command
+        self.cwd = cwd
+        self.max_requests = max_requests
+        self.timeout = timeout
+        self.logger = logging.getLogger(__name__)
+
+        self._process: Optional[subprocess.Popen] = None
+        self._served = 0
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def start(self):
+        """启动 worker 进程，已经在跑的话什么都不做"""
+        if self.alive:
+            return
+        self.logger.info(f"Starting parser worker: {' '.join(self.command)}")
+        self._process = subprocess.Popen(
+            self.command,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            cwd=self.cwd,
+        )
+        self._served = 0
+        # stderr 是 worker 的日志，不及时读走管道会塞满卡死
+        threading.Thread(
+            target=self._drain_stderr, args=(self._process,), daemon=True
+        ).start()
+
+    def restart(self):
+        self.close()
+        self.start()
+
+    def close(self):
+        """关闭 worker 进程"""
+        process, self._process = self._process, None
+        if process is None:
+            return
+        try:
+            process.stdin.close()
+            process.wait(timeout=5)
+        except Exception:
+            process.kill()
+            process.wait()
+
+    def kill(self):
+        """不等 worker 收尾，直接杀掉（协议已经乱了的时候用）"""
+        process, self._process = self._process, None
+        if process is None:
+            return
+        process.kill()
+        process.wait()
+
+    @property
+    def alive(self) -> bool:
+        return self._process is not None and self._process.poll() is None
+
+    def request(
+        self,
+        filePath: str,
+        out: Optional[str] = None,
+        consume: Optional[Callable[[BinaryIO], Any]] = None,
+        **options,
+    ) -> Any:
+        """
+        让 worker 解析一个文件
+        Args:
+            filePath (str): 目标文件的位置（建议绝对路径，worker 的 cwd 不一定是调用方的）
+            out = None (str, optional): 让 worker 把结果写到这个文件，而不是从管道回传
+            consume = None (Callable[[BinaryIO], Any], optional): `payload=True` 时，
+                拿到只能读到这一个 payload 的二进制流，边读边处理；它没读完的部分之后会被读掉。
+                worker 崩了重试时会再调一次，每次都要从头开始
+            **options: 原样放进请求里的其他字段（如 `format`、`payload`）
+
+        Returns:
+            Any: 解析器原样输出的 AnalyzedJSON；给了 `out` 就是输出文件的位置；
+                `payload=True` 时是解析器输出的原始字节（json 或 compact），给了 consume 就是它的返回值
+        """
+        with self._lock:
+            if self._served >= self.max_requests:
+                self.logger.info(
+                    f"Parser worker served {self._served} requests, recycling"
+                )
+                self.restart()
+
+            try:
+                response = self._roundtrip(filePath, out, consume, options)
+            except (BrokenPipeError, EOFError) as e:
+                # 崩了就重启再试一次，还不行就交给调用方
+                self.logger.warning(f"Parser worker died ({e}), restarting")
+                self.restart()
+                response = self._roundtrip(filePath, out, consume, options)
+
+        return _unwrap(filePath, out, response)
+
+    def _roundtrip(
+        self,
+        filePath: str,
+        out: Optional[str],
+        consume: Optional[Callable[[BinaryIO], Any]],
+        options: Dict,
+    ) -> Dict:
+        self.start()
+        expired = threading.Event()
+
+        def expire(process: subprocess.Popen):
+            # 杀掉进程，卡在读管道上的 `_exchange` 就会读到 EOF
+            expired.set()
+            process.kill()
+
+        watchdog = None
+        if self.timeout is not None:
+            watchdog = threading.Timer(self.timeout, expire, args=(self._process,))
+            watchdog.daemon = True
+            watchdog.start()
+        try:
+            return self._exchange(filePath, out, consume, options)
+        except BaseException:
+            self.kill()
+            if expired.is_set():
+                raise TimeoutError(
+                    f"Parser worker took more than {self.timeout}s on {filePath}"
+                ) from None
+            raise
+        finally:
+            if watchdog is not None:
+                watchdog.cancel()
+
+    def _exchange(
+        self,
+        filePath: str,
+        out: Optional[str],
+        consume: Optional[Callable[[BinaryIO], Any]],
+        options: Dict,
+    ) -> Dict:
+        self._next_id += 1
+        request_id = self._next_id
+        self._process.stdin.write(
+            _encode_request(request_id, filePath, out, options).encode("utf-8")
+        )
+        self._process.stdin.flush()
+
+        line = self._process.stdout.readline()
+        if not line:
+            raise EOFError("parser worker closed its stdout")
+        response = _decode_response(request_id, line.decode("utf-8", errors="replace"))
+        if "bytes" in response:
+            payload = _PayloadReader(self._process.stdout, response["bytes"])
+            if consume is None:
+                response["payload"] = payload.readall()
+            else:
+                response["payload"] = consume(payload)
+                # 下一个响应行紧跟在 payload 后面
+                payload.drain()
+        self._served += 1
+        return response
+
+    def _drain_stderr(self, process: subprocess.Popen):
+        for line in process.stderr:
+            self.logger.debug(f"[worker] {line.decode('utf-8', errors='replace').rstrip()}")
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class AsyncParserWorker:
+    """
+    `ParserWorker` 的 asyncio 版本，协议一样，进程用 `asyncio.create_subprocess_exec` 起
+    一个 worker 同一时间只处理一个请求（Node 那边本来就是串行的），
+    要并发就开几个，见 `CodeParser.parse_async`
+
+    只能在创建它的事件循环里用
+    """
+
+    def __init__(
+        self,
+        command: List[str],
+        cwd: str,
+        max_requests: int = 500,
+        timeout: Optional[float] = 300,
+    ):
+        """参数同 `ParserWorker`"""
+        self.command = command
+        self.cwd = cwd
+        self.max_requests = max_requests
+        self.timeout = timeout
+        self.logger = logging.getLogger(__name__)
+
+        self._process: Optional[asyncio.subprocess.Process] = None
+        self._stderr_task: Optional[asyncio.Task] = None
+        self._served = 0
+        self._next_id = 0
+        self._lock = asyncio.Lock()
+
+    async def start(self):
+        if self.alive:
+            return
+        self.logger.info(f"Starting async parser worker: {' '.join(self.command)}")
+        self._process = await asyncio.create_subprocess_exec(
+            *self.command,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            cwd=self.cwd,
+            # 缓冲超过 2 * limit 才停读管道，limit 大了 payload 会整个堆在缓冲里；
+            # 不给 out 时整个解析结果在一行里回来，超过 limit 的行见 `_read_line`
+            limit=CHUNK_SIZE,
+        )
+        self._served = 0
+        self._stderr_task = asyncio.ensure_future(self._drain_stderr(self._process))
+
+    async def restart(self):
+        await self.close()
+        await self.start()
+
+    async def close(self):
+        process, self._process = self._process, None
+        if process is None:
+            return
+        try:
+            process.stdin.close()
+            await asyncio.wait_for(process.wait(), timeout=5)
+        except Exception:
+            process.kill()
+            await process.wait()
+        if self._stderr_task is not None:
+            await self._stderr_task
+            self._stderr_task = None
+
+    def kill(self):
+        """
+        同 `ParserWorker.kill`，不用 await，请求被取消的时候也能调
+        进程由事件循环回收，stderr 读到 EOF 自己结束
+        """
+        process, self._process = self._process, None
+        self._stderr_task = None
+        if process is not None and process.returncode is None:
+            try:
+                process.kill()
+            except ProcessLookupError:
+                pass
+
+    @property
+    def alive(self) -> bool:
+        return self._process is not None and self._process.returncode is None
+
+    async def request(
+        self,
+        filePath: str,
+        out: Optional[str] = None,
+        consume: Optional[Callable[[BinaryIO], Any]] = None,
+        **options,
+    ) -> Any:
+        """同 `ParserWorker.request`，consume 放在线程里跑（见 `consume_stream`）"""
+        async with self._lock:
+            if self._served >= self.max_requests:
+                self.logger.info(
+                    f"Parser worker served {self._served} requests, recycling"
+                )
+                await self.restart()
+
+            try:
+                response = await self._roundtrip(filePath, out, consume, options)
+            except (BrokenPipeError, ConnectionResetError, EOFError) as e:
+                self.logger.warning(f"Parser worker died ({e}), restarting")
+                await self.restart()
+                response = await self._roundtrip(filePath, out, consume, options)
+
+        return _unwrap(filePath, out, response)
+
+    async def _roundtrip(
+        self,
+        filePath: str,
+        out: Optional[str],
+        consume: Optional[Callable[[BinaryIO], Any]],
+        options: Dict,
+    ) -> Dict:
+        await self.start()
+        try:
+            return await asyncio.wait_for(
+                self._exchange(filePath, out, consume, options), self.timeout
+            )
+        except asyncio.TimeoutError:
+            self.kill()
+            raise TimeoutError(
+                f"Parser worker took more than {self.timeout}s on {filePath}"
+            ) from None
+        except BaseException:
+            # 包括 CancelledError：响应可能读了一半
+            self.kill()
+            raise
+
+    async def _exchange(
+        self,
+        filePath: str,
+        out: Optional[str],
+        consume: Optional[Callable[[BinaryIO], Any]],
+        options: Dict,
+    ) -> Dict:
+        self._next_id += 1
+        request_id = self._next_id
+        self._process.stdin.write(
+            _encode_request(request_id, filePath, out, options).encode("utf-8")
+        )
+        await self._process.stdin.drain()
+
+        line = await _read_line(self._process.stdout)
+        if not line:
+            raise EOFError("parser worker closed its stdout")
+        response = _decode_response(request_id, line.decode("utf-8", errors="replace"))
+        if "bytes" in response:
+            if consume is None:
+                try:
+                    response["payload"] = await self._process.stdout.readexactly(
+                        response["bytes"]
+                    )
+                except asyncio.IncompleteReadError as e:
+                    raise EOFError("parser worker closed its stdout mid-payload") from e
+            else:
+                response["payload"] = await consume_stream(
+                    self._process.stdout, consume, response["bytes"]
+                )
+        self._served += 1
+        return response
+
+    async def _drain_stderr(self, process: asyncio.subprocess.Process):
+        async for line in process.stderr:
+            self.logger.debug(
+                f"[worker] {line.decode('utf-8', errors='replace').rstrip()}"
+            )
+
+
+def _encode_request(
+    request_id: int, filePath: str, out: Optional[str], options: Dict
+) -> str:
+    request = {**options, "id": request_id, "file": filePath}
+    if out:
+        request["out"] = out
+    return json.dumps(request) + "\n"
+
+
+def _decode_response(request_id: int, line: str) -> Dict:
+    response = json.loads(line)
+    if response.get("id") != request_id:
+        raise ValueError(
+            f"Parser worker answered request {response.get('id')}, expected {request_id}"
+        )
+    return response
+
+
+async def _read_line(stream: asyncio.StreamReader) -> bytes:
+    """同 `StreamReader.readline`，但行比 limit 长也行"""
+    parts = []
+    while True:
+        try:
+            parts.append(await stream.readuntil(b"\n"))
+        except asyncio.LimitOverrunError as e:
+            parts.append(await stream.readexactly(e.consumed))
+            continue
+        except asyncio.IncompleteReadError as e:
+            parts.append(e.partial)
+        return b"".join(parts)
+
+
+class _PayloadReader(io.RawIOBase):
+    """worker 的 stdout 上紧跟响应行的 payload，读到它的结尾就是 EOF，不会读进下一个响应"""
+
+    def __init__(self, stream: BinaryIO, size: int):
+        self._stream = stream
+        self.remaining = size
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        if not self.remaining:
+            return 0
+        view = memoryview(buffer)[: self.remaining]
+        # readinto1：管道里有多少先给多少，不等凑满
+        n = self._stream.readinto1(view)
+        if not n:
+            raise EOFError("parser worker closed its stdout mid-payload")
+        self.remaining -= n
+        return n
+
+    def drain(self):
+        """读掉剩下的"""
+        buffer = bytearray(min(self.remaining, CHUNK_SIZE))
+        while self.remaining:
+            self.readinto(buffer)
+
+
+class _ChunkReader(io.RawIOBase):
+    """
+    事件循环里的 `asyncio.StreamReader` 交给线程同步读，见 `consume_stream`
+    事件循环读一块放进队列，线程取一块；队列里最多 window 块，线程读得慢时事件循环就不再读管道
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, window: int = 8):
+        self._loop = loop
+        self._chunks: "queue.SimpleQueue[bytes]" = queue.SimpleQueue()
+        self._slots = asyncio.Semaphore(window)
+        self._pending = memoryview(b"")
+        self._eof = False
+        # 从管道读到的字节数（事件循环这边记）
+        self.fed = 0
+
+    async def feed(self, stream: asyncio.StreamReader, size: Optional[int]):
+        """在事件循环里跑：读到 size 个字节或者 EOF 为止；被取消、出错也会给线程一个 EOF"""
+        try:
+            while size is None or self.fed < size:
+                await self._slots.acquire()
+                limit = CHUNK_SIZE if size is None else min(CHUNK_SIZE, size - self.fed)
+                chunk = await stream.read(limit)
+                if not chunk:
+                    break
+                self.fed += len(chunk)
+                self._chunks.put(chunk)
+        finally:
+            self._chunks.put(b"")
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        if not self._pending:
+            if self._eof:
+                return 0
+            chunk = self._chunks.get()
+            if not chunk:
+                self._eof = True
+                return 0
+            self._loop.call_soon_threadsafe(self._slots.release)
+            self._pending = memoryview(chunk)
+        n = min(len(buffer), len(self._pending))
+        buffer[:n] = self._pending[:n]
+        self._pending = self._pending[n:]
+        return n
+
+
+async def consume_stream(
+    stream: asyncio.StreamReader,
+    consume: Callable[[BinaryIO], Any],
+    size: Optional[int] = None,
+) -> Any:
+    """
+    在线程里用 consume 边读边处理一个 asyncio 的流，事件循环不卡，内存里最多几块
+    Args:
+        stream (asyncio.StreamReader): 子进程的 stdout
+        consume (Callable[[BinaryIO], Any]): 在线程里跑，拿到的是同步的二进制流
+        size = None (int, optional): 只读这么多字节（worker 的 payload），不给就读到 EOF；
+            consume 没读完的也会读掉，不够 size 个字节时抛 EOFError
+
+    Returns:
+        Any: consume 的返回值
+    """
+    reader = _ChunkReader(asyncio.get_running_loop())
+    feeding = asyncio.ensure_future(reader.feed(stream, size))
+
+    def run() -> Any:
+        result = consume(reader)
+        while reader.read(CHUNK_SIZE):
+            pass
+        return result
+
+    try:
+        result = await asyncio.to_thread(run)
+        await feeding
+    except BaseException as e:
+        feeding.cancel()
+        if size is not None and feeding.done() and not feeding.cancelled() and reader.fed < size:
+            raise EOFError("parser worker closed its stdout mid-payload") from e
+        raise
+    if size is not None and reader.fed < size:
+        raise EOFError("parser worker closed its stdout mid-payload")
+    return result
+
+
+def _unwrap(filePath: str, out: Optional[str], response: Dict) -> Any:
+    if not response.get("ok"):
+        raise ValueError(f"Parser worker failed on {filePath}: {response.get('error')}")
+    if "payload" in response:
+        return response["payload"]
+    return response["out"] if out else response["result"]
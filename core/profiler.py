@@ -0,0 +1,203 @@
+"""
+`main.py --profile` 的分阶段记录
+
+每个阶段记墙钟时间、CPU 时间（本进程 + 期间结束的子进程）和到阶段结束为止的内存峰值（RSS）；
+解析器在 `Metadata.parseInfo.phases` 里带回它自己的阶段，合进同一条时间线。
+结果写成两份：
+    xx.profile.json   阶段列表 + 计数（节点数、图元数……）+ 解析器指标，给脚本读
+    xx.trace.json     Chrome trace-event 格式，用 chrome://tracing 或 ui.perfetto.dev 打开
+
+不传 profiler 时各处用 `span(None, ...)`，什么都不做
+"""
+
+# sys
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+import json
+import time
+import sys
+import os
+
+# lib function
+from typing import Dict, List, Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def _peak_rss() -> Optional[int]:
+    """本进程到现在为止的 RSS 峰值（字节），拿不到返回 None"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 是 KB，macOS 是字节
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class Profiler:
+    """一次运行的所有阶段和计数"""
+
+    def __init__(self):
+        self.started = time.time()
+        self.phases: List[Dict] = []
+        self.counters: Dict[str, int] = {}
+        self.analyzer: Dict = {}
+        self._depth = 0
+
+    @contextmanager
+    def phase(self, name: str, **args):
+        """
+        记录一个阶段，可以嵌套
+        Args:
+            name (str): 阶段名
+            **args: 附带的信息，原样写进结果（比如文件名）
+        """
+        record = {
+            "name": name,
+            "start": time.time(),
+            "depth": self._depth,
+            "args": args,
+        }
+        wall = time.perf_counter()
+        times = os.times()
+        self._depth += 1
+        try:
+            yield record
+        finally:
+            self._depth -= 1
+            end = os.times()
+            record["wall"] = time.perf_counter() - wall
+            record["cpu"] = (end.user - times.user) + (end.system - times.system)
+            child_cpu = (end.children_user - times.children_user) + (
+                end.children_system - times.children_system
+            )
+            if child_cpu:
+                record["child_cpu"] = child_cpu
+            record["peak_rss"] = _peak_rss()
+            self.phases.append(record)
+
+    def count(self, name: str, value: int = 1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def merge_analyzer(self, metadata: Dict, cached: bool = False):
+        """
+        合并解析器自己的指标
+        Args:
+            metadata (Dict): 解析结果里的 Metadata
+            cached = False (bool, optional): 结果来自解析缓存，指标是当初那次解析的，不上时间线
+        """
+        parse_info = (metadata or {}).get("parseInfo") or {}
+        keys = ("parserVersion", "timeCost", "memoryUsage", "nodeCount", "identifierCount")
+        self.analyzer = {key: parse_info.get(key) for key in keys}
+        self.analyzer["cached"] = cached
+        self.analyzer["phases"] = parse_info.get("phases") or []
+
+    def report(self) -> Dict:
+        """
+        Returns:
+            Dict: `{"started", "wall", "peak_rss", "phases": [...], "counters", "analyzer"}`，
+                时间单位秒，analyzer 里的保持解析器的毫秒
+        """
+        return {
+            "started": self.started,
+            "wall": time.time() - self.started,
+            "peak_rss": _peak_rss(),
+            "phases": sorted(self.phases, key=lambda p: p["start"]),
+            "counters": self.counters,
+            "analyzer": self.analyzer,
+        }
+
+    def trace_events(self) -> List[Dict]:
+        """Chrome trace-event（"X" 完整事件 + "C" 计数器），时间从 profiler 创建时算起，单位微秒"""
+        pid = os.getpid()
+        events = [
+            {"ph": "M", "name": "process_name", "pid": pid, "args": {"name": "python"}}
+        ]
+        for phase in sorted(self.phases, key=lambda p: p["start"]):
+            ts = (phase["start"] - self.started) * 1e6
+            args = dict(phase["args"], cpu_ms=phase["cpu"] * 1000)
+            if "child_cpu" in phase:
+                args["child_cpu_ms"] = phase["child_cpu"] * 1000
+            events.append(
+                {
+                    "name": phase["name"],
+                    "cat": "python",
+                    "ph": "X",
+                    "ts": ts,
+                    "dur": phase["wall"] * 1e6,
+                    "pid": pid,
+                    "tid": 0,
+                    "args": args,
+                }
+            )
+            if phase["peak_rss"] is not None:
+                events.append(
+                    {
+                        "name": "peak_rss",
+                        "ph": "C",
+                        "ts": ts + phase["wall"] * 1e6,
+                        "pid": pid,
+                        "args": {"bytes": phase["peak_rss"]},
+                    }
+                )
+
+        if not self.analyzer.get("cached"):
+            named = set()
+            for phase in self.analyzer.get("phases", []):
+                analyzer_pid = phase.get("pid", 0)
+                if analyzer_pid not in named:
+                    named.add(analyzer_pid)
+                    events.append(
+                        {
+                            "ph": "M",
+                            "name": "process_name",
+                            "pid": analyzer_pid,
+                            "args": {"name": "analyzer"},
+                        }
+                    )
+                events.append(
+                    {
+                        "name": phase["name"],
+                        "cat": "analyzer",
+                        "ph": "X",
+                        # 解析器给的是 Unix 毫秒
+                        "ts": (phase["start"] / 1000 - self.started) * 1e6,
+                        "dur": phase["wall"] * 1000,
+                        "pid": analyzer_pid,
+                        "tid": 0,
+                        "args": {
+                            "cpu_ms": phase.get("cpu"),
+                            "heap_used": phase.get("heapUsed"),
+                        },
+                    }
+                )
+
+        for name, value in self.counters.items():
+            events.append(
+                {
+                    "name": name,
+                    "ph": "C",
+                    "ts": (time.time() - self.started) * 1e6,
+                    "pid": pid,
+                    "args": {"count": value},
+                }
+            )
+        return events
+
+    def write(self, json_path: str, trace_path: str):
+        """写出 xx.profile.json 和 xx.trace.json"""
+        for path in (json_path, trace_path):
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(self.report(), f, indent=2, ensure_ascii=False)
+        with open(trace_path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": self.trace_events(), "displayTimeUnit": "ms"}, f)
+
+
+def span(profiler: Optional[Profiler], name: str, **args):
+    """`profiler.phase(...)`，profiler 是 None 时什么都不做"""
+    if profiler is None:
+        return nullcontext()
+    return profiler.phase(name, **args)
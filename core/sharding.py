@@ -0,0 +1,132 @@
+"""
+大图分页：把顶层节点分成若干页（shard），每页单独布局，前面再加一页目录链接到各页
+
+分组方式：
+    declaration  每个顶层声明一组，相邻的小组按预算拼到同一页
+    namespace    每个 namespace / module 一组，其余顶层声明归到 "(global)"
+    file         按顶层节点的 `file` 字段（`merge_results` 合并多个文件时加上的），
+                 没有的话用解析结果里的源文件名
+一组超出预算时按顶层节点切成几页（一个顶层节点不会被拆开）
+"""
+
+# sys
+from pathlib import PurePath
+
+# lib function
+from typing import Dict, Iterable, List, Tuple, TypedDict
+
+from core.ast_model import NodeList, NodeTable
+
+SHARD_MODES = ("declaration", "namespace", "file")
+# namespace 模式下单独成组的节点
+NAMESPACE_KINDS = ("ModuleDeclaration", "NamespaceDeclaration")
+
+
+class Shard(TypedDict):
+    title: str
+    roots: List[int]  # 顶层节点在原表里的下标，保持原来的顺序
+    nodes: int  # 这些子树的节点总数
+
+
+def subtree_sizes(table: NodeTable) -> List[int]:
+    """每个节点子树的节点数（父节点下标总比子节点小，倒着扫一遍就行）"""
+    sizes = [1] * len(table)
+    parent = table.parent
+    for index in range(len(table) - 1, -1, -1):
+        if parent[index] >= 0:
+            sizes[parent[index]] += sizes[index]
+    return sizes
+
+
+def _group_key(table: NodeTable, index: int, by: str, source: str) -> str:
+    """顶层节点属于哪一组（namespace / file 模式）"""
+    if by == "namespace":
+        if table.field(index, "kind") in NAMESPACE_KINDS:
+            return table.field(index, "name") or "unnamed"
+        return "(global)"
+    return table.field(index, "file") or source
+
+
+def _pack(roots: List[int], sizes: List[int], budget: int) -> List[List[int]]:
+    """按顺序装页，装不下就换一页"""
+    pages: List[List[int]] = []
+    used = 0
+    for index in roots:
+        if not pages or (pages[-1] and used + sizes[index] > budget):
+            pages.append([])
+            used = 0
+        pages[-1].append(index)
+        used += sizes[index]
+    return pages
+
+
+def plan_shards(ast_data: Dict, by: str = "declaration", budget: int = 2000) -> List[Shard]:
+    """
+    分页
+    Args:
+        ast_data (Dict): `CodeParser` 的结果（nodes 是 `NodeList`）
+        by = "declaration" (str, optional): 分组方式，见模块说明
+        budget = 2000 (int, optional): 每页最多放多少个节点（单个顶层节点超出的话独占一页）
+
+    Returns:
+        List[Shard]: 按顶层节点原来的顺序
+    """
+    if by not in SHARD_MODES:
+        raise ValueError(f"Unknown shard mode: {by} (expected one of {SHARD_MODES})")
+    nodes = ast_data["nodes"]
+    if not isinstance(nodes, NodeList):
+        nodes = NodeTable.from_nodes(nodes).nodes()
+    table = nodes.table
+    sizes = subtree_sizes(table)
+
+    def shard(roots: List[int], title: str) -> Shard:
+        return {"title": title, "roots": roots, "nodes": sum(sizes[i] for i in roots)}
+
+    def span_title(roots: List[int]) -> str:
+        first = table.field(roots[0], "name") or "unnamed"
+        if len(roots) == 1:
+            return first
+        return f"{first} … {table.field(roots[-1], 'name') or 'unnamed'}"
+
+    if by == "declaration":
+        return [shard(roots, span_title(roots)) for roots in _pack(list(table.roots), sizes, budget)]
+
+    target = ((ast_data.get("metadata") or {}).get("sourceInfo") or {}).get("targetPath")
+    source = PurePath(target).name if target else "(input)"
+    # 组按第一次出现的顺序排，组内保持节点原来的顺序
+    groups: Dict[str, List[int]] = {}
+    for index in table.roots:
+        groups.setdefault(_group_key(table, index, by, source), []).append(index)
+
+    shards: List[Shard] = []
+    for key, roots in groups.items():
+        pages = _pack(roots, sizes, budget)
+        for n, page in enumerate(pages, 1):
+            shards.append(shard(page, key if len(pages) == 1 else f"{key} ({n}/{len(pages)})"))
+    return shards
+
+
+def extract(table: NodeTable, roots: Iterable[int]) -> NodeTable:
+    """把几棵子树复制成一张新表（交给子进程的只有这一页的节点）"""
+    shard = NodeTable()
+    for index in roots:
+        shard.add_tree(table.view(index))
+    return shard
+
+
+def merge_results(results: Iterable[Tuple[str, Dict]]) -> Dict:
+    """
+    把多个文件的解析结果合成一个，每个顶层节点带上 `file` 字段，给 `by="file"` 用
+    Args:
+        results (Iterable[Tuple[str, Dict]]): (文件名, `CodeParser` 的结果)
+
+    Returns:
+        Dict: 同 `CodeParser` 的结果，metadata 是 `{"files": {文件名: 原来的 metadata}}`
+    """
+    table = NodeTable()
+    files = {}
+    for name, result in results:
+        files[name] = result.get("metadata", {})
+        for node in result["nodes"]:
+            table.add_tree({**node, "file": name})
+    return {"nodes": table.nodes(), "metadata": {"files": files}, "compilerMetadata": {}}
@@ -0,0 +1,188 @@
+"""
+矩形的空间索引（均匀网格），DrawIOGenerator 用它查重叠、给连线绕开挡路的框
+
+矩形登记到它盖住的每一格；查询只看查询框盖住的那几格，
+代价只和框盖住的格数、格子里的矩形数有关，和索引里一共有多少矩形无关。
+同一层的框（比如顶层容器）大小差不多，格边长取个典型尺寸，每格就只有几个矩形；
+个别特别大的框（嵌套很深的表达式链）盖住的格数会是边长的平方，不分桶，单独放着每次都比
+
+`route` 在索引上找一条绕开障碍的折线：先试 L 形，再试经过两个框之间、框边上空隙的 Z 形，
+每条候选线段查一次索引
+"""
+
+# sys
+import math
+
+# lib function
+from typing import Collection, Dict, Hashable, Iterator, List, Optional, Set, Tuple
+
+Rect = Tuple[float, float, float, float]  # x, y, 宽, 高
+Point = Tuple[float, float]
+
+# 连线和障碍之间至少留的空隙
+CLEARANCE = 20
+# 第二轮最多试多少条候选折线（挡路的框多的时候候选会很多）
+MAX_ROUTES = 64
+# 盖住超过这么多格的框不分桶
+MAX_CELLS = 64
+
+
+class SpatialGrid:
+    """key -> 矩形，按网格分桶"""
+
+    def __init__(self, cell_size: float = 400):
+        """
+        Args:
+            cell_size = 400 (float, optional): 格边长，取登记的框的典型尺寸
+        """
+        self.cell_size = cell_size
+        self.rects: Dict[Hashable, Rect] = {}
+        self._cells: Dict[Tuple[int, int], List[Hashable]] = {}
+        self._large: Set[Hashable] = set()
+
+    def __len__(self) -> int:
+        return len(self.rects)
+
+    def _span(self, rect: Rect) -> Tuple[range, range]:
+        """rect 盖住的格：列号、行号"""
+        x, y, width, height = rect
+        size = self.cell_size
+        return (
+            range(math.floor(x / size), math.floor((x + width) / size) + 1),
+            range(math.floor(y / size), math.floor((y + height) / size) + 1),
+        )
+
+    def insert(self, key: Hashable, rect: Rect):
+        """登记一个框，同一个 key 再登记会先去掉旧的"""
+        if key in self.rects:
+            self.remove(key)
+        self.rects[key] = rect
+        columns, rows = self._span(rect)
+        if len(columns) * len(rows) > MAX_CELLS:
+            self._large.add(key)
+            return
+        for column in columns:
+            for row in rows:
+                self._cells.setdefault((column, row), []).append(key)
+
+    def remove(self, key: Hashable):
+        rect = self.rects.pop(key)
+        if key in self._large:
+            self._large.remove(key)
+            return
+        columns, rows = self._span(rect)
+        for column in columns:
+            for row in rows:
+                bucket = self._cells[column, row]
+                bucket.remove(key)
+                if not bucket:
+                    del self._cells[column, row]
+
+    def _candidates(self, rect: Rect) -> Iterator[Hashable]:
+        """可能和 rect 相交的 key（会有重复）"""
+        columns, rows = self._span(rect)
+        if len(columns) * len(rows) > len(self.rects):
+            # 查询框盖住的格比登记的框还多（很长的线段），不如逐个比
+            yield from self.rects
+            return
+        yield from self._large
+        for column in columns:
+            for row in rows:
+                yield from self._cells.get((column, row), ())
+
+    def query(self, rect: Rect, ignore: Collection[Hashable] = ()) -> Set[Hashable]:
+        """和 rect 相交（只碰到边不算）的框"""
+        x, y, width, height = rect
+        found = set()
+        for key in self._candidates(rect):
+            if key in found or key in ignore:
+                continue
+            ox, oy, other_width, other_height = self.rects[key]
+            if x < ox + other_width and ox < x + width and y < oy + other_height and oy < y + height:
+                found.add(key)
+        return found
+
+    def overlaps(self, rect: Rect, ignore: Collection[Hashable] = ()) -> bool:
+        """同 `bool(query(...))`，碰到一个就返回"""
+        x, y, width, height = rect
+        for key in self._candidates(rect):
+            if key in ignore:
+                continue
+            ox, oy, other_width, other_height = self.rects[key]
+            if x < ox + other_width and ox < x + width and y < oy + other_height and oy < y + height:
+                return True
+        return False
+
+
+def _center(rect: Rect) -> Point:
+    x, y, width, height = rect
+    return x + width / 2, y + height / 2
+
+
+def _segment(a: Point, b: Point) -> Rect:
+    """水平或竖直线段当成没有厚度的框"""
+    return min(a[0], b[0]), min(a[1], b[1]), abs(a[0] - b[0]), abs(a[1] - b[1])
+
+
+def _length(points: List[Point]) -> float:
+    return sum(abs(a[0] - b[0]) + abs(a[1] - b[1]) for a, b in zip(points, points[1:]))
+
+
+def route(
+    grid: SpatialGrid,
+    source: Rect,
+    target: Rect,
+    ignore: Collection[Hashable] = (),
+    clearance: float = CLEARANCE,
+) -> Optional[List[Point]]:
+    """
+    两个框之间绕开 grid 里其他框的正交折线
+    Args:
+        grid (SpatialGrid): 障碍
+        source, target (Rect): 两端的框，线从中心出发
+        ignore = () (Collection[Hashable], optional): 不算障碍的 key（两端自己、包着它们的容器）
+        clearance = CLEARANCE (float, optional): 经过障碍边上时离开多远
+
+    Returns:
+        Optional[List[Point]]: 中间的拐点（不含两端），不用拐就是空列表；找不到返回 None
+    """
+    start, end = _center(source), _center(target)
+
+    def clear(points: List[Point]) -> bool:
+        path = [start] + points + [end]
+        return not any(grid.overlaps(_segment(a, b), ignore) for a, b in zip(path, path[1:]))
+
+    # 从两端的框边上、两个框之间的空隙里找横竖通道，挡路的框边上再加几条
+    xs = {(start[0] + end[0]) / 2}
+    ys = {(start[1] + end[1]) / 2}
+    for x, y, width, height in (source, target):
+        xs.update((x - clearance, x + width + clearance))
+        ys.update((y - clearance, y + height + clearance))
+
+    def candidates() -> List[List[Point]]:
+        paths = [[(end[0], start[1])], [(start[0], end[1])]]
+        paths += [[(x, start[1]), (x, end[1])] for x in xs]
+        paths += [[(start[0], y), (end[0], y)] for y in ys]
+        return sorted(paths, key=lambda points: _length([start] + points + [end]))
+
+    if start[0] == end[0] or start[1] == end[1]:
+        if clear([]):
+            return []
+    tried = []
+    for points in candidates():
+        if clear(points):
+            return points
+        tried.append(points)
+
+    # 都被挡了：沿挡路的框边再试一轮
+    for points in tried:
+        path = [start] + points + [end]
+        for a, b in zip(path, path[1:]):
+            for key in grid.query(_segment(a, b), ignore):
+                x, y, width, height = grid.rects[key]
+                xs.update((x - clearance, x + width + clearance))
+                ys.update((y - clearance, y + height + clearance))
+    for points in candidates()[:MAX_ROUTES]:
+        if clear(points):
+            return points
+    return None
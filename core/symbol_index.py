@@ -0,0 +1,367 @@
+"""
+符号索引：每个文件声明了哪些东西（类、函数、方法、属性、变量……）存进本地 SQLite，
+"X 在哪" "Y 里声明了什么" 直接查表，不用重新解析
+
+来源是解析器的 `AnalyzedAST.idMap`（紧凑格式里没有 idMap，就退回用 statements 树）。
+每个文件按路径存一行，带内容哈希；哈希没变的文件不用重新解析也不用重写，
+变了的文件整个替换掉它的符号（一个事务里做完）
+
+    python main.py symbols index src/             解析并索引（只处理变了的文件）
+    python main.py symbols find Foo --kind ClassDeclaration
+    python main.py symbols find "get*"            glob 通配
+    python main.py symbols file src/a.ts          这个文件声明了什么
+    python main.py symbols prune                  去掉已经不存在的文件
+"""
+
+# sys
+from bisect import bisect_right
+from pathlib import Path
+import argparse
+import threading
+import hashlib
+import sqlite3
+import logging
+import time
+import json
+import sys
+
+# lib function
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, TypedDict
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_VERSION = 1
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    hash TEXT NOT NULL,
+    indexed_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS symbols (
+    file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    container TEXT NOT NULL,
+    start INTEGER NOT NULL,
+    end INTEGER NOT NULL,
+    line INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS symbols_name ON symbols(name);
+CREATE INDEX IF NOT EXISTS symbols_kind ON symbols(kind, name);
+CREATE INDEX IF NOT EXISTS symbols_file ON symbols(file_id);
+"""
+_GLOB_CHARS = "*?["
+
+
+class Symbol(TypedDict):
+    name: str
+    kind: str  # SyntaxKind，比如 "ClassDeclaration"
+    container: str  # 外层声明的名字用 "." 连起来，顶层是 ""
+    start: int  # 源码里的偏移
+    end: int
+    line: int  # 从 1 开始
+
+
+class SymbolRow(Symbol):
+    file: str
+
+
+def content_hash(source: bytes) -> str:
+    return hashlib.sha256(source).hexdigest()
+
+
+def _line_starts(source: bytes) -> List[int]:
+    text = source.decode("utf-8", errors="replace")
+    starts = [0]
+    position = text.find("\n")
+    while position >= 0:
+        starts.append(position + 1)
+        position = text.find("\n", position + 1)
+    return starts
+
+
+def symbols_from_id_map(
+    entries: Iterable[Tuple[str, Dict]], source: bytes
+) -> Iterator[Symbol]:
+    """
+    从 idMap 里挑出具名声明（标识符本身不算，它们只是引用）
+    Args:
+        entries (Iterable[Tuple[str, Dict]]): idMap 的 (id, 项)
+        source (bytes): 源文件内容，算行号用
+    """
+    starts = _line_starts(source)
+    for _, entry in entries:
+        name, kind = entry.get("name"), entry.get("type")
+        if not name or not kind or kind == "Identifier":
+            continue
+        loc = entry.get("loc") or {}
+        start = loc.get("start", 0)
+        yield {
+            "name": name,
+            "kind": kind,
+            "container": entry.get("path") or "",
+            "start": start,
+            "end": loc.get("end", start),
+            "line": bisect_right(starts, start),
+        }
+
+
+def symbols_from_statements(statements: Iterable[Dict], source: bytes) -> Iterator[Symbol]:
+    """没有 idMap 时（紧凑格式）用 statements 树：只有声明，container 由树结构推出来"""
+    starts = _line_starts(source)
+    stack = [(statement, "") for statement in reversed(list(statements))]
+    while stack:
+        statement, container = stack.pop()
+        name = statement.get("name")
+        location = statement.get("location") or {}
+        start = location.get("start", 0)
+        if name:
+            yield {
+                "name": name,
+                "kind": statement.get("statementType", ""),
+                "container": container,
+                "start": start,
+                "end": location.get("end", start),
+                "line": bisect_right(starts, start),
+            }
+            inner = f"{container}.{name}" if container else name
+        else:
+            inner = container
+        stack.extend((child, inner) for child in reversed(statement.get("children") or []))
+
+
+class SymbolIndex:
+    """
+    SQLite 里的符号索引，见模块说明
+    可以多个进程同时写（WAL），同一个对象可以跨线程用（内部加锁）
+    """
+
+    def __init__(self, db_path: Optional[str] = None, timeout: float = 30.0):
+        """
+        Args:
+            db_path = "tmp/symbol_index.sqlite3" (str, optional): 数据库文件
+            timeout = 30 (float, optional): 等别的进程写完的秒数
+        """
+        self.db_path = Path(
+            db_path or Path(__file__).parent.parent / "tmp" / "symbol_index.sqlite3"
+        )
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(
+            str(self.db_path), timeout=timeout, check_same_thread=False
+        )
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("PRAGMA foreign_keys=ON")
+        version = self._db.execute("PRAGMA user_version").fetchone()[0]
+        if version not in (0, SCHEMA_VERSION):
+            # 旧格式的索引直接重建，反正能从源码重新生成
+            logger.info(f"Rebuilding symbol index (schema v{version} -> v{SCHEMA_VERSION})")
+            self._db.executescript("DROP TABLE IF EXISTS symbols; DROP TABLE IF EXISTS files;")
+        self._db.executescript(_SCHEMA)
+        self._db.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+
+    @staticmethod
+    def key(path: str) -> str:
+        """文件在索引里的 key：绝对路径，统一用 /"""
+        return Path(path).resolve().as_posix()
+
+    def file_hash(self, path: str) -> Optional[str]:
+        """索引里这个文件的内容哈希，没索引过是 None"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT hash FROM files WHERE path = ?", (self.key(path),)
+            ).fetchone()
+        return row["hash"] if row else None
+
+    def is_current(self, path: str, digest: str) -> bool:
+        return self.file_hash(path) == digest
+
+    def update(self, path: str, digest: str, symbols: Iterable[Symbol]) -> int:
+        """
+        替换一个文件的全部符号
+        Args:
+            path (str): 源文件
+            digest (str): 源文件内容的哈希（`content_hash`）
+            symbols (Iterable[Symbol]): 这个文件的符号
+
+        Returns:
+            int: 写入的符号个数
+        """
+        rows = [
+            (s["name"], s["kind"], s["container"], s["start"], s["end"], s["line"])
+            for s in symbols
+        ]
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM files WHERE path = ?", (self.key(path),))
+            file_id = self._db.execute(
+                "INSERT INTO files (path, hash, indexed_at) VALUES (?, ?, ?)",
+                (self.key(path), digest, time.time()),
+            ).lastrowid
+            self._db.executemany(
+                "INSERT INTO symbols (file_id, name, kind, container, start, end, line) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(file_id,) + row for row in rows],
+            )
+        return len(rows)
+
+    def remove(self, path: str) -> bool:
+        with self._lock, self._db:
+            cursor = self._db.execute("DELETE FROM files WHERE path = ?", (self.key(path),))
+        return cursor.rowcount > 0
+
+    def prune(self) -> int:
+        """去掉源文件已经不存在的条目，返回去掉的文件数"""
+        with self._lock:
+            paths = [row["path"] for row in self._db.execute("SELECT path FROM files")]
+        gone = [path for path in paths if not Path(path).exists()]
+        with self._lock, self._db:
+            self._db.executemany("DELETE FROM files WHERE path = ?", [(p,) for p in gone])
+        return len(gone)
+
+    def find(
+        self,
+        name: Optional[str] = None,
+        kind: Optional[str] = None,
+        file: Optional[str] = None,
+        container: Optional[str] = None,
+        limit: Optional[int] = 100,
+    ) -> List[SymbolRow]:
+        """
+        查符号，条件之间是"且"
+        Args:
+            name = None (str, optional): 名字，带 `*?[` 时按 glob 匹配（区分大小写）
+            kind = None (str, optional): SyntaxKind
+            file = None (str, optional): 只查这个文件
+            container = None (str, optional): 外层声明（"Foo" 查类 Foo 的成员）
+            limit = 100 (int, optional): 最多返回几条，None 不限
+
+        Returns:
+            List[SymbolRow]: 按文件、位置排序
+        """
+        where, args = [], []
+        if name is not None:
+            where.append("s.name GLOB ?" if any(c in name for c in _GLOB_CHARS) else "s.name = ?")
+            args.append(name)
+        if kind is not None:
+            where.append("s.kind = ?")
+            args.append(kind)
+        if file is not None:
+            where.append("f.path = ?")
+            args.append(self.key(file))
+        if container is not None:
+            where.append("s.container = ?")
+            args.append(container)
+        sql = (
+            "SELECT f.path AS file, s.name, s.kind, s.container, s.start, s.end, s.line "
+            "FROM symbols s JOIN files f ON f.id = s.file_id"
+            + (" WHERE " + " AND ".join(where) if where else "")
+            + " ORDER BY f.path, s.start"
+            + (" LIMIT ?" if limit is not None else "")
+        )
+        if limit is not None:
+            args.append(limit)
+        with self._lock:
+            return [dict(row) for row in self._db.execute(sql, args)]
+
+    def declarations(self, file: str) -> List[SymbolRow]:
+        """这个文件声明了什么（按位置排序）"""
+        return self.find(file=file, limit=None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            files = self._db.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+            symbols = self._db.execute("SELECT COUNT(*) FROM symbols").fetchone()[0]
+        return {
+            "files": files,
+            "symbols": symbols,
+            "bytes": self.db_path.stat().st_size if self.db_path.exists() else 0,
+        }
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _print_rows(rows: List[SymbolRow], as_json: bool):
+    if as_json:
+        print(json.dumps(rows, indent=2, ensure_ascii=False))
+        return
+    for row in rows:
+        qualified = f"{row['container']}.{row['name']}" if row["container"] else row["name"]
+        print(f"{row['file']}:{row['line']}  {row['kind']}  {qualified}")
+
+
+def main(argv: Optional[List[str]] = None):
+    """`python main.py symbols ...` / `python -m core.symbol_index ...`"""
+    parser = argparse.ArgumentParser(
+        prog="main.py symbols", description="Query and update the symbol index"
+    )
+    # 每个子命令都能带
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument(
+        "--db", default=None, help="Index file (default: tmp/symbol_index.sqlite3)"
+    )
+    common.add_argument("--json", action="store_true", help="Print results as JSON")
+    commands = parser.add_subparsers(dest="command", required=True)
+    command = lambda name, help: commands.add_parser(name, help=help, parents=[common])
+
+    index = command("index", "Parse and index files whose content changed")
+    index.add_argument("inputs", nargs="+", help="Files, directories or globs")
+    index.add_argument("-j", "--jobs", type=int, default=None, help="Concurrent analyzers")
+    index.add_argument("--no-cache", action="store_true", help="Always re-run the analyzer")
+
+    find = command("find", "Look up symbols by name (glob) and/or kind")
+    find.add_argument("name", nargs="?", default=None)
+    find.add_argument("--kind", default=None, help="SyntaxKind, e.g. ClassDeclaration")
+    find.add_argument("--container", default=None, help="Enclosing declaration, e.g. Foo")
+    find.add_argument("--file", default=None, help="Only this file")
+    find.add_argument("--limit", type=int, default=100)
+
+    file = command("file", "List what a file declares")
+    file.add_argument("path")
+
+    command("prune", "Drop files that no longer exist")
+    command("stats", "Number of files and symbols")
+
+    args = parser.parse_args(argv)
+    with SymbolIndex(args.db) as symbol_index:
+        if args.command == "index":
+            from core.batch import update_symbol_index
+
+            counts = update_symbol_index(
+                args.inputs,
+                symbol_index,
+                jobs=args.jobs,
+                use_cache=not args.no_cache,
+            )
+            print(
+                f"Indexed {counts['indexed']} files, {counts['unchanged']} unchanged, "
+                f"{counts['failed']} failed"
+            )
+        elif args.command == "find":
+            started = time.perf_counter()
+            rows = symbol_index.find(
+                args.name, args.kind, args.file, args.container, args.limit
+            )
+            _print_rows(rows, args.json)
+            logger.info(f"{len(rows)} symbols in {(time.perf_counter() - started) * 1000:.1f}ms")
+        elif args.command == "file":
+            _print_rows(symbol_index.declarations(args.path), args.json)
+        elif args.command == "prune":
+            print(f"Pruned {symbol_index.prune()} files")
+        elif args.command == "stats":
+            print(json.dumps(symbol_index.stats()))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main(sys.argv[1:])
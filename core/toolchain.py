@@ -0,0 +1,171 @@
+"""
+Node 工具链的位置：node、npx，以及跑解析器用的 ts-node
+
+找一次，存进 `setting/toolchain.json`，以后启动只核对、不再找：
+    PATH 变了（换了 Node 版本之类）就重新找；
+    记下的可执行文件和项目的 node_modules/.bin 的 mtime 都没变才算数（升级 Node、npm install 都会改）
+核对只是几次 stat，不起子进程
+
+项目自己的 node_modules/.bin 里有 ts-node 就直接跑它，省掉 npx 每次解析包的时间，没有再用 `npx ts-node`；
+Windows 上的 npx.cmd、ts-node.cmd 由 `shutil.which` 按 PATHEXT 找
+
+    python -m core.toolchain             打印当前用的工具链
+    python -m core.toolchain --refresh   重新找一遍
+"""
+
+# sys
+from pathlib import Path
+import argparse
+import hashlib
+import logging
+import shutil
+import json
+import sys
+import os
+
+# lib function
+from typing import Dict, List, Optional, TypedDict
+
+base_dir = Path(__file__).parent.parent
+TOOLCHAIN_FILE = base_dir / "setting" / "toolchain.json"
+TOOLCHAIN_VERSION = 1
+LOCAL_BIN = base_dir / "node_modules" / ".bin"
+
+logger = logging.getLogger(__name__)
+
+
+class Toolchain(TypedDict):
+    version: int
+    node: str
+    npx: Optional[str]
+    ts_node: Optional[str]  # 项目本地的 ts-node，没装是 None
+    stamps: Dict[str, Optional[float]]  # 可执行文件 / 目录 -> mtime，不存在是 None
+    path_hash: str  # 找的时候的 PATH
+
+
+# 本进程里已经核对过的，同一个进程里的多个 CodeParser 共用
+_resolved: Optional[Toolchain] = None
+
+
+def _path_hash() -> str:
+    return hashlib.sha256(os.environ.get("PATH", "").encode("utf-8")).hexdigest()[:16]
+
+
+def _mtime(path: str) -> Optional[float]:
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+
+def discover() -> Toolchain:
+    """在 PATH 和项目的 node_modules/.bin 里找一遍"""
+    node = shutil.which("node")
+    if node is None:
+        raise FileNotFoundError("Node.js not found on PATH (the TS/JS analyzer runs on it)")
+    npx = shutil.which("npx")
+    ts_node = shutil.which("ts-node", path=str(LOCAL_BIN))
+    if npx is None and ts_node is None:
+        raise FileNotFoundError(
+            f"Neither npx on PATH nor ts-node in {LOCAL_BIN} found (npm install ts-node)"
+        )
+    watched = [node, npx, ts_node, str(LOCAL_BIN)]
+    return {
+        "version": TOOLCHAIN_VERSION,
+        "node": node,
+        "npx": npx,
+        "ts_node": ts_node,
+        "stamps": {path: _mtime(path) for path in watched if path is not None},
+        "path_hash": _path_hash(),
+    }
+
+
+def is_valid(toolchain: Dict) -> bool:
+    """存下来的工具链还能不能用"""
+    return (
+        toolchain.get("version") == TOOLCHAIN_VERSION
+        and toolchain.get("path_hash") == _path_hash()
+        and bool(toolchain.get("stamps"))
+        and all(_mtime(path) == mtime for path, mtime in toolchain["stamps"].items())
+    )
+
+
+def _save(toolchain: Toolchain):
+    try:
+        TOOLCHAIN_FILE.parent.mkdir(parents=True, exist_ok=True)
+        tmp = TOOLCHAIN_FILE.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(toolchain, f, indent=2)
+        os.replace(tmp, TOOLCHAIN_FILE)
+    except OSError as e:
+        # 只读的检出目录之类，下次再找一遍就是了
+        logger.warning(f"Could not save {TOOLCHAIN_FILE}: {e}")
+
+
+def resolve(refresh: bool = False) -> Toolchain:
+    """
+    当前的工具链：本进程里有就直接用，否则读 `setting/toolchain.json` 核对，不能用再重新找
+    Args:
+        refresh = False (bool, optional): 不管存下来的，重新找一遍
+
+    Returns:
+        Toolchain: 见 `Toolchain`
+    """
+    global _resolved
+    if _resolved is not None and not refresh:
+        return _resolved
+
+    toolchain = None
+    if not refresh:
+        try:
+            with open(TOOLCHAIN_FILE, "r", encoding="utf-8") as f:
+                toolchain = json.load(f)
+        except (OSError, ValueError):
+            toolchain = None
+        if toolchain is not None and not is_valid(toolchain):
+            logger.info("Saved toolchain is out of date, looking it up again")
+            toolchain = None
+    if toolchain is None:
+        toolchain = discover()
+        _save(toolchain)
+        logger.info(f"Toolchain: node {toolchain['node']}, ts-node via {ts_node_command(toolchain)}")
+    _resolved = toolchain
+    return toolchain
+
+
+def ts_node_command(toolchain: Optional[Toolchain] = None) -> List[str]:
+    """
+    跑 ts-node 的命令前缀，后面接解析器的路径和参数
+    Args:
+        toolchain = None (Toolchain, optional): 不给就用 `resolve()` 的
+    """
+    toolchain = toolchain or resolve()
+    if toolchain["ts_node"]:
+        return [toolchain["ts_node"]]
+    return [toolchain["npx"], "ts-node"]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m core.toolchain",
+        description="Show (or look up again) the Node toolchain the analyzer runs with",
+    )
+    parser.add_argument(
+        "--refresh", action="store_true", help=f"Ignore {TOOLCHAIN_FILE.name} and search again"
+    )
+    args = parser.parse_args(argv)
+    try:
+        toolchain = resolve(refresh=args.refresh)
+    except FileNotFoundError as e:
+        print(e, file=sys.stderr)
+        return 1
+    print(json.dumps(toolchain, indent=2))
+    print("ts-node: " + " ".join(ts_node_command(toolchain)))
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+    )
+    sys.exit(main())
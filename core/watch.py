@@ -0,0 +1,146 @@
+# sys
+from pathlib import Path
+import logging
+import time
+
+# lib function
+from typing import Callable, Dict, List, Optional, Tuple
+
+from core.drawio_generator import DrawIOGenerator
+from core.parserSwitch import CodeParser
+from core.parse_cache import ParseCache
+from core.symbol_index import SymbolIndex
+from core import batch_paths
+
+logger = logging.getLogger(__name__)
+
+
+class Watcher:
+    """
+    轮询 mtime 的文件监视，不依赖 watchdog 之类的第三方库
+    编辑器保存时常常连写两次，检测到变化后等一个间隔，确认文件稳定了才报告
+    """
+
+    def __init__(self, list_files: Callable[[], List[Path]], interval: float = 0.2):
+        """
+        Args:
+            list_files (Callable[[], List[Path]]): 每次轮询时给出要监视的文件
+            interval = 0.2 (float, optional): 轮询间隔（秒）
+        """
+        self.list_files = list_files
+        self.interval = interval
+        self._stamps: Dict[Path, Tuple[int, int]] = self._snapshot()
+
+    def _snapshot(self) -> Dict[Path, Tuple[int, int]]:
+        stamps = {}
+        for path in self.list_files():
+            try:
+                st = path.stat()
+            except FileNotFoundError:
+                continue
+            stamps[path] = (st.st_mtime_ns, st.st_size)
+        return stamps
+
+    def poll(self) -> Tuple[List[Path], List[Path]]:
+        """
+        Returns:
+            Tuple[List[Path], List[Path]]: (新增或修改的文件, 删除的文件)
+        """
+        current = self._snapshot()
+        if current == self._stamps:
+            return [], []
+
+        # 等写完
+        time.sleep(self.interval)
+        current = self._snapshot()
+        changed = [p for p, stamp in current.items() if self._stamps.get(p) != stamp]
+        removed = [p for p in self._stamps if p not in current]
+        self._stamps = current
+        return changed, removed
+
+    def wait(self) -> Tuple[List[Path], List[Path]]:
+        """阻塞到有变化为止"""
+        while True:
+            changed, removed = self.poll()
+            if changed or removed:
+                return changed, removed
+            time.sleep(self.interval)
+
+
+def watch(
+    target: str,
+    output: Optional[str] = None,
+    interval: float = 0.2,
+    use_cache: bool = True,
+    format: str = "json",
+    node_filter: Optional[Dict] = None,
+    render_options: Optional[Dict] = None,
+    index_symbols: bool = False,
+):
+    """
+    监视文件或目录，保存后只重新解析变化的文件，
+    并且每个文件的绘图器沿用上一次的布局，只重排变化了的顶层节点
+    Args:
+        target (str): 源文件、目录或 glob
+        output = None (str, optional): 单文件时是输出文件，目录时是输出目录
+        interval = 0.2 (float, optional): 轮询间隔（秒）
+        use_cache = True (bool, optional): 用解析缓存
+        format = "json" (str, optional): 解析器输出格式（"json" / "compact"）
+        node_filter = None (Dict, optional): 解析器的节点过滤（见 `CodeParser`）
+        render_options = None (Dict, optional): 传给 `DrawIOGenerator` 的参数（writer、compress 等）
+        index_symbols = False (bool, optional): 每次重新解析后更新符号索引
+    """
+    if batch_paths.is_batch_input(target):
+        list_files = lambda: batch_paths.discover_sources(target)
+        root = batch_paths.batch_root(target)
+        output_dir = output or "output.drawio"
+        output_of = lambda source: batch_paths.output_path(source, output_dir, root)
+    else:
+        list_files = lambda: [Path(target)] if Path(target).exists() else []
+        output_file = output or "output.drawio/output.drawio"
+        output_of = lambda source: output_file
+
+    parser = CodeParser(
+        use_worker=True,
+        cache=ParseCache() if use_cache else None,
+        format=format,
+        node_filter=node_filter,
+        symbol_index=SymbolIndex() if index_symbols else None,
+    )
+    generators: Dict[Path, DrawIOGenerator] = {}
+
+    def render(source: Path):
+        start = time.perf_counter()
+        try:
+            ast_data = parser.parsingFile(str(source))
+            parsed = time.perf_counter()
+            generator = generators.get(source)
+            incremental = generator is not None
+            if generator is None:
+                generator = generators[source] = DrawIOGenerator(**(render_options or {}))
+            generator.generate_drawio(ast_data, output_of(source), incremental)
+        except Exception as e:
+            logger.error(f"{source}: {type(e).__name__}: {e}")
+            return
+        done = time.perf_counter()
+        logger.info(
+            f"Updated {output_of(source)} in {(done - start) * 1000:.0f}ms "
+            f"(parse {(parsed - start) * 1000:.0f}ms, render {(done - parsed) * 1000:.0f}ms)"
+        )
+
+    watcher = Watcher(list_files, interval)
+    try:
+        for source in list_files():
+            render(source)
+        logger.info(f"Watching {target} (Ctrl+C to stop)")
+        while True:
+            changed, removed = watcher.wait()
+            for source in removed:
+                generators.pop(source, None)
+                logger.info(f"Removed: {source}")
+            for source in changed:
+                render(source)
+    except KeyboardInterrupt:
+        logger.info("Stopped watching")
+    finally:
+        parser.close()
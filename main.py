@@ -1,8 +1,12 @@
 import argparse
 import logging
+import time
+import sys
+import os
 from pathlib import Path
-from core.drawio_generator import DrawIOGenerator
-from core.parserSwitch import CodeParser
+
+# 其余的（drawpyo、解析器调度、批处理……）在用到的地方才导入，`--help` 和缓存命中的运行不用等它们
+from core.profiler import Profiler, span
 
 
 def setup_logging():
@@ -11,29 +15,284 @@ def setup_logging():
     )
 
 
+def kind_list(value: str):
+    return [kind.strip() for kind in value.split(",") if kind.strip()]
+
+
 def main():
     # 命令行初始化
     setup_logging()
+    if sys.argv[1:2] == ["symbols"]:
+        # python main.py symbols {index,find,file,prune,stats} ...
+        from core import symbol_index
+
+        symbol_index.main(sys.argv[2:])
+        return
     logger = logging.getLogger(__name__)
     parser = argparse.ArgumentParser(
         description="Generate architecture diagrams from TS/JS code"
     )
-    parser.add_argument("input", help="Input TypeScript/JavaScript file")
     parser.add_argument(
-        "-o", "--output", default="output.drawio", help="Output drawio file path"
+        "input", help="Input TypeScript/JavaScript file, directory or glob"
+    )
+    parser.add_argument(
+        "new",
+        nargs="?",
+        default=None,
+        help="With --diff: the new version of the input file",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        default=None,
+        help="Output drawio file path (output directory for a directory/glob input)",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=None,
+        help="Parallel workers for a directory/glob input (default: CPU count)",
+    )
+    parser.add_argument(
+        "--pipeline",
+        action="store_true",
+        help="Directory/glob input: parse concurrently in this process (-j analyzers "
+        "at a time) and render each file as soon as its parse finishes, instead of "
+        "a process pool",
+    )
+
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Always re-run the analyzer and lay out every subtree again",
+    )
+    parser.add_argument(
+        "--clear-cache",
+        action="store_true",
+        help="Invalidate the parse and layout caches before running",
+    )
+
+    parser.add_argument(
+        "--format",
+        choices=("json", "compact"),
+        default="json",
+        help="Analyzer output format; compact is a binary format that is much faster "
+        "to read, json is easier to debug",
+    )
+
+    parser.add_argument(
+        "--keep",
+        type=kind_list,
+        default=None,
+        metavar="KIND,...",
+        help="Only emit these SyntaxKinds (e.g. ClassDeclaration,MethodDeclaration); "
+        "the analyzer drops everything else while walking the tree",
+    )
+    parser.add_argument(
+        "--collapse",
+        type=kind_list,
+        default=None,
+        metavar="KIND,...",
+        help="Emit these SyntaxKinds without their children",
+    )
+    parser.add_argument(
+        "--max-depth",
+        type=int,
+        default=None,
+        help="Emit at most this many levels (top-level statements are level 1)",
+    )
+
+    parser.add_argument(
+        "--type-check",
+        action="store_true",
+        help="Have the analyzer type check the input and report its diagnostics in the "
+        "metadata (slower; always re-runs the analyzer, since the types depend on "
+        "imported files too)",
+    )
+
+    parser.add_argument(
+        "--writer",
+        choices=("drawpyo", "stream"),
+        default="drawpyo",
+        help="Output backend; stream writes cells as they are laid out instead of "
+        "building the whole drawpyo object graph first (same diagram, less memory)",
+    )
+
+    parser.add_argument(
+        "--compact-styles",
+        action="store_true",
+        help="Drop style entries that match draw.io defaults and write code snippets "
+        "as short <font> markup",
+    )
+    parser.add_argument(
+        "--compress",
+        action="store_true",
+        help="Store the diagram as the deflate-compressed payload draw.io also writes "
+        "(much smaller, not human-readable)",
+    )
+
+    parser.add_argument(
+        "--shard",
+        choices=("declaration", "namespace", "file"),
+        default=None,
+        help="Split the diagram into pages by top-level declaration, namespace or "
+        "source file, plus an index page linking to them; pages are laid out in "
+        "-j worker processes. With a directory/glob input, --shard file renders "
+        "every file into one multi-page diagram",
+    )
+    parser.add_argument(
+        "--page-budget",
+        type=int,
+        default=2000,
+        metavar="NODES",
+        help="Most nodes per page with --shard (a bigger single declaration gets "
+        "a page of its own)",
+    )
+
+    parser.add_argument(
+        "--relations",
+        action="store_true",
+        help="Draw extends/implements connectors between classes and interfaces "
+        "of the same diagram",
+    )
+    parser.add_argument(
+        "--graph",
+        action="store_true",
+        help="Directory/glob input: render the cross-file dependency graph instead "
+        "(one box per file stacked by import layers, import and extends/implements "
+        "connectors, import cycles highlighted)",
+    )
+
+    parser.add_argument(
+        "--index-symbols",
+        action="store_true",
+        help="Also upsert every parsed file's declarations into the symbol index "
+        "(tmp/symbol_index.sqlite3, query it with `main.py symbols find NAME`)",
+    )
+
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="Keep running and re-render whenever the input changes",
+    )
+    parser.add_argument(
+        "--diff",
+        action="store_true",
+        help="Compare two versions of a file (main.py old.ts new.ts --diff): draw only "
+        "the added, removed and changed declarations inside their enclosing "
+        "containers, with unchanged code folded into placeholders",
+    )
+
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const="",
+        default=None,
+        metavar="PREFIX",
+        help="Record wall/CPU time and peak memory of every stage (analyzer included) "
+        "into PREFIX.profile.json and PREFIX.trace.json (Chrome trace); "
+        "PREFIX defaults to the output path",
+    )
+    parser.add_argument(
+        "--keep-analyzer-output",
+        default=None,
+        metavar="DIR",
+        help="Also save the raw analyzer output (normally read straight from its pipe) "
+        "into DIR, for debugging the analyzer",
     )
 
     args = parser.parse_args()
+    if (args.new is None) == args.diff:
+        parser.error("--diff takes two files (old and new), and a second file needs --diff")
+    from core.parse_cache import ParseCache
+    from core.layout_cache import LayoutCache
+    # 批处理本身（`core.batch`）只在批处理的分支里导入
+    from core.batch_paths import is_batch_input
+
+    node_filter = {
+        "keep": args.keep,
+        "collapse": args.collapse,
+        "maxDepth": args.max_depth,
+    }
+    render_options = {
+        "writer": args.writer,
+        "compact_styles": args.compact_styles,
+        "compress": args.compress,
+        "shard_by": args.shard,
+        "page_budget": args.page_budget,
+        "relations": args.relations,
+    }
+
+    if args.clear_cache:
+        ParseCache().invalidate()
+        LayoutCache().invalidate()
+
+    if args.type_check and (args.watch or is_batch_input(args.input)):
+        logger.warning("--type-check only applies to a single input file or --diff, ignored")
+
+    if args.watch:
+        from core import watch
+
+        watch.watch(
+            args.input,
+            args.output,
+            use_cache=not args.no_cache,
+            format=args.format,
+            node_filter=node_filter,
+            render_options=render_options,
+            index_symbols=args.index_symbols,
+        )
+        return
+
+    if args.diff:
+        run_diff(args, node_filter, render_options, logger)
+        return
+
+    if is_batch_input(args.input):
+        if args.profile is not None:
+            logger.warning("--profile only applies to a single input file, ignored")
+        if args.graph:
+            run_graph(args, node_filter, render_options, logger)
+        elif args.shard == "file":
+            run_combined(args, node_filter, render_options, logger)
+        else:
+            run_batch(args, node_filter, render_options, logger)
+        return
+
+    args.output = args.output or "output.drawio/output.drawio"
 
     # Check input file exists
     if not Path(args.input).exists():
         logger.error(f"Input file {args.input} not found")
         return
 
+    profiler = Profiler() if args.profile is not None else None
+    from core.drawio_generator import DrawIOGenerator
+    from core.parserSwitch import CodeParser
+
     # Parse the input file
     logger.info(f"Parsing {args.input}...")
-    parser = CodeParser()
-    ast_data = parser.parsingFile(args.input)
+    cache = None if args.no_cache else ParseCache()
+    parser = CodeParser(
+        cache=cache,
+        format=args.format,
+        node_filter=node_filter,
+        profiler=profiler,
+        symbol_index=open_symbol_index() if args.index_symbols else None,
+        type_check=args.type_check,
+        keep_output=args.keep_analyzer_output,
+    )
+    try:
+        with span(profiler, "parse", file=args.input):
+            ast_data = parser.parsingFile(args.input)
+    except Exception as e:
+        logger.error(f"Failed to parse input file: {e}")
+        return
+    finally:
+        parser.close()
+        if cache:
+            logger.info(f"Parse cache: {cache.stats()}")
 
     if not ast_data:
         logger.error("Failed to parse input file")
@@ -41,10 +300,159 @@ def main():
 
     # Generate visualization
     logger.info(f"Generating {args.output}...")
-    generator = DrawIOGenerator()
-    generator.generate_drawio(ast_data, args.output)
+    generator = DrawIOGenerator(
+        **render_options,
+        jobs=args.jobs or os.cpu_count() or 1,
+        profiler=profiler,
+        layout_cache=None if args.no_cache else LayoutCache(),
+    )
+    with span(profiler, "generate", output=args.output):
+        generator.generate_drawio(ast_data, args.output)
+
+    if profiler is not None:
+        prefix = args.profile or str(Path(args.output).with_suffix(""))
+        profiler.write(f"{prefix}.profile.json", f"{prefix}.trace.json")
+        logger.info(f"Profile written to {prefix}.profile.json / {prefix}.trace.json")
     logger.info("Done!")
 
 
+def open_symbol_index():
+    """Only --index-symbols needs it, so sqlite3 is imported here and not at startup"""
+    from core.symbol_index import SymbolIndex
+
+    return SymbolIndex()
+
+
+def run_diff(args, node_filter, render_options, logger):
+    """Two versions of one file with --diff: one diagram of what changed between them"""
+    from core.ast_diff import diff_ast
+    from core.drawio_generator import DrawIOGenerator
+    from core.layout_cache import LayoutCache
+    from core.parse_cache import ParseCache
+    from core.parserSwitch import CodeParser
+
+    if args.profile is not None:
+        logger.warning("--profile does not apply to --diff, ignored")
+    for path in (args.input, args.new):
+        if not Path(path).exists():
+            logger.error(f"Input file {path} not found")
+            return
+    output = args.output or "output.drawio/diff.drawio"
+
+    logger.info(f"Parsing {args.input} and {args.new}...")
+    cache = None if args.no_cache else ParseCache()
+    # Both files go through one worker, so the analyzer starts once
+    parser = CodeParser(
+        use_worker=True,
+        cache=cache,
+        format=args.format,
+        node_filter=node_filter,
+        type_check=args.type_check,
+        keep_output=args.keep_analyzer_output,
+    )
+    try:
+        old, new = parser.parsingFile(args.input), parser.parsingFile(args.new)
+    except Exception as e:
+        logger.error(f"Failed to parse input file: {e}")
+        return
+    finally:
+        parser.close()
+
+    start = time.perf_counter()
+    ast_data = diff_ast(old, new)
+    logger.info(
+        f"Diff in {time.perf_counter() - start:.2f}s: "
+        + ", ".join(f"{count} {status}" for status, count in ast_data["diff"].items())
+    )
+
+    logger.info(f"Generating {output}...")
+    generator = DrawIOGenerator(
+        **render_options,
+        jobs=args.jobs or os.cpu_count() or 1,
+        layout_cache=None if args.no_cache else LayoutCache(),
+        diff=True,
+    )
+    generator.generate_drawio(ast_data, output)
+    logger.info("Done!")
+
+
+def run_batch(args, node_filter, render_options, logger):
+    """Directory/glob input: parse and render every supported file in parallel"""
+    from core import batch
+
+    sources = batch.discover_sources(args.input)
+    if not sources:
+        logger.error(f"No supported source files found in {args.input}")
+        return
+
+    output_dir = args.output or "output.drawio"
+    logger.info(f"Processing {len(sources)} files into {output_dir}...")
+    start = time.perf_counter()
+    results = (batch.run_pipeline if args.pipeline else batch.run_batch)(
+        sources,
+        output_dir,
+        batch.batch_root(args.input),
+        jobs=args.jobs,
+        use_cache=not args.no_cache,
+        format=args.format,
+        node_filter=node_filter,
+        render_options=render_options,
+        index_symbols=args.index_symbols,
+    )
+    logger.info("Done!\n" + batch.summarize(results, time.perf_counter() - start))
+
+
+def run_combined(args, node_filter, render_options, logger):
+    """Directory/glob input with --shard file: one diagram, one page per file"""
+    from core import batch
+
+    sources = batch.discover_sources(args.input)
+    if not sources:
+        logger.error(f"No supported source files found in {args.input}")
+        return
+
+    output = args.output or "output.drawio/output.drawio"
+    logger.info(f"Processing {len(sources)} files into {output}...")
+    start = time.perf_counter()
+    results = batch.run_combined(
+        sources,
+        output,
+        batch.batch_root(args.input),
+        jobs=args.jobs,
+        use_cache=not args.no_cache,
+        format=args.format,
+        node_filter=node_filter,
+        render_options=render_options,
+        index_symbols=args.index_symbols,
+    )
+    logger.info("Done!\n" + batch.summarize(results, time.perf_counter() - start))
+
+
+def run_graph(args, node_filter, render_options, logger):
+    """Directory/glob input with --graph: one dependency graph of all files"""
+    from core import batch
+
+    sources = batch.discover_sources(args.input)
+    if not sources:
+        logger.error(f"No supported source files found in {args.input}")
+        return
+
+    output = args.output or "output.drawio/dependencies.drawio"
+    logger.info(f"Building the dependency graph of {len(sources)} files into {output}...")
+    start = time.perf_counter()
+    results = batch.run_graph(
+        sources,
+        output,
+        batch.batch_root(args.input),
+        jobs=args.jobs,
+        use_cache=not args.no_cache,
+        format=args.format,
+        node_filter=node_filter,
+        render_options=render_options,
+        index_symbols=args.index_symbols,
+    )
+    logger.info("Done!\n" + batch.summarize(results, time.perf_counter() - start))
+
+
 if __name__ == "__main__":
     main()
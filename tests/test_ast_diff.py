@@ -0,0 +1,96 @@
+import hashlib
+import uuid
+
+from core.ast_diff import ADDED, CHANGED, CONTEXT, REMOVED, UNCHANGED, diff_ast
+from core.ast_model import NodeTable
+
+
+def _parsed(nodes):
+    return {"nodes": NodeTable.from_nodes(nodes).nodes(), "metadata": {}}
+
+
+def _preorder_ids(nodes, start=0):
+    """和 `--format compact` 一样，id 是先序下标"""
+    next_id = start
+    for node in nodes:
+        node["id"] = next_id
+        next_id = _preorder_ids(node.get("children", []), next_id + 1)
+    return next_id
+
+
+def _content_id(*parts):
+    return str(uuid.UUID(hashlib.sha1("\0".join(parts).encode()).hexdigest()[:32], version=5))
+
+
+def _decl(name, *children):
+    node = {"statementType": "FunctionDeclaration", "kind": "FunctionDeclaration", "name": name}
+    if children:
+        node["children"] = list(children)
+    return node
+
+
+def _literal(value):
+    return {"statementType": "NumericLiteral", "kind": "NumericLiteral", "type": value}
+
+
+def _statuses(result):
+    """合并树先序排开"""
+    table = result["nodes"].table
+    return [(table.field(i, "name"), table.field(i, "diff")) for i in range(len(table))]
+
+
+def test_compact_ids_delete_first_sibling():
+    old = [_decl("a", _literal("1")), _decl("b", _literal("2"))]
+    new = [_decl("b", _literal("2"))]
+    _preorder_ids(old)
+    _preorder_ids(new)
+    # 新的 b 和旧的 a 的 id 都是 0，不能当成同一个节点
+    result = diff_ast(_parsed(old), _parsed(new))
+    assert _statuses(result) == [("a", REMOVED), (None, REMOVED), ("b", UNCHANGED)]
+    assert result["diff"][REMOVED] == 2
+    assert result["diff"][UNCHANGED] == 2
+
+
+def test_compact_ids_insert_before():
+    old = [_decl("b"), _decl("c")]
+    new = [_decl("a"), _decl("b"), _decl("c")]
+    _preorder_ids(old)
+    _preorder_ids(new)
+    result = diff_ast(_parsed(old), _parsed(new))
+    assert _statuses(result) == [("a", ADDED), ("2 unchanged", UNCHANGED)]
+
+
+def test_compact_ids_literal_change_not_visible():
+    # compact 记录里没有字面量的内容，也没有内容 id，看不出变化
+    old = [_decl("a", _literal("1"))]
+    new = [_decl("a", _literal("1"))]
+    _preorder_ids(old)
+    _preorder_ids(new)
+    old[0]["id"], new[0]["id"] = 0, 0
+    result = diff_ast(_parsed(old), _parsed(new))
+    assert _statuses(result) == [("a", UNCHANGED)]
+
+
+def test_content_ids_literal_change():
+    old = [_decl("a", {"statementType": "ReturnStatement", "kind": "ReturnStatement"})]
+    new = [_decl("a", {"statementType": "ReturnStatement", "kind": "ReturnStatement"})]
+    old[0]["id"] = _content_id("a", "return 1")
+    new[0]["id"] = _content_id("a", "return 2")
+    old[0]["children"][0]["id"] = _content_id("a/return", "return 1")
+    new[0]["children"][0]["id"] = _content_id("a/return", "return 2")
+    result = diff_ast(_parsed(old), _parsed(new))
+    assert _statuses(result) == [("a", CONTEXT), (None, CHANGED)]
+
+
+def test_content_ids_required_on_both_sides():
+    old = [_decl("a", _literal("1"))]
+    new = [_decl("a", _literal("1"))]
+    old[0]["id"] = _content_id("a", "1")
+    old[0]["children"][0]["id"] = _content_id("a/1", "1")
+    new[0]["id"] = _content_id("a", "2")
+    _preorder_ids(new[0]["children"], 1)
+    # 只有一边是内容 id，按子树哈希算作没变
+    assert NodeTable.from_nodes(old).content_ids()
+    assert not NodeTable.from_nodes(new).content_ids()
+    result = diff_ast(_parsed(old), _parsed(new))
+    assert _statuses(result) == [("a", UNCHANGED)]
@@ -0,0 +1,56 @@
+import io
+import json
+import time
+
+from core.ast_stream import DEFAULT_SECTIONS, _iter_object, _Reader, iter_analyzed
+
+
+def _statement(members: int) -> dict:
+    """一个很大的 class statement"""
+    return {
+        "statementType": "ClassDeclaration",
+        "members": [
+            {"name": f"m{i}", "body": 'x"]}' * 10, "params": [{"a": i}, [], {}]}
+            for i in range(members)
+        ],
+    }
+
+
+def _read(text: str, chunk_size: int) -> list:
+    reader = _Reader(io.StringIO(text), chunk_size=chunk_size)
+    return list(_iter_object(reader, "", DEFAULT_SECTIONS))
+
+
+def test_chunk_boundaries():
+    analyzed = {
+        "AnalyzedAST": {"statements": [{"s": 'a\\"b\\\\', "n": [1, -2.5e3, True, None]}, 7]},
+        "StandardAST": {"k": '\\"]}' * 20},
+        "Metadata": {"m": '"[{'},
+    }
+    text = json.dumps(analyzed)
+    expected = [
+        ("AnalyzedAST.statements[]", analyzed["AnalyzedAST"]["statements"][0]),
+        ("AnalyzedAST.statements[]", 7),
+        ("Metadata", analyzed["Metadata"]),
+    ]
+    assert list(iter_analyzed(io.StringIO(text))) == expected
+    # 转义、字符串、标量被切在任何地方都一样
+    for chunk_size in range(1, 24):
+        assert _read(text, chunk_size) == expected
+
+
+def test_large_statement_is_linear():
+    """一条 statement 跨很多块时，读它的时间跟大小成正比（补一块就把前面整段再拼一遍是平方）"""
+    timings = []
+    for members in (10000, 80000):
+        statement = _statement(members)
+        text = json.dumps({"AnalyzedAST": {"statements": [statement]}})
+        best = float("inf")
+        for _ in range(2):
+            started = time.perf_counter()
+            ((_, value),) = _read(text, 1024)
+            best = min(best, time.perf_counter() - started)
+        assert value == statement
+        timings.append(best)
+    # 8 倍大小：线性是 8 倍左右，平方是 64 倍
+    assert timings[1] < 24 * timings[0], timings
@@ -0,0 +1,63 @@
+import sys
+from contextlib import contextmanager
+
+import pytest
+
+from core.benchmark import write_nested_chain
+from core.drawio_generator import DrawIOGenerator
+from core.layout import LayoutEngine
+from core.parserSwitch import CodeParser
+
+DEPTH = 10000
+
+
+@contextmanager
+def shallow_stack(headroom: int = 150):
+    """递归上限只比当前栈深多一点，哪一步按嵌套深度递归就会 RecursionError"""
+    depth, frame = 0, sys._getframe()
+    while frame is not None:
+        depth, frame = depth + 1, frame.f_back
+    limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(depth + headroom)
+    try:
+        yield
+    finally:
+        sys.setrecursionlimit(limit)
+
+
+@pytest.fixture(scope="module")
+def chain(tmp_path_factory):
+    analyzed = tmp_path_factory.mktemp("nesting") / "chain.json"
+    count = write_nested_chain(analyzed, DEPTH)
+    with shallow_stack():
+        standardized = CodeParser()._standardize_file(analyzed)
+    return standardized, count
+
+
+def test_standardize(chain):
+    standardized, count = chain
+    table = standardized["nodes"].table
+    assert len(table) == count
+    assert len(table.roots) == 1
+
+
+def test_layout(chain):
+    standardized, count = chain
+    engine = LayoutEngine(standardized["nodes"].table)
+    with shallow_stack():
+        engine.measure()
+        engine.place(standardized["nodes"].table.roots[0], 0, 0)
+    assert engine.measured == count
+    assert engine.placed == count
+
+
+@pytest.mark.parametrize("writer", ["drawpyo", "stream"])
+def test_writers(chain, tmp_path, writer):
+    standardized, count = chain
+    generator = DrawIOGenerator(writer=writer)
+    output = tmp_path / f"chain.{writer}.drawio"
+    with shallow_stack():
+        generator.generate_drawio(standardized, str(output))
+    assert generator._engine.measured == count
+    assert generator._engine.placed == count
+    assert output.stat().st_size > 0
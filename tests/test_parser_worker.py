@@ -0,0 +1,94 @@
+import asyncio
+import sys
+import textwrap
+
+import pytest
+
+from core.parser_worker import AsyncParserWorker, ParserWorker
+
+# 按请求的文件名决定怎么（不）好好回答，结果里带上进程号，看得出有没有重启
+FAKE_WORKER = textwrap.dedent(
+    """
+    import json, os, sys, time
+    out = sys.stdout.buffer
+    for line in sys.stdin:
+        request = json.loads(line)
+        file = request["file"]
+        if file == "sleep":
+            time.sleep(60)
+        if file == "bad-id":
+            out.write(json.dumps({"id": request["id"] + 1, "ok": True}).encode() + b"\\n")
+        if file == "short-payload":
+            out.write(json.dumps({"id": request["id"], "ok": True, "bytes": 10}).encode() + b"\\n")
+            out.write(b"{}")
+            out.flush()
+            time.sleep(60)
+        if file == "long":
+            out.write(json.dumps({"id": request["id"], "ok": True, "result": "x" * 1000000}).encode() + b"\\n")
+            out.flush()
+            continue
+        out.write(json.dumps({"id": request["id"], "ok": True, "result": os.getpid()}).encode() + b"\\n")
+        out.flush()
+    """
+)
+
+
+def _worker(cls, tmp_path, **kwargs):
+    script = tmp_path / "fake_worker.py"
+    script.write_text(FAKE_WORKER)
+    return cls([sys.executable, str(script)], cwd=str(tmp_path), **kwargs)
+
+
+def test_desync_restarts(tmp_path):
+    with _worker(ParserWorker, tmp_path) as worker:
+        first = worker.request("a.ts")
+        assert worker.request("a.ts") == first
+        with pytest.raises(ValueError):
+            worker.request("bad-id")
+        # 错位的响应还在旧进程的管道里，换了进程才对得上
+        second = worker.request("a.ts")
+        assert second != first
+        assert worker.request("a.ts") == second
+
+
+def test_timeout_restarts(tmp_path):
+    with _worker(ParserWorker, tmp_path, timeout=0.5) as worker:
+        first = worker.request("a.ts")
+        with pytest.raises(TimeoutError):
+            worker.request("short-payload")
+        assert worker.request("a.ts") != first
+
+
+def test_async_cancel_and_timeout_restart(tmp_path):
+    async def run():
+        worker = _worker(AsyncParserWorker, tmp_path, timeout=0.5)
+        try:
+            first = await worker.request("a.ts")
+            task = asyncio.ensure_future(worker.request("sleep"))
+            await asyncio.sleep(0.2)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+            second = await worker.request("a.ts")
+            assert second != first
+            with pytest.raises(TimeoutError):
+                await worker.request("sleep")
+            assert await worker.request("a.ts") not in (first, second)
+        finally:
+            await worker.close()
+
+    asyncio.run(run())
+
+
+def test_async_long_line(tmp_path):
+    async def run():
+        worker = _worker(AsyncParserWorker, tmp_path)
+        try:
+            first = await worker.request("a.ts")
+            assert await worker.request("long") == "x" * 1000000
+            # 没重启，协议也还对得上
+            assert await worker.request("a.ts") == first
+        finally:
+            await worker.close()
+
+    asyncio.run(run())
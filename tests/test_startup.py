@@ -0,0 +1,19 @@
+from core.benchmark import (
+    STARTUP_BUDGETS,
+    STARTUP_LAZY,
+    STARTUP_LAZY_CACHE_HIT,
+    check_startup,
+    run_startup,
+)
+
+
+def test_startup_budget(tmp_path):
+    results = run_startup(repeat=3, workdir=str(tmp_path))
+    # `--help` 导入了的 STARTUP_LAZY 模块
+    assert results["eager"] == [], STARTUP_LAZY
+    # 缓存命中的单个文件导入了的 STARTUP_LAZY_CACHE_HIT 模块（批处理、依赖图、符号索引……）
+    assert results["eager_cache_hit"] == [], STARTUP_LAZY_CACHE_HIT
+    assert check_startup(results) == [], STARTUP_BUDGETS
+    # 缓存都在 tmp_path 里，没动仓库 tmp/ 里的
+    assert any((tmp_path / "cache" / "parse_cache").glob("*/*.json"))
+    assert (tmp_path / "cache" / "layout_cache.json").exists()
@@ -1,7 +1,7 @@
 import * as ts from "typescript";
 import * as fs from "fs";
 import * as path from "path";
-import { randomUUID } from "crypto";
+import { createHash } from "crypto";
 
 ("use strict");
 
@@ -157,6 +157,8 @@ export type NestedObject<K extends string | number | symbol, V> = {
     [key in K]: V | NestedObject<K, V>;
 };
 export type NestedList<K extends string | number | symbol, V> = Array<V | NestedList<K, V>>;
+/** `StandardAST.syntaxUnits` 里的节点：只留能序列化的字段 */
+export type SyntaxUnitNode = Pick<ts.Node, "kind" | "flags" | "pos" | "end"> & { id: string };
 /**
  * 魔改Typescript-ASt的抽象语法树
  * 但是考虑的不用像原版那么多
@@ -164,16 +166,35 @@ export type NestedList<K extends string | number | symbol, V> = Array<V | Nested
  */
 export interface AnalyzedJSON {
     AnalyzedAST: {
-        // imports: {
-        //     id: string;
-        //     name: string;
-        //     alias?: string;
-        // }[];
-        // exports: {
-        //     id: string;
-        //     name: string;
-        //     alias?: string;
-        // }[];
+        /** 顶层的 import（含 `import x = require(...)`），见 `collectModuleLinks` */
+        imports: {
+            id: string;
+            /** 导入的名字：具名导入的原名、"default"、"*"（整个模块）；只为副作用导入时是 "" */
+            name: string;
+            /** 本地名（`as` 后面的、默认导入和 `* as` 的名字），和 name 一样时省略 */
+            alias?: string;
+            /** 模块说明符，原样 */
+            module: string;
+            typeOnly?: boolean;
+        }[];
+        /** 顶层的 export，见 `collectModuleLinks` */
+        exports: {
+            id: string;
+            /** 本地名（转出时是对方模块导出的名字）；`export *` 是 "*"，导出的是表达式时是 "" */
+            name: string;
+            /** 对外的名字（`as` 后面的，默认导出是 "default"），和 name 一样时省略 */
+            alias?: string;
+            /** `export ... from` 的模块说明符 */
+            module?: string;
+        }[];
+        /** 类、接口的 extends / implements，见 `heritageRelations` */
+        relations: {
+            /** 声明的全名：path 和名字用 "." 连起来 */
+            from: string;
+            kind: "extends" | "implements";
+            /** extends / implements 后面的表达式（不含类型参数），比如 "Base"、"ns.Base" */
+            to: string;
+        }[];
         statements: BaseStatement[];
         structureOutline: NestedList<string, string>;
 
@@ -181,10 +202,13 @@ export interface AnalyzedJSON {
         idMap: Record<
             string,
             {
-                /** 在自定义的ast中的路径 */
+                /** 在自定义的ast中的路径：外层具名声明的名字用 "." 连起来，见 `getNodePath` */
                 path: string;
+                /** 标识符的文本，或者具名声明（类、方法……）的名字 */
                 name: string;
                 type?: string;
+                /** 类型检查器给出的类型（`checker.typeToString`），只有做类型检查时才有 */
+                typeText?: string;
                 object: BaseStatement;
                 loc: { start: number; end: number };
             }
@@ -193,7 +217,7 @@ export interface AnalyzedJSON {
 
     StandardAST: Pick<ts.SourceFile, "statements"> & {
         /** 所有标准语法树的元素 */
-        syntaxUnits: Record<string, { node: ts.Node & { id: string }; id: string; path: string }>;
+        syntaxUnits: Record<string, { node: SyntaxUnitNode; id: string; path: string }>;
         /** @see structureOutline */
         statements: NestedList<string, string>;
         __originalTypeInfo?: Record<string, ts.Type>;
@@ -219,6 +243,8 @@ export interface AnalyzedJSON {
             memoryUsage: number;
             nodeCount: number;
             identifierCount: number;
+            /** 解析器内部各阶段，`main.py --profile` 时合进 Python 那边的时间线 */
+            phases?: AnalyzerPhase[];
         };
         sourceInfo: {
             targetPath: string;
@@ -234,15 +260,42 @@ export interface AnalyzedJSON {
             lineEndings: "LF" | "CRLF"; // 换行符类型
         };
         output_logs: string;
+        /** 这个文件的语法 + 语义诊断，只有做类型检查时才有 */
+        diagnostics?: AnalyzerDiagnostic[];
     };
 }
 
+export interface AnalyzerDiagnostic {
+    code: number;
+    category: "Warning" | "Error" | "Suggestion" | "Message";
+    message: string;
+    start?: number;
+    end?: number;
+}
+
+/**
+ * 解析器内部一个阶段的开销
+ */
+export interface AnalyzerPhase {
+    name: string;
+    /** 开始时刻（Unix 毫秒，和 Python 的 time.time() 对齐） */
+    start: number;
+    /** 墙钟毫秒 */
+    wall: number;
+    /** CPU 毫秒（user + system） */
+    cpu: number;
+    /** 阶段结束时的堆占用（字节） */
+    heapUsed: number;
+    pid: number;
+}
+
 /**
  * 基本语句类型所必需的基础信息
  */
 /** 基础语句类型必需的信息 */
 export interface BaseStatement {
     /**
+     * 内容寻址，同样的代码每次解析都一样，见 `scriptParser.contentIds`
      * @see idMap
      */
     id: string;
@@ -254,6 +307,8 @@ export interface BaseStatement {
         end: number;
     };
     statementType: string;
+    /** 名称（声明名、标识符文本），没有就不写 */
+    name?: string;
     /** 子节点 */
     children?: BaseStatement[];
 }
@@ -675,17 +730,60 @@ export interface CommentsInfo extends BaseStatement {
     decorateTo?: string;
 }
 
+/**
+ * 节点过滤，`scriptParser.parse` 遍历时就剪掉，被剪掉的节点根本不会生成
+ *
+ * 例：只看声明，类成员不展开
+ * `{ keep: ["ClassDeclaration", "FunctionDeclaration", "MethodDeclaration", "PropertyDeclaration"], collapse: ["MethodDeclaration"] }`
+ */
+export interface NodeFilter {
+    /**
+     * 只输出这些 SyntaxKind（名字，如 "ClassDeclaration"），不给就全输出
+     * 不在里面的节点自己不输出，但它底下符合的节点会挂到最近的输出的祖先上
+     * （比如 namespace 的成员在 ModuleBlock 底下）
+     */
+    keep?: string[];
+    /** 这些 SyntaxKind 输出，但不再往下展开 */
+    collapse?: string[];
+    /** 最多输出几层，顶层语句是第 1 层，最深那层不再展开 */
+    maxDepth?: number;
+}
+
+/**
+ * 一个节点在过滤下的处理方式
+ *   keep      输出，子节点在下一层
+ *   leaf      输出，不展开子节点
+ *   dissolve  不输出，子节点留在这一层接着判断
+ */
+type FilterAction = "keep" | "leaf" | "dissolve";
+
 // cli tool
 function logWithTimestamp(message: string) {
     const now = new Date();
     console.log(`[${now.toISOString()}] ${message}`);
 }
 
-function measurePerformance<T>(name: string, fn: () => T): T {
+/**
+ * 计时并打日志，给了 phases 就把这一段的开销记进去
+ */
+function measurePerformance<T>(name: string, fn: () => T, phases?: AnalyzerPhase[]): T {
+    const startedAt = performance.timeOrigin + performance.now();
+    const cpu = process.cpuUsage();
     const start = process.hrtime.bigint();
     const result = fn();
     const end = process.hrtime.bigint();
     const duration = Number(end - start) / 1e6;
+    if (phases) {
+        const cpuUsed = process.cpuUsage(cpu);
+        phases.push({
+            name,
+            start: startedAt,
+            wall: duration,
+            cpu: (cpuUsed.user + cpuUsed.system) / 1000,
+            heapUsed: process.memoryUsage().heapUsed,
+            pid: process.pid,
+        });
+    }
     logWithTimestamp(`⏱️ ${name} took ${duration.toFixed(2)}ms`);
     return result;
 }
@@ -728,12 +826,218 @@ const debugUtils = {
     },
 };
 
+/**
+ * 40 位十六进制的哈希排成 UUID（version 5 的样子），见 `scriptParser.contentIds`
+ */
+function toUuid(hex: string): string {
+    const variant = ((parseInt(hex[16], 16) & 0x3) | 0x8).toString(16);
+    return `${hex.slice(0, 8)}-${hex.slice(8, 12)}-5${hex.slice(13, 16)}-${variant}${hex.slice(17, 20)}-${hex.slice(20, 32)}`;
+}
+
+/**
+ * 整个项目共用的一个 program（增量的 BuilderProgram）
+ *
+ * 每次请求拿上一次的 program 当 oldProgram 重建：源文件按路径缓存，没变就还给 TS 同一个
+ * SourceFile 对象，lib.d.ts 和没改过的文件都不再解析、绑定；常驻 worker 里只有第一个文件付 lib 的钱。
+ * 编译选项来自真正的 tsconfig（找不到就用默认的），不出 JS（noEmit）。
+ * 配了 tsBuildInfoFile（tsconfig 里开 incremental，或者 `--build-info`）时，
+ * 做过类型检查的话 `save` 把 .tsbuildinfo 写到盘上，下次启动的语义诊断只重算改过的文件
+ *
+ * `watch`（常驻 worker）时：
+ * - 根文件一开始就是 tsconfig 里的全部文件，请求的文件已经在里面就不用改根文件
+ *   （根文件一变 TS 就不复用旧 program 的结构，每个文件的 import 都要重新解析）
+ * - program 里每个文件所在的目录挂一个监听，目录里有变动只把那个文件标脏；
+ *   每次请求只 stat 请求的文件和标脏的文件，都没变就直接用上一次的 program，不重建
+ * 单次运行只建一次 program，根文件只放要解析的文件，每个文件都 stat
+ */
+class AnalyzerProject {
+    readonly options: ts.CompilerOptions;
+    readonly configPath: string | undefined;
+    /** .tsbuildinfo 的位置，没开增量时为 undefined */
+    private readonly buildInfoPath: string | undefined;
+    private readonly host: ts.CompilerHost;
+    private readonly rootNames = new Set<string>();
+    private readonly sourceFiles = new Map<string, { stamp: string; sourceFile: ts.SourceFile }>();
+    private readonly watching: boolean;
+    /** 目录 -> (文件名 -> TS 用的路径)；监听不了的目录是 null，里面的文件每次都要 stat */
+    private readonly watched = new Map<string, Map<string, string> | null>();
+    /** 监听到有变动、还没重新 stat 过的文件 */
+    private readonly dirty = new Set<string>();
+    private builder: ts.EmitAndSemanticDiagnosticsBuilderProgram | undefined;
+    /** 有没有做过类型检查（没做过就没什么可存的） */
+    private checked = false;
+
+    constructor(tsconfigPath: string, buildInfo?: string, watch = false) {
+        const configPath = ts.sys.fileExists(tsconfigPath) ? tsconfigPath : undefined;
+        let options: ts.CompilerOptions = {};
+        let fileNames: string[] = [];
+        if (configPath) {
+            const configFile = ts.readConfigFile(configPath, ts.sys.readFile);
+            const parsed = ts.parseJsonConfigFileContent(configFile.config ?? {}, ts.sys, path.dirname(configPath), undefined, configPath);
+            options = parsed.options;
+            fileNames = parsed.fileNames;
+        }
+        options = { ...options, noEmit: true };
+        if (buildInfo) options = { ...options, incremental: true, tsBuildInfoFile: buildInfo };
+        this.options = options;
+        this.configPath = configPath;
+        this.buildInfoPath = ts.getTsBuildInfoEmitOutputFilePath(options);
+        this.watching = watch;
+        if (watch) fileNames.forEach((fileName) => this.rootNames.add(path.resolve(fileName)));
+
+        const host = ts.createIncrementalCompilerHost(options);
+        const getSourceFile = host.getSourceFile.bind(host);
+        host.getSourceFile = (fileName, languageVersion, onError, shouldCreateNewSourceFile) => {
+            const cached = shouldCreateNewSourceFile ? undefined : this.sourceFiles.get(fileName);
+            if (cached && !this.mayHaveChanged(fileName)) return cached.sourceFile;
+            const stamp = AnalyzerProject.stamp(fileName);
+            if (cached && stamp !== undefined && cached.stamp === stamp) return cached.sourceFile;
+            const sourceFile = getSourceFile(fileName, languageVersion, onError, shouldCreateNewSourceFile);
+            if (sourceFile && stamp !== undefined) {
+                this.sourceFiles.set(fileName, { stamp, sourceFile });
+                if (watch) this.watch(fileName);
+            }
+            return sourceFile;
+        };
+        this.host = host;
+    }
+
+    private static stamp(fileName: string): string | undefined {
+        try {
+            const stat = fs.statSync(fileName);
+            return `${stat.mtimeMs}:${stat.size}`;
+        } catch {
+            return undefined;
+        }
+    }
+
+    /** 缓存的 SourceFile 要不要 stat 一下再用 */
+    private mayHaveChanged(fileName: string): boolean {
+        return !this.watching || this.dirty.has(fileName) || !this.watched.get(path.dirname(fileName));
+    }
+
+    /**
+     * 监听文件所在的目录（不拖住进程退出），一个目录只挂一个
+     * 事件带文件名就只标脏那一个文件，不带就把这个目录里的都标脏
+     */
+    private watch(fileName: string) {
+        const dir = path.dirname(fileName);
+        let files = this.watched.get(dir);
+        if (files === undefined) {
+            files = new Map();
+            try {
+                const watcher = fs.watch(dir, { persistent: false }, (_event, name) => {
+                    const current = this.watched.get(dir);
+                    if (!current) return;
+                    const changed = name ? current.get(name.toString()) : undefined;
+                    if (changed) this.dirty.add(changed);
+                    else if (!name) current.forEach((file) => this.dirty.add(file));
+                });
+                // 目录被删了之类的：以后这个目录里的文件都老实 stat
+                watcher.on("error", () => {
+                    watcher.close();
+                    this.watched.set(dir, null);
+                });
+            } catch {
+                // inotify 用完了之类的，同上
+                files = null;
+            }
+            this.watched.set(dir, files);
+        }
+        files?.set(path.basename(fileName), fileName);
+    }
+
+    /**
+     * program 里的文件有没有变：请求的文件总要 stat（它的监听事件可能还没到），其他的只看标脏的
+     * 没变的顺手去掉标记
+     */
+    private changed(fileName: string): boolean {
+        this.dirty.add(fileName);
+        let changed = false;
+        for (const file of this.dirty) {
+            const cached = this.sourceFiles.get(file);
+            if (!cached || cached.stamp !== AnalyzerProject.stamp(file)) {
+                changed = true;
+            } else {
+                this.dirty.delete(file);
+            }
+        }
+        return changed;
+    }
+
+    /**
+     * 把文件加进项目，返回更新后的 program（`watch` 时什么都没变就是上一次的 program）
+     */
+    update(filePath: string): ts.Program {
+        const fileName = path.resolve(filePath);
+        if (this.watching && this.builder && this.rootNames.has(fileName) && !this.changed(fileName)) {
+            return this.builder.getProgram();
+        }
+        this.rootNames.add(fileName);
+        this.builder = ts.createEmitAndSemanticDiagnosticsBuilderProgram(
+            [...this.rootNames],
+            this.options,
+            this.host,
+            this.builder ?? (this.buildInfoPath ? ts.readBuilderProgram(this.options, this.host) : undefined)
+        );
+        // 标脏的文件都重新 stat 过了；不在新 program 里的也不用再管
+        this.dirty.clear();
+        return this.builder.getProgram();
+    }
+
+    sourceFile(filePath: string): ts.SourceFile | undefined {
+        return this.builder?.getSourceFile(path.resolve(filePath));
+    }
+
+    checker(): ts.TypeChecker {
+        return this.builder!.getProgram().getTypeChecker();
+    }
+
+    /**
+     * 一个文件的语法 + 语义诊断（BuilderProgram 会记住没变的文件的结果）
+     */
+    diagnostics(sourceFile: ts.SourceFile): AnalyzerDiagnostic[] {
+        this.checked = true;
+        const builder = this.builder!;
+        // 按文件取诊断只看缓存：改过的文件牵连到的文件（import 了它的）要先走一遍受影响的文件才作废，
+        // ignoreSourceFile 一律 true 就是只作废不算
+        while (builder.getSemanticDiagnosticsOfNextAffectedFile(undefined, () => true));
+        return [...builder.getSyntacticDiagnostics(sourceFile), ...builder.getSemanticDiagnostics(sourceFile)].map((diagnostic) => ({
+            code: diagnostic.code,
+            category: ts.DiagnosticCategory[diagnostic.category] as AnalyzerDiagnostic["category"],
+            message: ts.flattenDiagnosticMessageText(diagnostic.messageText, "\n"),
+            start: diagnostic.start,
+            end: diagnostic.start !== undefined ? diagnostic.start + (diagnostic.length ?? 0) : undefined,
+        }));
+    }
+
+    /**
+     * 写出 .tsbuildinfo（先写临时文件再改名，几个 worker 同时写也不会留下半截的）
+     * noEmit 下 `emit` 只写 buildinfo，但会先把所有文件的语义诊断算完
+     */
+    save() {
+        if (!this.builder || !this.checked || !this.buildInfoPath) return;
+        this.builder.emit(undefined, (fileName, text) => {
+            fs.mkdirSync(path.dirname(fileName), { recursive: true });
+            const tmp = `${fileName}.${process.pid}.tmp`;
+            fs.writeFileSync(tmp, text);
+            fs.renameSync(tmp, fileName);
+        });
+    }
+}
+
 export class scriptParser {
-    private readonly compilerOptions: ts.CompilerOptions;
-    private readonly typeChecker: ts.TypeChecker;
+    readonly project: AnalyzerProject;
     private readonly shouldBuildOutline: boolean;
     private readonly skipTypeCheck: boolean;
     private currentSourceFile: ts.SourceFile | null = null;
+    /** 这一次解析做类型检查时才有 */
+    private typeChecker: ts.TypeChecker | null = null;
+    private keepKinds: Set<string> | null = null;
+    private collapseKinds: Set<string> = new Set();
+    private maxDepth = Infinity;
+    /** 这一次解析的节点 id，见 `contentIds` */
+    private nodeIds = new Map<ts.Node, string>();
 
     constructor(
         tsconfigPath: string,
@@ -741,34 +1045,61 @@ export class scriptParser {
             buildOutline?: boolean;
             skipTypeCheck?: boolean;
             experimentalSyntax?: "strict" | "loose";
+            /** .tsbuildinfo 的位置，见 `AnalyzerProject` */
+            buildInfo?: string;
+            /** 常驻进程里用，监听文件变动，见 `AnalyzerProject` */
+            watch?: boolean;
         } = {}
     ) {
-        const { buildOutline = false, skipTypeCheck = true, experimentalSyntax = "strict" } = options;
-        const configFile = ts.readConfigFile(tsconfigPath, ts.sys.readFile);
-        this.compilerOptions = ts.parseJsonConfigFileContent(configFile.config, ts.sys, path.dirname(tsconfigPath)).options;
-        const program = ts.createProgram([], this.compilerOptions);
-        this.typeChecker = program.getTypeChecker();
+        const { buildOutline = false, skipTypeCheck = true, experimentalSyntax = "strict", buildInfo, watch = false } = options;
+        this.project = new AnalyzerProject(tsconfigPath, buildInfo, watch);
         this.shouldBuildOutline = buildOutline;
         this.skipTypeCheck = skipTypeCheck;
     }
 
-    public parse(sourceFile: ts.SourceFile): AnalyzedJSON {
+    get typeCheck(): boolean {
+        return !this.skipTypeCheck;
+    }
+
+    /**
+     * @param sourceFile 要来自 `this.project` 当前的 program（类型检查器是它的）
+     * @param nodeFilter 见 `NodeFilter`，只对这一次解析生效
+     * @param typeCheck 覆盖构造时的 skipTypeCheck，只对这一次解析生效
+     */
+    public parse(sourceFile: ts.SourceFile, nodeFilter: NodeFilter = {}, typeCheck: boolean = this.typeCheck): AnalyzedJSON {
         this.currentSourceFile = sourceFile;
+        this.typeChecker = typeCheck ? this.project.checker() : null;
+        this.keepKinds = nodeFilter.keep ? new Set(nodeFilter.keep) : null;
+        this.collapseKinds = new Set(nodeFilter.collapse ?? []);
+        this.maxDepth = nodeFilter.maxDepth ?? Infinity;
+        this.nodeIds = this.contentIds(sourceFile);
         const idMap: Record<string, any> = {};
         const scopeHierarchy: NestedList<string, string> = [];
         let currentScope: string[] = [];
         const declarations: Declaration[] = [];
+        const relations: AnalyzedJSON["AnalyzedAST"]["relations"] = [];
+        // 外层具名声明的名字，idMap 的 path 就是它们用 "." 连起来（不用每个节点都往上找一遍）
+        const containers: string[] = [];
 
-        const visitor = (node: ts.Node) => {
+        const visitor = (node: ts.Node, depth: number) => {
             const sourceFile = this.currentSourceFile!;
+            // 继承关系不受 nodeFilter 影响
+            if (ts.isClassLike(node) || ts.isInterfaceDeclaration(node)) {
+                relations.push(...this.heritageRelations(node, containers.join(".")));
+            }
+            const action = this.filterAction(node, depth);
+            if (action === "dissolve") {
+                ts.forEachChild(node, (child) => visitor(child, depth));
+                return;
+            }
 
             if (this.isDeclaration(node)) {
                 const declaration = this.processDeclarationNode(node);
                 declarations.push(declaration);
             }
 
-            const id = randomUUID();
-            const nodeInfo = this.extractNodeInfo(node);
+            const id = this.nodeId(node);
+            const nodeInfo = this.extractNodeInfo(node, containers.join("."));
 
             idMap[id] = {
                 ...nodeInfo,
@@ -777,24 +1108,33 @@ export class scriptParser {
                     end: node.getEnd(),
                 },
             };
+            if (this.typeChecker && nodeInfo.name !== undefined) {
+                const typeText = this.typeText(node);
+                if (typeText !== undefined) idMap[id].typeText = typeText;
+            }
 
+            const declared = ts.isIdentifier(node) ? undefined : nodeInfo.name;
+            if (declared !== undefined) containers.push(declared);
             if (ts.isBlock(node) || ts.isFunctionLike(node)) {
                 const prevScope = [...currentScope];
                 currentScope.push(id);
                 scopeHierarchy.push([...currentScope]);
-                ts.forEachChild(node, visitor);
+                if (action === "keep") ts.forEachChild(node, (child) => visitor(child, depth + 1));
                 currentScope = prevScope;
-            } else {
-                ts.forEachChild(node, visitor);
+            } else if (action === "keep") {
+                ts.forEachChild(node, (child) => visitor(child, depth + 1));
             }
+            if (declared !== undefined) containers.pop();
         };
 
-        ts.forEachChild(sourceFile, visitor);
+        ts.forEachChild(sourceFile, (node) => visitor(node, 1));
 
         const analyzedAST = {
             statements: this.collectGlobalStatements(sourceFile),
             ScopTree: scopeHierarchy,
             idMap,
+            ...this.collectModuleLinks(sourceFile),
+            relations,
         };
 
         const compilerMetadata = {
@@ -805,7 +1145,11 @@ export class scriptParser {
             },
         };
 
-        const metadata = this.generateMetadata(sourceFile);
+        const metadata = this.generateMetadata(
+            sourceFile,
+            Object.keys(idMap).length,
+            Object.values(idMap).filter((info) => info.type === "Identifier").length
+        );
 
         this.currentSourceFile = null;
 
@@ -826,11 +1170,16 @@ export class scriptParser {
         // 构建syntaxUnits映射
         const nodeIdMap = new Map<ts.Node, string>();
         ts.forEachChild(sourceFile, (node) => {
-            const id = randomUUID();
+            if (this.filterAction(node, 1) === "dissolve") return;
+            const id = this.nodeId(node);
             nodeIdMap.set(node, id);
             standardAST.syntaxUnits[id] = {
+                // 不能展开 ts.Node 本身：parent 和子节点互相指着，JSON.stringify 会遇到循环引用
                 node: {
-                    ...node,
+                    kind: node.kind,
+                    flags: node.flags,
+                    pos: node.pos,
+                    end: node.end,
                     id,
                 },
                 id,
@@ -844,6 +1193,11 @@ export class scriptParser {
             structureOutline: analyzedAST.ScopTree || [],
         };
 
+        this.keepKinds = null;
+        this.collapseKinds = new Set();
+        this.maxDepth = Infinity;
+        this.nodeIds = new Map();
+
         return {
             AnalyzedAST: fullAnalyzedAST,
             StandardAST: standardAST,
@@ -852,12 +1206,88 @@ export class scriptParser {
         } as AnalyzedJSON;
     }
 
+    /**
+     * 内容寻址的节点 id：同样的代码每次解析都得到同样的 id
+     *
+     * id = hash(结构路径, 子树哈希)，排成 UUID 的样子（core/ast_model.py 按 16 字节存）
+     *   结构路径  从文件开始一层层的 `类型:名字#序号`，序号是同一个父节点下同类型同名字的第几个，
+     *            前面插进别的语句不影响后面节点的路径
+     *   子树哈希  Merkle 式：节点类型、不属于任何子节点的那几段源码（关键字、运算符……）、子节点的子树哈希，
+     *            每个字符只哈希一次，嵌套多深都是线性的
+     * 子树和路径都没变的节点 id 就不变；子树里改了东西，它和它的祖先换新 id
+     * 两遍都用显式栈，不会因为嵌套太深爆栈
+     */
+    private contentIds(sourceFile: ts.SourceFile): Map<ts.Node, string> {
+        const sha1 = (...parts: string[]) => {
+            const digest = createHash("sha1");
+            for (const part of parts) digest.update(part).update("\0");
+            return digest.digest("hex");
+        };
+        const paths = new Map<ts.Node, string>([[sourceFile, ""]]);
+        const children = new Map<ts.Node, ts.Node[]>();
+        // 先序，父节点总在子节点前面
+        const order: ts.Node[] = [];
+        const stack: ts.Node[] = [sourceFile];
+        while (stack.length > 0) {
+            const node = stack.pop()!;
+            order.push(node);
+            const kids: ts.Node[] = [];
+            ts.forEachChild(node, (child) => {
+                kids.push(child);
+            });
+            children.set(node, kids);
+            const seen = new Map<string, number>();
+            for (const child of kids) {
+                const name = ts.isIdentifier(child) ? child.text : this.declarationName(child) ?? "";
+                const step = `${ts.SyntaxKind[child.kind]}:${name}`;
+                const n = (seen.get(step) ?? 0) + 1;
+                seen.set(step, n);
+                paths.set(child, sha1(paths.get(node)!, `${step}#${n}`));
+            }
+            for (let i = kids.length - 1; i >= 0; i--) stack.push(kids[i]);
+        }
+
+        const text = sourceFile.text;
+        const hashes = new Map<ts.Node, string>();
+        const ids = new Map<ts.Node, string>();
+        for (let i = order.length - 1; i >= 0; i--) {
+            const node = order[i];
+            const digest = createHash("sha1").update(ts.SyntaxKind[node.kind]).update("\0");
+            // 子节点的 [pos, end) 带着它自己的前导空白和注释，剩下的是这个节点自己的记号
+            let cursor = node === sourceFile ? 0 : node.getStart(sourceFile);
+            for (const child of children.get(node)!) {
+                digest.update(text.slice(cursor, child.pos)).update("\0").update(hashes.get(child)!);
+                cursor = Math.max(cursor, child.end);
+            }
+            const hash = digest.update(text.slice(cursor, node.end)).digest("hex");
+            hashes.set(node, hash);
+            if (node !== sourceFile) ids.set(node, toUuid(sha1(paths.get(node)!, hash)));
+        }
+        return ids;
+    }
+
+    /**
+     * 节点的 id，见 `contentIds`
+     * 不在 forEachChild 能走到的树里的节点（JSDoc 之类）按位置算一个
+     */
+    private nodeId(node: ts.Node): string {
+        return (
+            this.nodeIds.get(node) ??
+            toUuid(createHash("sha1").update(`${ts.SyntaxKind[node.kind]}@${node.pos}:${node.end}`).digest("hex"))
+        );
+    }
+
     private buildNestedStatements(sourceFile: ts.SourceFile): NestedList<string, string> {
         const result: NestedList<string, string> = [];
         const stack: Array<{ id: string; children: NestedList<string, string> }> = [];
 
-        const visit = (node: ts.Node) => {
-            const id = randomUUID();
+        const visit = (node: ts.Node, depth: number) => {
+            const action = this.filterAction(node, depth);
+            if (action === "dissolve") {
+                ts.forEachChild(node, (child) => visit(child, depth));
+                return;
+            }
+            const id = this.nodeId(node);
             const current: NestedList<string, string> = [id];
 
             // 检查当前节点是否应该开启新作用域
@@ -874,7 +1304,7 @@ export class scriptParser {
             }
 
             // 递归处理子节点
-            ts.forEachChild(node, visit);
+            if (action === "keep") ts.forEachChild(node, (child) => visit(child, depth + 1));
 
             // 结束作用域处理
             if ((ts.isBlock(node) || ts.isFunctionLike(node) || ts.isClassLike(node)) && stack.length > 0) {
@@ -885,7 +1315,7 @@ export class scriptParser {
                 }
             }
         };
-        ts.forEachChild(sourceFile, visit);
+        ts.forEachChild(sourceFile, (node) => visit(node, 1));
         return result;
     }
 
@@ -895,7 +1325,7 @@ export class scriptParser {
         scopeHierarchy: NestedList<string, string>,
         currentScope: string[]
     ) {
-        const id = randomUUID();
+        const id = this.nodeId(node);
         const nodeInfo = this.extractNodeInfo(node);
 
         idMap[id] = {
@@ -915,6 +1345,16 @@ export class scriptParser {
         }
     }
 
+    /**
+     * 按当前的 `NodeFilter` 判断 depth 层（顶层语句是 1）上的节点怎么处理
+     */
+    private filterAction(node: ts.Node, depth: number): FilterAction {
+        const kind = ts.SyntaxKind[node.kind];
+        if (this.keepKinds && !this.keepKinds.has(kind)) return "dissolve";
+        if (this.collapseKinds.has(kind) || depth >= this.maxDepth) return "leaf";
+        return "keep";
+    }
+
     private isDeclaration(node: ts.Node): boolean {
         return (
             ts.isVariableStatement(node) ||
@@ -931,7 +1371,7 @@ export class scriptParser {
     private processDeclarationNode(node: ts.Node): Declaration {
         const sourceFile = this.currentSourceFile!;
         const base: BaseStatement = {
-            id: randomUUID(),
+            id: this.nodeId(node),
             path: this.getNodePath(node),
             location: {
                 start: node.getStart(sourceFile),
@@ -966,7 +1406,7 @@ export class scriptParser {
                 name: this.getNodeText(node.name, sourceFile),
                 parameters: [],
                 returnType: node.type?.getText(sourceFile),
-                returnTypeInferred: node.type?.getText(sourceFile) || "any",
+                returnTypeInferred: node.type?.getText(sourceFile) || this.inferredReturnType(node) || "any",
                 functionBody: [],
                 prototype: { constructor: node.name?.escapedText.toString() || "" },
                 typeModifier: isAsync && isGenerator ? "async-generic" : isAsync ? "async" : isGenerator ? "generic" : undefined,
@@ -976,7 +1416,10 @@ export class scriptParser {
         return base as Declaration;
     }
 
-    private extractNodeInfo(node: ts.Node) {
+    /**
+     * @param path 已知的话直接给（见 `getNodePath`），省得往上找
+     */
+    private extractNodeInfo(node: ts.Node, path: string = this.getNodePath(node)) {
         const sourceFile = this.currentSourceFile!;
         let start = 0;
         let end = 0;
@@ -990,12 +1433,12 @@ export class scriptParser {
         }
 
         return {
-            path: this.getNodePath(node),
-            name: ts.isIdentifier(node) ? node.text : undefined,
+            path,
+            name: ts.isIdentifier(node) ? node.text : this.declarationName(node),
             type: ts.SyntaxKind[node.kind],
             object: {
-                id: randomUUID(),
-                path: this.getNodePath(node),
+                id: this.nodeId(node),
+                path,
                 location: { start, end },
                 statementType: ts.SyntaxKind[node.kind],
             },
@@ -1018,12 +1461,29 @@ export class scriptParser {
             end = node.end;
         }
 
-        return {
-            id: randomUUID(),
+        const statement: BaseStatement = {
+            id: this.nodeId(node),
             path: this.getNodePath(node),
             location: { start, end },
             statementType: ts.SyntaxKind[node.kind],
         };
+        const name = this.getDeclarationName(node);
+        if (name !== undefined) statement.name = name;
+        return statement;
+    }
+
+    /**
+     * 标识符取自身文本，声明取它的名字，其他返回 undefined
+     */
+    private getDeclarationName(node: ts.Node): string | undefined {
+        if (ts.isIdentifier(node) || ts.isPrivateIdentifier(node)) {
+            return node.text;
+        }
+        const name = (node as ts.Node & { name?: ts.Node }).name;
+        if (name && (ts.isIdentifier(name) || ts.isPrivateIdentifier(name) || ts.isStringLiteral(name) || ts.isNumericLiteral(name))) {
+            return name.text;
+        }
+        return undefined;
     }
 
     private getNodeText(node: any, sourceFile: ts.SourceFile): string {
@@ -1071,9 +1531,141 @@ export class scriptParser {
         return "";
     }
 
+    /**
+     * 外层具名声明的名字用 "." 连起来，不含节点自己
+     * 比如类 Foo 的方法 bar 里的变量 x 是 "Foo.bar"，顶层声明是 ""
+     */
     private getNodePath(node: ts.Node): string {
-        // 实现获取节点路径的逻辑
-        return "";
+        const names: string[] = [];
+        for (let current = node.parent; current; current = current.parent) {
+            const name = this.declarationName(current);
+            if (name !== undefined) names.push(name);
+        }
+        return names.reverse().join(".");
+    }
+
+    /**
+     * 声明的名字（类、函数、方法、属性、变量、枚举成员、namespace……），不是具名声明就是 undefined
+     * 参数、匿名函数、解构出来的变量不算
+     */
+    private declarationName(node: ts.Node): string | undefined {
+        if (
+            !(
+                ts.isClassLike(node) ||
+                (ts.isFunctionLike(node) && !ts.isParameter(node)) ||
+                ts.isInterfaceDeclaration(node) ||
+                ts.isTypeAliasDeclaration(node) ||
+                ts.isEnumDeclaration(node) ||
+                ts.isEnumMember(node) ||
+                ts.isModuleDeclaration(node) ||
+                ts.isVariableDeclaration(node) ||
+                ts.isPropertyDeclaration(node) ||
+                ts.isPropertySignature(node)
+            )
+        ) {
+            return undefined;
+        }
+        const name = (node as ts.NamedDeclaration).name;
+        if (
+            name &&
+            (ts.isIdentifier(name) || ts.isPrivateIdentifier(name) || ts.isStringLiteral(name) || ts.isNumericLiteral(name))
+        ) {
+            return name.text;
+        }
+        return undefined;
+    }
+
+    /**
+     * 类、接口的 extends / implements，没有名字的类表达式不算
+     * @param path 外层具名声明的名字（同 `getNodePath`）
+     */
+    private heritageRelations(
+        node: ts.ClassLikeDeclaration | ts.InterfaceDeclaration,
+        path: string
+    ): AnalyzedJSON["AnalyzedAST"]["relations"] {
+        const name = this.declarationName(node);
+        if (name === undefined || !node.heritageClauses) return [];
+        const from = path ? `${path}.${name}` : name;
+        const relations: AnalyzedJSON["AnalyzedAST"]["relations"] = [];
+        for (const clause of node.heritageClauses) {
+            const kind = clause.token === ts.SyntaxKind.ExtendsKeyword ? "extends" : "implements";
+            for (const type of clause.types) {
+                relations.push({ from, kind, to: type.expression.getText(this.currentSourceFile!) });
+            }
+        }
+        return relations;
+    }
+
+    /**
+     * 顶层的 import / export，Python 那边（core/dependency_graph.py）靠它们把文件连成依赖图
+     * 动态 `import()`、`require()` 调用不算
+     */
+    private collectModuleLinks(sourceFile: ts.SourceFile): Pick<AnalyzedJSON["AnalyzedAST"], "imports" | "exports"> {
+        const imports: AnalyzedJSON["AnalyzedAST"]["imports"] = [];
+        const exports: AnalyzedJSON["AnalyzedAST"]["exports"] = [];
+        const specifier = (node?: ts.Expression) => (node && ts.isStringLiteral(node) ? node.text : undefined);
+        const hasModifier = (node: ts.Node, kind: ts.SyntaxKind) =>
+            ts.canHaveModifiers(node) && (ts.getModifiers(node) ?? []).some((m) => m.kind === kind);
+        // `a as b` 里 name 是 b，propertyName 是 a
+        const names = (element: ts.ImportSpecifier | ts.ExportSpecifier) => ({
+            name: (element.propertyName ?? element.name).text,
+            alias: element.propertyName ? element.name.text : undefined,
+        });
+
+        for (const statement of sourceFile.statements) {
+            if (ts.isImportDeclaration(statement)) {
+                const module = specifier(statement.moduleSpecifier)!;
+                const clause = statement.importClause;
+                if (!clause) {
+                    imports.push({ id: this.nodeId(statement), name: "", module });
+                    continue;
+                }
+                const typeOnly = clause.isTypeOnly || undefined;
+                if (clause.name) {
+                    imports.push({ id: this.nodeId(clause.name), name: "default", alias: clause.name.text, module, typeOnly });
+                }
+                const bindings = clause.namedBindings;
+                if (bindings && ts.isNamespaceImport(bindings)) {
+                    imports.push({ id: this.nodeId(bindings), name: "*", alias: bindings.name.text, module, typeOnly });
+                } else if (bindings) {
+                    for (const element of bindings.elements) {
+                        imports.push({ id: this.nodeId(element), ...names(element), module, typeOnly: typeOnly || element.isTypeOnly || undefined });
+                    }
+                }
+            } else if (ts.isImportEqualsDeclaration(statement)) {
+                const reference = statement.moduleReference;
+                const module = ts.isExternalModuleReference(reference) ? specifier(reference.expression) : undefined;
+                if (module !== undefined) {
+                    imports.push({ id: this.nodeId(statement), name: "*", alias: statement.name.text, module });
+                }
+            } else if (ts.isExportDeclaration(statement)) {
+                const module = specifier(statement.moduleSpecifier);
+                const clause = statement.exportClause;
+                if (!clause) {
+                    exports.push({ id: this.nodeId(statement), name: "*", module });
+                } else if (ts.isNamespaceExport(clause)) {
+                    exports.push({ id: this.nodeId(clause), name: "*", alias: clause.name.text, module });
+                } else {
+                    for (const element of clause.elements) {
+                        exports.push({ id: this.nodeId(element), ...names(element), module });
+                    }
+                }
+            } else if (ts.isExportAssignment(statement)) {
+                // export default x / export = x
+                const expression = statement.expression;
+                exports.push({ id: this.nodeId(statement), name: ts.isIdentifier(expression) ? expression.text : "", alias: "default" });
+            } else if (hasModifier(statement, ts.SyntaxKind.ExportKeyword)) {
+                const isDefault = hasModifier(statement, ts.SyntaxKind.DefaultKeyword);
+                const declared: ts.Node[] = ts.isVariableStatement(statement) ? [...statement.declarationList.declarations] : [statement];
+                for (const declaration of declared) {
+                    const name = this.declarationName(declaration);
+                    // 解构出来的变量没有名字，匿名的默认导出记成 ""
+                    if (name === undefined && !isDefault) continue;
+                    exports.push({ id: this.nodeId(declaration), name: name ?? "", alias: isDefault ? "default" : undefined });
+                }
+            }
+        }
+        return { imports, exports };
     }
 
     private isGlobalStatement(node: ts.Node): boolean {
@@ -1098,9 +1690,12 @@ export class scriptParser {
             (context) => {
                 const visit = (node: ts.Node): ts.Node => {
                     if (this.isGlobalStatement(node)) {
-                        const baseStatement = this.createBaseStatement(node);
-                        this.processChildren(node, baseStatement);
-                        statements.push(baseStatement);
+                        const action = this.filterAction(node, 1);
+                        if (action !== "dissolve") {
+                            const baseStatement = this.createBaseStatement(node);
+                            if (action === "keep") this.processChildren(node, baseStatement, 1);
+                            statements.push(baseStatement);
+                        }
                     }
                     return ts.visitEachChild(node, visit, context);
                 };
@@ -1112,32 +1707,63 @@ export class scriptParser {
         return statements;
     }
 
-    private processChildren(node: ts.Node, parentStatement: BaseStatement) {
+    /**
+     * @param depth parentStatement 所在的层
+     */
+    private processChildren(node: ts.Node, parentStatement: BaseStatement, depth: number) {
         ts.forEachChild(node, (child) => {
+            const action = this.filterAction(child, depth + 1);
+            if (action === "dissolve") {
+                // 自己不输出，子节点直接挂到 parentStatement 上
+                this.processChildren(child, parentStatement, depth);
+                return;
+            }
             const childStatement = this.createBaseStatement(child);
             if (!parentStatement.children) {
                 parentStatement.children = [];
             }
             parentStatement.children.push(childStatement);
-            this.processChildren(child, childStatement);
+            if (action === "keep") this.processChildren(child, childStatement, depth + 1);
         });
     }
 
-    private generateMetadata(sourceFile: ts.SourceFile) {
+    /**
+     * 类型检查器眼里的类型，声明取它的名字，标识符取它自己
+     */
+    private typeText(node: ts.Node): string | undefined {
+        const target = ts.isIdentifier(node) ? node : (node as ts.NamedDeclaration).name;
+        if (!target || !this.typeChecker) return undefined;
+        try {
+            return this.typeChecker.typeToString(this.typeChecker.getTypeAtLocation(target));
+        } catch {
+            return undefined;
+        }
+    }
+
+    /**
+     * 没写返回类型的函数，让类型检查器推一个（不做类型检查时返回 undefined）
+     */
+    private inferredReturnType(node: ts.FunctionDeclaration): string | undefined {
+        const signature = this.typeChecker?.getSignatureFromDeclaration(node);
+        if (!signature) return undefined;
+        return this.typeChecker!.typeToString(this.typeChecker!.getReturnTypeOfSignature(signature));
+    }
+
+    private generateMetadata(sourceFile: ts.SourceFile, nodeCount: number, identifierCount: number) {
         return {
             parseInfo: {
                 parserVersion: parser_version,
                 parserPath: __filename,
                 timeCost: 0,
                 memoryUsage: 0,
-                nodeCount: 0,
-                identifierCount: 0,
+                nodeCount,
+                identifierCount,
             },
             sourceInfo: {
                 targetPath: sourceFile.fileName,
                 fileSize: sourceFile.getFullText().length,
                 loc: { total: 0, code: 0, comment: 0 },
-                hash: "",
+                hash: createHash("sha256").update(sourceFile.getFullText()).digest("hex"),
                 lineEndings: "LF" as const,
             },
             output_logs: "",
@@ -1149,47 +1775,263 @@ export class scriptParser {
         options: ts.CompilerOptions;
         compilerVersion: string;
     } {
-        // 返回当前使用的tsconfig简化信息
+        // 返回当前使用的tsconfig简化信息（没找到 tsconfig 时 fileName 为空）
         return {
-            fileName: "tsconfig.json",
-            options: this.compilerOptions,
+            fileName: this.project.configPath ?? "",
+            options: this.project.options,
             compilerVersion: ts.version,
         };
     }
 }
 
+/**
+ * 紧凑二进制格式（`--format compact`），给 core/compact_format.py 读
+ * 只带绘图要用的 AnalyzedAST.statements 树，外加 Metadata、compilerMetadata
+ * 和依赖图要用的 AnalyzedAST.imports / exports / relations（后三个是后来加的，旧的读取端不认识也没关系）
+ *
+ * 全部小端：
+ *   "CFAB" | u16 格式版本
+ *   u32 字符串个数 | 每个：u32 字节数 + utf-8
+ *   u32 节点个数   | 每个：u16 记录长度 + u32 父节点序号 + u32 statementType + u32 name + u32 start + u32 end
+ *   u32 字节数 + utf-8 JSON {Metadata, compilerMetadata, imports, exports, relations}
+ *
+ * 节点按先序排列，序号就是整数 id；顶层节点和没有 name 的字段记 0xFFFFFFFF
+ * 记录长度在前，以后加字段旧的读取端也能跳过
+ */
+const COMPACT_MAGIC = "CFAB";
+const COMPACT_VERSION = 1;
+const COMPACT_NONE = 0xffffffff;
+const COMPACT_RECORD_LENGTH = 20;
+
+function encodeCompact(result: AnalyzedJSON): Buffer {
+    const strings: Buffer[] = [];
+    const stringIndex = new Map<string, number>();
+    const intern = (value?: string) => {
+        if (value === undefined) return COMPACT_NONE;
+        let index = stringIndex.get(value);
+        if (index === undefined) {
+            index = strings.length;
+            strings.push(Buffer.from(value, "utf8"));
+            stringIndex.set(value, index);
+        }
+        return index;
+    };
+
+    // 先序展开，用显式栈，深层嵌套也不会爆栈
+    const records: number[] = [];
+    const stack: Array<[BaseStatement, number]> = [];
+    for (let i = result.AnalyzedAST.statements.length - 1; i >= 0; i--) {
+        stack.push([result.AnalyzedAST.statements[i], COMPACT_NONE]);
+    }
+    while (stack.length) {
+        const [statement, parent] = stack.pop()!;
+        const index = records.length / 5;
+        records.push(parent, intern(statement.statementType), intern(statement.name), statement.location.start, statement.location.end);
+        const children = statement.children ?? [];
+        for (let i = children.length - 1; i >= 0; i--) {
+            stack.push([children[i], index]);
+        }
+    }
+
+    const { imports, exports, relations } = result.AnalyzedAST;
+    const meta = Buffer.from(
+        JSON.stringify({ Metadata: result.Metadata, compilerMetadata: result.compilerMetadata, imports, exports, relations }),
+        "utf8"
+    );
+    const nodeCount = records.length / 5;
+    const size =
+        4 + 2 + 4 + strings.reduce((sum, s) => sum + 4 + s.length, 0) + 4 + nodeCount * (2 + COMPACT_RECORD_LENGTH) + 4 + meta.length;
+
+    const buffer = Buffer.alloc(size);
+    let offset = buffer.write(COMPACT_MAGIC, 0, "ascii");
+    offset = buffer.writeUInt16LE(COMPACT_VERSION, offset);
+    offset = buffer.writeUInt32LE(strings.length, offset);
+    for (const s of strings) {
+        offset = buffer.writeUInt32LE(s.length, offset);
+        offset += s.copy(buffer, offset);
+    }
+    offset = buffer.writeUInt32LE(nodeCount, offset);
+    for (let i = 0; i < records.length; i += 5) {
+        offset = buffer.writeUInt16LE(COMPACT_RECORD_LENGTH, offset);
+        for (let j = 0; j < 5; j++) {
+            offset = buffer.writeUInt32LE(records[i + j], offset);
+        }
+    }
+    offset = buffer.writeUInt32LE(meta.length, offset);
+    meta.copy(buffer, offset);
+    return buffer;
+}
+
+type OutputFormat = "json" | "compact";
+
+/**
+ * 按格式写出解析结果，json 默认缩进方便调试
+ */
+function encodeResult(result: AnalyzedJSON, format: OutputFormat, pretty: boolean): Buffer {
+    if (format === "compact") return encodeCompact(result);
+    return Buffer.from(pretty ? JSON.stringify(result, null, 2) : JSON.stringify(result));
+}
+
+/**
+ * @param out 文件路径；"-" 是写到 stdout（Python 那边从管道直接读，不落盘）
+ */
+function writeResult(result: AnalyzedJSON, out: string, format: OutputFormat, pretty: boolean) {
+    if (out === "-") {
+        process.stdout.write(encodeResult(result, format, false));
+    } else {
+        fs.writeFileSync(out, encodeResult(result, format, pretty));
+    }
+}
+
+/**
+ * 解析单个文件，cli 和 worker 共用
+ * program 在 `parser.project` 里跨请求复用，这里只把文件加进去、增量更新
+ * @param typeCheck 不给就按构造 parser 时的 skipTypeCheck
+ */
+function analyzeFile(parser: scriptParser, filePath: string, nodeFilter?: NodeFilter, typeCheck?: boolean): AnalyzedJSON {
+    const phases: AnalyzerPhase[] = [];
+    measurePerformance("program", () => parser.project.update(filePath), phases);
+    const sourceFile = parser.project.sourceFile(filePath);
+
+    if (!sourceFile) {
+        throw new Error(`无法解析文件: ${filePath}`);
+    }
+
+    const result = measurePerformance("parse", () => parser.parse(sourceFile, nodeFilter, typeCheck), phases);
+    if (typeCheck ?? parser.typeCheck) {
+        result.Metadata.diagnostics = measurePerformance("diagnostics", () => parser.project.diagnostics(sourceFile), phases);
+    }
+    const parseInfo = result.Metadata.parseInfo;
+    parseInfo.phases = phases;
+    parseInfo.timeCost = phases.reduce((sum, phase) => sum + phase.wall, 0);
+    // 进程到目前为止的 RSS 峰值（maxRSS 单位是 KB）
+    parseInfo.memoryUsage = process.resourceUsage().maxRSS * 1024;
+    return result;
+}
+
+/**
+ * 常驻 worker 模式，由 core/parserSwitch.py 启动一次后反复使用
+ * 协议：stdin/stdout 上一行一个 JSON
+ *
+ * 请求 `{"id": number, "file": string, "out"?: string, "payload"?: boolean, "format"?: "json" | "compact", "filter"?: NodeFilter, "typeCheck"?: boolean}`
+ * 响应 `{"id": number, "ok": true, "result"?: AnalyzedJSON, "out"?: string, "bytes"?: number}`
+ *     或 `{"id": number, "ok": false, "error": string}`
+ *
+ * 给了 `payload` 就在响应行后面紧跟着 `bytes` 个字节的输出（json 或 compact），不落盘；
+ * 给了 `out` 就把结果写进文件，只回一个路径；都没给就把结果整个放在响应行里（只能是 json）
+ * 所有请求共用 `parser.project` 里的一个 program；stdin 关闭时存一次 .tsbuildinfo
+ */
+function worker(parser: scriptParser) {
+    // stdout 只留给协议，日志全部改走 stderr
+    console.log = (...data: any[]) => console.error(...data);
+    console.clear = () => {};
+
+    const rl = require("readline").createInterface({ input: process.stdin, terminal: false });
+    rl.on("line", (line: string) => {
+        if (!line.trim()) return;
+        let request: {
+            id?: number;
+            file?: string;
+            out?: string;
+            payload?: boolean;
+            format?: OutputFormat;
+            filter?: NodeFilter;
+            typeCheck?: boolean;
+        } = {};
+        let response: Record<string, unknown>;
+        let payload: Buffer | undefined;
+        try {
+            request = JSON.parse(line);
+            const result = analyzeFile(parser, request.file!, request.filter, request.typeCheck);
+            if (request.payload) {
+                payload = encodeResult(result, request.format ?? "json", false);
+                response = { id: request.id, ok: true, bytes: payload.length };
+            } else if (request.out) {
+                writeResult(result, request.out, request.format ?? "json", false);
+                response = { id: request.id, ok: true, out: request.out };
+            } else {
+                response = { id: request.id, ok: true, result };
+            }
+        } catch (e) {
+            response = { id: request.id, ok: false, error: e instanceof Error ? e.stack ?? e.message : String(e) };
+        }
+        process.stdout.write(JSON.stringify(response) + "\n");
+        if (payload) process.stdout.write(payload);
+    });
+    rl.on("close", () => {
+        saveBuildInfo(parser);
+        process.exit(0);
+    });
+}
+
+/**
+ * 存 .tsbuildinfo，失败只记一笔（不影响已经给出去的结果）
+ */
+function saveBuildInfo(parser: scriptParser) {
+    try {
+        parser.project.save();
+    } catch (e) {
+        console.error(`保存 tsbuildinfo 失败: ${e instanceof Error ? e.message : e}`);
+    }
+}
+
 function cli() {
     const args = require("minimist")(process.argv.slice(2));
     const filePath = args._[0];
+    // "-" 是写到 stdout，见 `writeResult`
     const outDir = args._[1] ?? "tmp/analyzed.json";
+    if (outDir === "-") {
+        // stdout 只留给结果，日志全部改走 stderr
+        console.log = (...data: any[]) => console.error(...data);
+        console.clear = () => {};
+    }
     const buildOutline = args["build-outline"] || false;
     const skipTypeCheck = args["skip-type-check"] !== false;
     const experimentalSyntax = args["experimental-syntax"] || "strict";
-
-    if (!filePath) {
-        console.error("请提供要解析的文件路径");
-        process.exit(1);
-    }
+    // --build-info PATH；不给的话 tsconfig 开了 incremental 就用它的，做类型检查时默认 tmp/analyzer.tsbuildinfo
+    const buildInfo: string | undefined = args["build-info"] || (skipTypeCheck ? undefined : "tmp/analyzer.tsbuildinfo");
+    const format: OutputFormat = args["format"] === "compact" ? "compact" : "json";
+    // --keep A,B --collapse C --max-depth N，见 NodeFilter
+    const kinds = (value: unknown) => (value ? String(value).split(",").filter(Boolean) : undefined);
+    const nodeFilter: NodeFilter = {
+        keep: kinds(args["keep"]),
+        collapse: kinds(args["collapse"]),
+        maxDepth: args["max-depth"] !== undefined ? Number(args["max-depth"]) : undefined,
+    };
 
     const parser = new scriptParser("tsconfig.json", {
         buildOutline,
         skipTypeCheck,
         experimentalSyntax,
+        buildInfo,
+        watch: Boolean(args.worker),
     });
-    const program = ts.createProgram([filePath], {});
-    const sourceFile = program.getSourceFile(filePath);
 
-    if (!sourceFile) {
-        console.error(`无法解析文件: ${filePath}`);
+    if (args.worker) {
+        worker(parser);
+        return;
+    }
+
+    if (!filePath) {
+        console.error("请提供要解析的文件路径");
         process.exit(1);
     }
 
-    const result = measurePerformance("parsing took:", () => parser.parse(sourceFile));
-    console.clear();
-    console.log(result);
+    let result: AnalyzedJSON;
+    try {
+        result = analyzeFile(parser, filePath, nodeFilter);
+    } catch (e) {
+        console.error(e instanceof Error ? e.message : e);
+        process.exit(1);
+    }
+    saveBuildInfo(parser);
+    if (outDir !== "-") {
+        console.clear();
+        console.log(result);
+    }
 
-    fs.writeFileSync(outDir, JSON.stringify(result, null, 2));
-    console.log(`分析结果已保存到 ${outDir}`);
+    writeResult(result, outDir, format, true);
+    if (outDir !== "-") console.log(`分析结果已保存到 ${outDir}`);
 }
 
 if (require.main === module) cli();